@@ -0,0 +1,126 @@
+"""
+CPU, allocations and decompressions per captured margin response, by Content-Encoding
+
+    python benchmarks/bench_capture.py [--flows 40] [--rows 2000] [--padding-kb 256] [--store-raw]
+
+Unfiltered margin flows with a big RSK335 page, compressed like eclear
+would send it, go through the addon's request and response hooks (a copy
+loaded from a temp dir, see benchmarks/flow_replay.py), then through a tap
+that reads the body again like mcx_supervisor.py's CaptureTap. Every page
+differs, so the capture ring stores each one. `--store-raw` sets
+[CAPTURE] STORE_RAW. Needs mitmproxy.
+"""
+import os
+import sys
+import gzip
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import brotli
+import zstandard
+from mitmproxy.net import encoding
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCH_DIR, '..')))
+
+from benchmarks.flow_replay import FlowFactory, load_addon
+from benchmarks.harness import summarize
+
+ENCODINGS = ("identity", "gzip", "br", "zstd")
+COMPRESS = {
+    "gzip": lambda data: gzip.compress(data, 6),
+    "br": lambda data: brotli.compress(data, quality=5),
+    "zstd": lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+}
+
+decompressions = 0
+
+
+def count_decompressions():
+    """Wrap mitmproxy's decoders, so every real decompression (not a cache hit) is counted"""
+    def counted(fn):
+        def wrapper(data):
+            global decompressions
+            decompressions += 1
+            return fn(data)
+        return wrapper
+
+    for name in ("gzip", "deflate", "br", "zstd"):
+        encoding.custom_decode[name] = counted(encoding.custom_decode[name])
+
+
+def tap(flow):
+    try:
+        from proxy.flow_body import decoded_body
+    except ImportError:
+        return flow.response.get_content(strict=False)
+    return decoded_body(flow.response)
+
+
+def run(enc: str, flows: int, rows: int, padding_kb: int, store_raw: bool) -> dict:
+    global decompressions
+    extra = f"\n[CAPTURE]\nSTORE_RAW = {str(store_raw).lower()}\n"
+    with tempfile.TemporaryDirectory(prefix="mcx-capture-") as workdir:
+        module, addon = load_addon(workdir, extra_config=extra)
+        factory = FlowFactory(rows=rows, padding_kb=padding_kb)
+        batch = [factory.make("margin_unfiltered") for _ in range(2 * flows)]
+        for flow in batch:
+            if enc != "identity":
+                # roughly what a web server uses on the fly, brotli's default level takes seconds per page
+                flow.response.raw_content = COMPRESS[enc](flow.response.raw_content)
+                flow.response.headers["Content-Encoding"] = enc
+        page_kb = len(batch[0].response.get_content()) / 1024
+        wire_kb = len(batch[0].response.raw_content) / 1024
+
+        cpu, peaks = [], []
+        decompressions = 0
+        # timed without tracemalloc, which slows every allocation down
+        for flow in batch[:flows]:
+            t0 = time.process_time()
+            addon.request(flow)
+            addon.response(flow)
+            tap(flow)
+            cpu.append(time.process_time() - t0)
+        decodes = decompressions
+        for flow in batch[flows:]:
+            tracemalloc.start()
+            addon.request(flow)
+            addon.response(flow)
+            tap(flow)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        addon.done()
+
+        objects = os.path.join(workdir, "calls", "captures", "objects")
+        stored = sum(os.path.getsize(os.path.join(objects, name)) for name in os.listdir(objects))
+        return {
+            "page_kb": round(page_kb, 1),
+            "wire_kb": round(wire_kb, 1),
+            "cpu": summarize(cpu),
+            "peak_alloc_kb": round(sorted(peaks)[len(peaks) // 2] / 1024, 1),
+            "decompressions_per_flow": round(decodes / flows, 2),
+            "stored_kb_per_flow": round(stored / 1024 / len(batch), 1),
+        }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--flows", type=int, default=40)
+    ap.add_argument("--rows", type=int, default=2000, help="data rows in the margin responses")
+    ap.add_argument("--padding-kb", type=int, default=256, help="markup before RSK335_Table")
+    ap.add_argument("--store-raw", action="store_true", help="[CAPTURE] STORE_RAW = true")
+    args = ap.parse_args()
+
+    count_decompressions()
+    print(f"{'encoding':<10}{'page KB':>9}{'wire KB':>9}{'cpu p50 ms':>12}{'peak alloc KB':>15}"
+          f"{'decodes':>9}{'stored KB':>11}")
+    for enc in ENCODINGS:
+        r = run(enc, args.flows, args.rows, args.padding_kb, args.store_raw)
+        print(f"{enc:<10}{r['page_kb']:>9}{r['wire_kb']:>9}{r['cpu']['p50_ms']:>12.2f}{r['peak_alloc_kb']:>15}"
+              f"{r['decompressions_per_flow']:>9}{r['stored_kb_per_flow']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Throughput of margin fetches against the local RSK335 mock
+
+    python benchmarks/bench_fetcher.py [--requests 100] [--latency 0.05] [--rows 500]
+
+Compares sequential make_mcx_margin_request calls with MarginFetcher at a
+few concurrency limits, polling several sessions x filter combinations.
+"""
+import os
+import sys
+import time
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.normpath(os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.mock_rsk335 import MockRSK335
+from client.margin_fetcher import MarginFetcher
+from client.mcx_client import make_mcx_margin_request, margin_filter
+
+SESSIONS = [
+    {"AlteonP": f"A{i}", "JSESSIONID": f"J{i}", "TS01d67e35": "t1", "TS254a1510027": "t2",
+     "IXHRts": "1759482906778", "rndaak": f"rnd{i}"}
+    for i in range(3)
+]
+FILTERS = [None, margin_filter(bpid="CL000001"), margin_filter(tm="TM0001"), margin_filter(cm="CM0001")]
+
+
+def jobs(count: int):
+    combos = [(creds, f) for creds in SESSIONS for f in FILTERS]
+    return [combos[i % len(combos)] for i in range(count)]
+
+
+def report(label: str, server: MockRSK335, count: int, elapsed: float):
+    print(f"{label:<28}{count / elapsed:>10.1f}{elapsed / count * 1e3:>12.2f}{server.connections:>13}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=100)
+    ap.add_argument("--latency", type=float, default=0.05, help="mock server think time per request")
+    ap.add_argument("--rows", type=int, default=1)
+    args = ap.parse_args()
+
+    work = jobs(args.requests)
+    print(f"{'client':<28}{'req/s':>10}{'ms / req':>12}{'connections':>13}")
+
+    server = MockRSK335(rows=args.rows, latency=args.latency).start()
+    try:
+        start = time.perf_counter()
+        for creds, _ in work:
+            make_mcx_margin_request(creds, url=server.url).content
+        report("make_mcx_margin_request", server, len(work), time.perf_counter() - start)
+    finally:
+        server.stop()
+
+    for workers in (1, 4, 8):
+        server = MockRSK335(rows=args.rows, latency=args.latency).start()
+        fetcher = MarginFetcher(url=server.url, max_workers=workers, rate_per_host=1000, burst=workers)
+        try:
+            start = time.perf_counter()
+            results = fetcher.fetch_all(work)
+            elapsed = time.perf_counter() - start
+            errors = [r for r in results if isinstance(r, Exception)]
+            report(f"MarginFetcher x{workers}", server, len(work), elapsed)
+            if errors:
+                print(f"  {len(errors)} errors, first: {errors[0]}")
+        finally:
+            fetcher.close()
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
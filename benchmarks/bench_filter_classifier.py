@@ -0,0 +1,133 @@
+"""
+_is_unfiltered: legacy parse_qs check vs FilterClassifier, equivalence and per-flow cost
+
+    python benchmarks/bench_filter_classifier.py [--bodies curr_request.txt prev_request.txt ...]
+
+Every body of the corpus (synthetic variants plus any captured bodies) must
+get the same verdict from both; the script exits non-zero otherwise.
+"""
+import os
+import sys
+import time
+import argparse
+import contextlib
+import io
+from urllib.parse import parse_qs
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCH_DIR, '..')))
+
+from benchmarks.samples import make_request_body
+from proxy.filter_classifier import FilterClassifier
+
+EMPTY_CHECK_FIELDS = [
+    "MCB_SearchWC_wca_bpid",
+    "MCB_SearchWC_wca_associatedtm",
+    "MCB_SearchWC_wca_actype",
+    "MCB_SearchWC_wca_associatedcm",
+    "MCB_SearchWC_wca_category",
+]
+DFLT_CHECK_FIELDS = [
+    "propertyMap(MCB_SearchWC_wca_bpid_Cmb)",
+    "propertyMap(MCB_SearchWC_wca_associatedtm_Cmb)",
+    "propertyMap(MCB_SearchWC_wca_associatedcm_Cmb)",
+    "MCB_SearchWC_wca_CMName",
+    "MCB_SearchWC_wca_TMName",
+]
+DEFAULT_SQUERY = "Client Code  Equals  DFLT AND TM / CP  Equals  DFLT AND CM  Equals  DFLT"
+
+
+def legacy_is_unfiltered(content: bytes) -> bool:
+    # StatefulCredentialsProxy._is_unfiltered before FilterClassifier, minus its prints
+    if not content:
+        return False
+    try:
+        form_dict_of_lists = parse_qs(content.decode('utf-8'))
+    except Exception:
+        return False
+    params = {k: v[0] for k, v in form_dict_of_lists.items()}
+
+    is_unfiltered = True
+    for field in EMPTY_CHECK_FIELDS:
+        if params.get(field, "") != "":
+            is_unfiltered = False
+            break
+    for field in DFLT_CHECK_FIELDS:
+        if params.get(field, "") != "DFLT":
+            is_unfiltered = False
+            break
+    if "sQuery" in params and params["sQuery"] != DEFAULT_SQUERY:
+        is_unfiltered = False
+    return is_unfiltered
+
+
+def synthetic_corpus() -> list:
+    base = make_request_body()
+    corpus = [base]
+    # browsers send parentheses percent-encoded
+    corpus.append(base.replace(b"(", b"%28").replace(b")", b"%29"))
+    for field in EMPTY_CHECK_FIELDS:
+        corpus.append(base.replace(f"&{field}=&".encode(), f"&{field}=X1&".encode(), 1))
+    for field in DFLT_CHECK_FIELDS:
+        raw = field.encode()
+        corpus.append(base.replace(raw + b"=DFLT", raw + b"=EQ", 1))
+        corpus.append(base.replace(raw + b"=DFLT", raw + b"=", 1))
+        corpus.append(base.replace(raw + b"=DFLT", b"", 1))
+    corpus += [
+        base.replace(b"sQuery=Client+Code", b"sQuery=Client+Code+", 1),
+        base.replace(b"sQuery=Client+Code", b"sQuery=", 1),
+        base + b"&MCB_SearchWC_wca_bpid=&MCB_SearchWC_wca_bpid=C9",
+        b"MCB_SearchWC_wca_CMName=DFLT&" + base + b"&MCB_SearchWC_wca_CMName=EQ",
+        base + b"&MCB_SearchWC_wca_CMName",
+        base + b"&junk=%ff%fe",
+        base + b"&junk=\xff\xfe",
+        base.replace(b"DFLT", b"D%46LT"),
+        b"",
+        b"&&&",
+    ]
+    return corpus
+
+
+def best_per_call(fn, bodies, repeat: int = 5, rounds: int = 200) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for body in bodies:
+                fn(body)
+        best = min(best, (time.perf_counter() - start) / (rounds * len(bodies)))
+    return best * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bodies", nargs="*", default=[], help="captured request bodies to add to the corpus")
+    args = ap.parse_args()
+
+    corpus = synthetic_corpus()
+    for path in args.bodies:
+        with open(path, "rb") as f:
+            corpus.append(f.read())
+
+    classifier = FilterClassifier(EMPTY_CHECK_FIELDS, DFLT_CHECK_FIELDS, DEFAULT_SQUERY)
+    mismatches = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        verdicts = [(legacy_is_unfiltered(b), classifier.classify(b)) for b in corpus]
+    for body, (old, new) in zip(corpus, verdicts):
+        if old != new:
+            mismatches += 1
+            print(f"MISMATCH legacy={old} new={new}: {body[:120]!r}")
+    print(f"{len(corpus)} bodies, {sum(old for old, _ in verdicts)} unfiltered, {mismatches} mismatches")
+
+    bodies = [make_request_body(ixhrts=str(1759482906778 + i)) for i in range(64)]
+    uncached = FilterClassifier(EMPTY_CHECK_FIELDS, DFLT_CHECK_FIELDS, DEFAULT_SQUERY, cache_size=0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        print(f"{'legacy parse_qs':<28}{best_per_call(legacy_is_unfiltered, bodies):>8.2f} us / flow", file=sys.__stdout__)
+        print(f"{'classifier, cache miss':<28}{best_per_call(uncached.classify, bodies):>8.2f} us / flow", file=sys.__stdout__)
+        print(f"{'classifier, cache hit':<28}{best_per_call(classifier.classify, bodies[:1]):>8.2f} us / flow", file=sys.__stdout__)
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Per-flow cost of deciding target/margin: legacy pretty_url checks vs FlowClassifier
+
+    python benchmarks/bench_flow_classifier.py
+
+The legacy side does what one request + response hook pair used to do:
+_is_target twice, plus the pretty_url == MARGIN_URL checks of the helpers
+for margin flows. Both sides must agree on every flow. Needs mitmproxy.
+"""
+import os
+import sys
+import time
+
+from mitmproxy import http
+from mitmproxy.test import tflow
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCH_DIR, '..')))
+
+from proxy.flow_classifier import MARGIN, METADATA_KEY, NOT_TARGET, TARGET, FlowClassifier
+
+TARGET_HOST = "eclear.mcxccl.com"
+MONITORED_URL = "https://eclear.mcxccl.com/Bancs/"
+MARGIN_URL = "https://eclear.mcxccl.com/Bancs/RSK/RSK335.do"
+
+URLS = {
+    "other host": "https://www.example.com/static/js/app.bundle.js?v=20261017",
+    "target page": "https://eclear.mcxccl.com/Bancs/RSK/menu.do?app=bancsapp&page=/RSK335.do",
+    "margin call": MARGIN_URL,
+}
+
+
+def legacy(flow) -> int:
+    def is_target():
+        if flow.request.host != TARGET_HOST:
+            return False
+        return flow.request.pretty_url.startswith(MONITORED_URL)
+
+    verdict = NOT_TARGET
+    for hook in ("request", "response"):
+        if not is_target():
+            return NOT_TARGET
+        verdict = TARGET
+        # _is_unfiltered/_rewrite/_record/request hook on the request side, _record on the response side
+        for _ in range(4 if hook == "request" else 1):
+            if flow.request.pretty_url == MARGIN_URL:
+                verdict = MARGIN
+    return verdict
+
+
+def make_flows(url: str, count: int) -> list:
+    return [tflow.tflow(req=http.Request.make("GET", url)) for _ in range(count)]
+
+
+def bench(fn, url: str, number: int = 5000, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        flows = make_flows(url, number)
+        start = time.perf_counter()
+        for flow in flows:
+            fn(flow)
+        best = min(best, (time.perf_counter() - start) / number)
+    return best * 1e6
+
+
+def main():
+    classifier = FlowClassifier([MONITORED_URL], MARGIN_URL, hosts=[TARGET_HOST])
+
+    def new(flow) -> int:
+        # same call pattern as the hooks: the first call classifies, the rest hit flow.metadata
+        verdict = NOT_TARGET
+        for hook in ("request", "response"):
+            verdict = classifier.classify(flow)
+            if verdict == NOT_TARGET:
+                return verdict
+            for _ in range(4 if hook == "request" else 1):
+                classifier.classify(flow)
+        return verdict
+
+    for label, url in URLS.items():
+        flow = make_flows(url, 1)[0]
+        assert legacy(flow) == new(flow), f"verdicts differ for {url}"
+        assert flow.metadata[METADATA_KEY] in (NOT_TARGET, TARGET, MARGIN)
+
+    print(f"{'flow':<14}{'legacy us':>11}{'new us':>10}")
+    for label, url in URLS.items():
+        print(f"{label:<14}{bench(legacy, url):>11.2f}{bench(new, url):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
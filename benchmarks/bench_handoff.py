@@ -0,0 +1,128 @@
+"""
+Torn, duplicate and missed parses between the proxy's recorder and the watching parser
+
+    python benchmarks/bench_handoff.py [--captures 300] [--period-ms 20] [--rows 2000] [--padding-kb 256]
+
+A writer process rewrites curr_response.txt in a temp dir every `period`,
+with a big RSK335 page that ends in a capture marker, like the addon's
+_record: "inplace" truncates and writes the file (the old recorder),
+"handoff" uses replace_file and publishes on the handoff file
+(proxy/capture_handoff.py). The parser side is parser/capture_watcher.py
+in the matching mode, parsing with parser/rsk335_stream.py.
+
+A parse is torn when the bytes it got are not one whole capture, a
+duplicate when a capture already handled is parsed again; missed captures
+were overwritten before the parser got to them, which is fine as long as
+the latest one is parsed. Latency runs from the write to the parsed table.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCH_DIR, '..')))
+
+from benchmarks.harness import measure, summarize
+from benchmarks.samples import make_rsk335_page
+from parser.capture_watcher import CaptureWatcher
+from parser.rsk335_stream import extract_margin_table
+from proxy.capture_handoff import CaptureHandoffWriter, replace_file
+
+MODES = ("inplace", "handoff")
+MARKER = re.compile(rb"<!-- capture (\d+) ([\d.]+) -->$")
+
+
+def writer(mode: str, workdir: str, captures: int, period: float, rows: int, padding_kb: int):
+    path = os.path.join(workdir, "curr_response.txt")
+    handoff = CaptureHandoffWriter(os.path.join(workdir, "handoff.shm")) if mode == "handoff" else None
+    pages = [make_rsk335_page(rows=rows, padding_kb=padding_kb, seed=i) for i in range(4)]
+    for seq in range(1, captures + 1):
+        body = pages[seq % len(pages)] + b"<!-- capture %d %.6f -->" % (seq, time.time())
+        if handoff is None:
+            with open(path, "wb") as f:
+                f.write(body)
+        else:
+            handoff.publish("response", seq, replace_file(path, body))
+        time.sleep(period)
+    if handoff is not None:
+        handoff.close()
+
+
+def run(mode: str, captures: int, period: float, rows: int, padding_kb: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="mcx-handoff-") as workdir:
+        path = os.path.join(workdir, "curr_response.txt")
+        proc = multiprocessing.get_context("spawn").Process(
+            target=writer, args=(mode, workdir, captures, period, rows, padding_kb))
+        proc.start()
+
+        handoff_path = os.path.join(workdir, "handoff.shm") if mode == "handoff" else None
+        watcher = CaptureWatcher(path, interval=0.005, handoff_path=handoff_path)
+        seen, latency = set(), []
+        parsed = torn = duplicates = 0
+        last = 0
+        deadline = None
+        while True:
+            if not proc.is_alive() and deadline is None:
+                deadline = time.monotonic() + 0.5
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            if not watcher.poll():
+                time.sleep(watcher.interval)
+                continue
+            try:
+                body = watcher.read() if mode == "handoff" else open(path, "rb").read()
+                table = extract_margin_table(body)
+            except (OSError, ValueError):
+                body, table = b"", None
+            marker = MARKER.search(body)
+            if not table or marker is None:
+                # retried only once the file changes again
+                torn += 1
+                watcher.mark_failed()
+                continue
+            seq = int(marker.group(1))
+            parsed += 1
+            if seq in seen:
+                duplicates += 1
+            seen.add(seq)
+            last = max(last, seq)
+            latency.append(time.time() - float(marker.group(2)))
+            watcher.mark_done()
+        proc.join()
+
+        idle = measure(watcher.poll, 2000)
+        return {
+            "parsed": parsed,
+            "torn": torn,
+            "duplicates": duplicates,
+            "missed": captures - len(seen),
+            "got_latest": last == captures,
+            "rereads": watcher.rereads,
+            "latency": summarize(latency),
+            "idle_poll_us": round(idle["p50_ms"] * 1e3, 2),
+        }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--captures", type=int, default=300)
+    ap.add_argument("--period-ms", type=float, default=20, help="time between two captures")
+    ap.add_argument("--rows", type=int, default=2000, help="data rows in the margin page")
+    ap.add_argument("--padding-kb", type=int, default=256, help="markup before RSK335_Table")
+    args = ap.parse_args()
+
+    print(f"{'mode':<9}{'parsed':>8}{'torn':>6}{'dupes':>7}{'missed':>8}{'latest':>8}{'rereads':>9}"
+          f"{'lat p50 ms':>12}{'lat p99 ms':>12}{'idle poll us':>14}")
+    for mode in MODES:
+        r = run(mode, args.captures, args.period_ms / 1e3, args.rows, args.padding_kb)
+        print(f"{mode:<9}{r['parsed']:>8}{r['torn']:>6}{r['duplicates']:>7}{r['missed']:>8}"
+              f"{str(r['got_latest']):>8}{r['rereads']:>9}{r['latency'].get('p50_ms', 0):>12.2f}"
+              f"{r['latency'].get('p99_ms', 0):>12.2f}{r['idle_poll_us']:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Append and range-query cost of the margin history (parser/margin_history.py), and its size on disk
+
+    python benchmarks/bench_history.py [--days 10] [--period 5] [--raw-days 2]
+
+Feeds --days trading days (09:00-23:30) of snapshots, one every --period
+seconds, with the simulated capture times, into a fresh database under a
+temp dir. Raw snapshots are kept --raw-days, so the file should stop
+growing after that. Then queries one day of "Utilization %" at each
+resolution and, for comparison, by loading the day's raw snapshots.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCH_DIR, '..')))
+
+from benchmarks.harness import measure, summarize
+from benchmarks.samples import HEADERS, make_row
+from parser.margin_history import MarginHistory
+
+FIELD = "Utilization %"
+OPEN, CLOSE = (9, 0), (23, 30)
+
+
+def db_size(path: str) -> int:
+    return sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+
+
+def trading_times(days: int, period: float):
+    start = datetime(2026, 10, 5)
+    for day in range(days):
+        date = start + timedelta(days=day)
+        t = date.replace(hour=OPEN[0], minute=OPEN[1]).timestamp()
+        end = date.replace(hour=CLOSE[0], minute=CLOSE[1]).timestamp()
+        while t < end:
+            yield day, t
+            t += period
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=10)
+    ap.add_argument("--period", type=float, default=5, help="seconds between snapshots")
+    ap.add_argument("--raw-days", type=float, default=2, help="retention of raw snapshots")
+    args = ap.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory(prefix="mcx-history-") as workdir:
+        path = os.path.join(workdir, "margin-history.sqlite3")
+        history = MarginHistory(path, retention_days={"raw": args.raw_days}, compact_every=0)
+
+        appends, sizes, last_day, now = [], [], 0, None
+        for day, ts in trading_times(args.days, args.period):
+            if day != last_day:
+                # compact once a day, against the simulated clock
+                history.compact(now)
+                sizes.append(db_size(path))
+                last_day = day
+            snapshot = dict(zip(HEADERS, make_row(rng, rng.randrange(1000))))
+            t0 = time.perf_counter()
+            history.append(snapshot, ts)
+            appends.append(time.perf_counter() - t0)
+            now = ts
+        history.compact(now)
+        sizes.append(db_size(path))
+
+        day_start = datetime.fromtimestamp(now).replace(hour=0, minute=0).timestamp()
+        queries = {}
+        for step in ("raw", "1m", "1h"):
+            rows = history.series(FIELD, day_start, now, step)
+            queries[step] = (len(rows), measure(lambda: history.series(FIELD, day_start, now, step), 20))
+        rows = history.snapshots(day_start, now, limit=10 ** 6)
+        queries["snapshots"] = (len(rows), measure(lambda: [
+            (ts, data[FIELD]) for ts, data in history.snapshots(day_start, now, limit=10 ** 6)], 5))
+        history.close()
+
+    a = summarize(appends)
+    print(f"{len(appends)} appends: p50 {a['p50_ms']:.3f} ms, p99 {a['p99_ms']:.3f} ms")
+    print("size after each day (MB): " + " ".join(f"{s / 2 ** 20:.1f}" for s in sizes))
+    print(f"{'last day of ' + FIELD:<28}{'rows':>8}{'p50 ms':>10}")
+    for name, (n, r) in queries.items():
+        print(f"{name:<28}{n:>8}{r['p50_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Simulated trading day: session expiries, data gaps and wasted fetches with and without KeepAliveScheduler
+
+    python benchmarks/bench_keepalive.py [--hours 10] [--timeout 900] [--kills 2] [--seed 0]
+
+A fake eclear expires a session after --timeout idle seconds, and also
+ends it --kills times a day at random (a login elsewhere, a server
+restart). Nobody logs in again until RELOGIN_DELAY later. The
+auto-refresher loads the page every 5 minutes, with random outages (tab
+discarded, laptop asleep, someone else on the site). Three setups on the same schedule:
+
+- refresher: the refresher alone, as today
+- refresher + poller: plus a client fetching every 5 minutes no matter what
+- refresher + keepalive: plus client/keepalive.py (keep-alives, pre-warm fetches)
+
+Everything runs on a simulated clock, one second per tick.
+"""
+import os
+import sys
+import random
+import argparse
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.normpath(os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from client import keepalive
+from client.keepalive import KeepAliveScheduler
+
+START = datetime(2026, 10, 19, 9, 0).timestamp()
+REFRESHER_PERIOD = 300
+RELOGIN_DELAY = 30 * 60
+# refresher outages: one starts with this chance per period, lasting up to OUTAGE_MAX seconds
+OUTAGE_CHANCE = 0.08
+OUTAGE_MAX = 60 * 60
+
+
+class Response:
+    def __init__(self, alive: bool, full: bool):
+        self.status_code = 200 if alive else 302
+        self.headers = {} if alive else {"Location": "/Bancs/login.jsp"}
+        self.content = b"<table id='RSK335_Table'>" if alive and full else b""
+
+
+class World:
+    """The eclear session, as seen through the proxy"""
+
+    def __init__(self, timeout: float, kills: set):
+        self.timeout = timeout
+        self.kills = kills
+        self.now = START
+        self.session = 1
+        self.last_request = START
+        self.dead_since = None
+        self.credentials = self._credentials()
+
+        self.data = [START]
+        self.full_fetches = 0
+        self.dead_fetches = 0
+        self.pings = 0
+        self.expiries = 0
+        self.dead_seconds = 0
+
+    def _credentials(self) -> dict:
+        return {"JSESSIONID": f"J{self.session}", "AlteonP": "A1",
+                "last_updated": datetime.fromtimestamp(self.now).isoformat() + "Z"}
+
+    def tick(self):
+        self.now += 1
+        if self.dead_since is None and (self.now - self.last_request > self.timeout
+                                        or self.now - START in self.kills):
+            self.dead_since = self.now
+            self.expiries += 1
+        if self.dead_since is not None:
+            self.dead_seconds += 1
+            if self.now - self.dead_since >= RELOGIN_DELAY:
+                # someone logged in again
+                self.session += 1
+                self.dead_since = None
+                self.last_request = self.now
+                self.credentials = self._credentials()
+
+    def request(self, full: bool) -> bool:
+        if full:
+            self.full_fetches += 1
+        else:
+            self.pings += 1
+        if self.dead_since is not None:
+            self.dead_fetches += full
+            return False
+        self.last_request = self.now
+        # the proxy sees new tokens in the response
+        self.credentials = self._credentials()
+        if full:
+            self.data.append(self.now)
+        return True
+
+    def max_gap(self) -> float:
+        points = self.data + [self.now]
+        return max(b - a for a, b in zip(points, points[1:]))
+
+
+class FakeFetcher:
+    def __init__(self, world: World):
+        self.world = world
+
+    def ping(self, credentials, url):
+        return Response(self.world.request(full=False), full=False)
+
+    def fetch(self, credentials, filters=None, url=None):
+        return Response(self.world.request(full=True), full=True)
+
+
+def refresher_schedule(hours: float, seed: int) -> set:
+    """Seconds (from START) at which the refresher loads the page"""
+    rng = random.Random(seed)
+    loads, t, end = set(), 0, int(hours * 3600)
+    while t < end:
+        if rng.random() < OUTAGE_CHANCE:
+            t += rng.randint(REFRESHER_PERIOD, OUTAGE_MAX)
+        else:
+            loads.add(t)
+            t += REFRESHER_PERIOD + rng.randint(-5, 5)
+    return loads
+
+
+def simulate(setup: str, hours: float, timeout: float, loads: set, kills: set) -> dict:
+    world = World(timeout, kills)
+    scheduler = None
+    if setup == "keepalive":
+        scheduler = KeepAliveScheduler(FakeFetcher(world), lambda: world.credentials, "/Bancs/",
+                                       margin_url="/Bancs/RSK/RSK335.do", refresher_period=REFRESHER_PERIOD,
+                                       clock=lambda: world.now)
+
+    for second in range(int(hours * 3600)):
+        world.tick()
+        if second in loads:
+            world.request(full=True)
+        if setup == "poller" and second % REFRESHER_PERIOD == 150:
+            world.request(full=True)
+        if scheduler is not None:
+            scheduler.step()
+
+    return {
+        "expiries": world.expiries,
+        "dead_min": round(world.dead_seconds / 60, 1),
+        "data_points": len(world.data) - 1,
+        "max_gap_min": round(world.max_gap() / 60, 1),
+        "full_fetches": world.full_fetches,
+        "dead_fetches": world.dead_fetches,
+        "pings": world.pings,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--hours", type=float, default=10)
+    ap.add_argument("--timeout", type=float, default=900, help="idle seconds until eclear expires a session")
+    ap.add_argument("--kills", type=int, default=2, help="sessions ended server-side at random times")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    keepalive.print = lambda *a, **k: None   # the scheduler's log lines
+    loads = refresher_schedule(args.hours, args.seed)
+    rng = random.Random(args.seed + 1)
+    kills = {rng.randrange(int(args.hours * 3600)) for _ in range(args.kills)}
+
+    print(f"{'':<24}{'expiries':>9}{'dead min':>10}{'data':>6}{'max gap':>9}{'fetches':>9}{'on dead':>9}{'pings':>7}")
+    for setup, label in (("refresher", "refresher"), ("poller", "refresher + poller"),
+                         ("keepalive", "refresher + keepalive")):
+        r = simulate(setup, args.hours, args.timeout, loads, kills)
+        print(f"{label:<24}{r['expiries']:>9}{r['dead_min']:>10}{r['data_points']:>6}{r['max_gap_min']:>9}"
+              f"{r['full_fetches']:>9}{r['dead_fetches']:>9}{r['pings']:>7}")
+
+
+if __name__ == "__main__":
+    main()
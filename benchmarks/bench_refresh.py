@@ -0,0 +1,161 @@
+"""
+Requests vs freshness of the margin feed over a simulated trading day
+
+    python benchmarks/bench_refresh.py [--seed 0] [--days 1]
+
+A margin account's utilization follows a random walk that is flat outside
+09:00-23:55, calm during most of the session and volatile in three bursts;
+from 18:00 to 18:30 eclear answers 10x slower and every fifth request is a
+503. Fixed polling every 300 s (the refresher alone) and every 10 s (the
+parser/sender cadence) is compared against client/refresh_scheduler.py
+driven by a fake clock, with a fake fetcher returning an RSK335 page.
+
+The error is |true - last polled| utilization, in percentage points,
+averaged over every second of the session and of the bursts; stale is the
+seconds of the session the feed was more than 1 point off.
+"""
+import os
+import sys
+import random
+import argparse
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCH_DIR, '..')))
+
+from client.refresh_scheduler import RefreshScheduler
+
+DAY = 86400
+SESSION = (9 * 3600, 23 * 3600 + 55 * 60)
+# (start, end) seconds of the day, utilization points per sqrt(second)
+BURSTS = [(10 * 3600, 10 * 3600 + 1800), (15 * 3600, 15 * 3600 + 1200), (20 * 3600 + 1800, 21 * 3600)]
+CALM_VOLATILITY = 0.01
+BURST_VOLATILITY = 0.15
+SLOW = (18 * 3600, 18 * 3600 + 1800)
+LATENCY = 0.3
+# a Monday, local time
+START = datetime(2026, 10, 12).timestamp()
+
+PAGE = ("<html><body><table id='RSK335_Table'><thead><tr><th>Client Code</th><th>Utilization %</th>"
+        "<th>Margin Utilized</th></tr></thead><tbody><tr><td>DFLT</td><td>{util:.2f}</td>"
+        "<td>{margin:,.2f}</td></tr></tbody></table></body></html>")
+
+
+def in_window(t: int, windows) -> bool:
+    return any(start <= t % DAY < end for start, end in windows)
+
+
+def utilization_path(days: int, seed: int) -> list:
+    rng = random.Random(seed)
+    value, path = 40.0, []
+    for t in range(days * DAY):
+        if in_window(t, [SESSION]):
+            sigma = BURST_VOLATILITY if in_window(t, BURSTS) else CALM_VOLATILITY
+            value = min(max(value + rng.gauss(0, sigma), 0.0), 100.0)
+        path.append(value)
+    return path
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, content: bytes, elapsed: float, headers: dict = None):
+        self.status_code = status_code
+        self.content = content
+        self.elapsed = timedelta(seconds=elapsed)
+        self.headers = headers or {}
+        self.text = content.decode()
+
+
+class FakeEclear:
+    """MarginFetcher stand-in: serves the path's value at the sim clock, slowly during SLOW"""
+
+    def __init__(self, path: list, clock, seed: int):
+        self.path = path
+        self.clock = clock
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.slow_requests = 0
+        self.seen = []   # (t, value) of every good response
+
+    def fetch(self, credentials, filters=None, url=None):
+        t = int(self.clock.now - START)
+        self.requests += 1
+        slow = in_window(t, [SLOW])
+        if slow:
+            self.slow_requests += 1
+            if self.rng.random() < 0.2:
+                return FakeResponse(503, b"RSK335_Table busy", LATENCY * 10)
+        value = self.path[min(t, len(self.path) - 1)]
+        self.seen.append((t, value))
+        page = PAGE.format(util=value, margin=value * 123456.0).encode()
+        return FakeResponse(200, page, LATENCY * (10 if slow else 1) * self.rng.uniform(0.8, 1.2))
+
+
+class Clock:
+    def __init__(self):
+        self.now = START
+
+    def __call__(self):
+        return self.now
+
+
+def evaluate(path: list, seen: list, requests: int, slow_requests: int) -> dict:
+    errors, burst_errors = [], []
+    i, last = 0, None
+    for t, true in enumerate(path):
+        while i < len(seen) and seen[i][0] <= t:
+            last = seen[i][1]
+            i += 1
+        if last is None or not in_window(t, [SESSION]):
+            continue
+        error = abs(true - last)
+        errors.append(error)
+        if in_window(t, BURSTS):
+            burst_errors.append(error)
+    return {
+        "requests": requests,
+        "off_session": sum(1 for t, _ in seen if not in_window(t, [SESSION])),
+        "slow_window": slow_requests,
+        "error": sum(errors) / len(errors),
+        "burst_error": sum(burst_errors) / len(burst_errors),
+        "stale": sum(1 for error in errors if error > 1.0),
+    }
+
+
+def fixed(path: list, period: int, seed: int) -> dict:
+    clock = Clock()
+    eclear = FakeEclear(path, clock, seed)
+    for t in range(0, len(path), period):
+        clock.now = START + t
+        eclear.fetch({})
+    return evaluate(path, eclear.seen, eclear.requests, eclear.slow_requests)
+
+
+def adaptive(path: list, seed: int) -> dict:
+    clock = Clock()
+    eclear = FakeEclear(path, clock, seed)
+    scheduler = RefreshScheduler(eclear, lambda: {"JSESSIONID": "J1", "AlteonP": "A1"}, clock=clock)
+    while clock.now < START + len(path):
+        wait = scheduler.step()
+        clock.now += max(wait, 0.5)
+    return evaluate(path, eclear.seen, eclear.requests, eclear.slow_requests)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--days", type=int, default=1)
+    args = ap.parse_args()
+
+    path = utilization_path(args.days, args.seed)
+    print(f"{'strategy':<10}{'requests':>9}{'off-sess':>9}{'slow':>6}{'err pts':>9}{'burst err':>11}"
+          f"{'stale s':>9}")
+    for name, run in (("fixed300", lambda: fixed(path, 300, args.seed)),
+                      ("fixed10", lambda: fixed(path, 10, args.seed)),
+                      ("adaptive", lambda: adaptive(path, args.seed))):
+        r = run()
+        print(f"{name:<10}{r['requests']:>9}{r['off_session']:>9}{r['slow_window']:>6}{r['error']:>9.3f}"
+              f"{r['burst_error']:>11.3f}{r['stale']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Per-request cost of the auto-capture rewrite: legacy format()/set_text() vs PayloadTemplate
+
+    python benchmarks/bench_rewrite.py
+
+Needs mitmproxy (the real http.Request is used on both sides).
+"""
+import os
+import sys
+import time
+import random
+
+from mitmproxy import http
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCH_DIR, '..')))
+
+from benchmarks.samples import REQUEST_BODY
+from proxy.payload_template import PayloadTemplate
+
+MARGIN_URL = "https://eclear.mcxccl.com/Bancs/RSK/RSK335.do"
+AUTO_CAPTURE_FLAG = "MCX_AUTO_CAPTURE"
+TEMPLATE = REQUEST_BODY
+CREDENTIALS = {"IXHRts": "1759482906778", "rndaak": "5Hg1xYyM0kH4YOnpsw96zBJey"}
+CLIENT_BODY = (AUTO_CAPTURE_FLAG + "=1&" + REQUEST_BODY.format(IXHRts="", rndaak="")).encode()
+
+
+def legacy_rewrite(request: http.Request):
+    # the body of _rewrite_margin_request before it used PayloadTemplate, minus its prints
+    request_text = request.get_text(strict=False)
+    if AUTO_CAPTURE_FLAG in request_text:
+        ixhrts_val = CREDENTIALS.get("IXHRts", "")
+        rndaak_str = CREDENTIALS.get("rndaak", "")
+        if not ixhrts_val or not rndaak_str:
+            fresh_ixhrts = int(time.time() * 1000)
+        else:
+            try:
+                fresh_ixhrts = int(ixhrts_val) + random.randint(50, 200)
+            except ValueError:
+                fresh_ixhrts = int(time.time() * 1000)
+        final_payload = TEMPLATE.format(IXHRts=fresh_ixhrts, rndaak=rndaak_str)
+        final_payload = TEMPLATE.format(IXHRts=ixhrts_val, rndaak=rndaak_str)
+        request.set_text(final_payload)
+        request.headers["Content-Length"] = str(len(final_payload))
+
+
+COMPILED = PayloadTemplate(TEMPLATE)
+FLAG = AUTO_CAPTURE_FLAG.encode()
+
+
+def new_rewrite(request: http.Request):
+    raw = request.raw_content
+    if raw and FLAG in raw:
+        request.content = COMPILED.render(IXHRts=CREDENTIALS["IXHRts"], rndaak=CREDENTIALS["rndaak"])
+        request.headers["Content-Length"] = str(len(request.raw_content))
+
+
+def make_request(body: bytes) -> http.Request:
+    return http.Request.make("POST", MARGIN_URL, body, {
+        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+    })
+
+
+def bench(rewrite, body: bytes, number: int = 5000, repeat: int = 5) -> float:
+    """Best per-call time in microseconds, requests are built outside the timed loop"""
+    best = float("inf")
+    for _ in range(repeat):
+        requests = [make_request(body) for _ in range(number)]
+        start = time.perf_counter()
+        for request in requests:
+            rewrite(request)
+        best = min(best, (time.perf_counter() - start) / number)
+    return best * 1e6
+
+
+def main():
+    a, b = make_request(CLIENT_BODY), make_request(CLIENT_BODY)
+    legacy_rewrite(a)
+    new_rewrite(b)
+    assert a.content == b.content, "rewritten bodies differ"
+
+    browser_body = REQUEST_BODY.format(**CREDENTIALS).encode()
+    print(f"{'case':<34}{'legacy us':>11}{'new us':>10}")
+    for label, body in (("client request (rewritten)", CLIENT_BODY), ("browser request (untouched)", browser_body)):
+        print(f"{label:<34}{bench(legacy_rewrite, body):>11.2f}{bench(new_rewrite, body):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Connections, bytes and time per send: module-level requests.post vs MarginPublisher
+
+    python benchmarks/bench_sender.py [--sends 200] [--change-every 5]
+
+Runs against a local stub receiver. `--change-every N` makes the snapshot
+change on every Nth send, like margins that only move now and then.
+"""
+import os
+import sys
+import time
+import argparse
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.normpath(os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.samples import HEADERS, make_row
+from benchmarks.stub_server import StubReceiver
+from client.publisher import MarginPublisher
+
+
+def snapshots(count: int, change_every: int):
+    import random
+    rng = random.Random(0)
+    data = dict(zip(HEADERS, make_row(rng, 0)))
+    for i in range(count):
+        if i % change_every == 0:
+            data = dict(zip(HEADERS, make_row(rng, i)))
+        yield data
+
+
+def run(label: str, send, count: int, change_every: int):
+    server = StubReceiver().start()
+    try:
+        start = time.perf_counter()
+        for data in snapshots(count, change_every):
+            send(server.url, data)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<22}{server.requests:>9}{server.connections:>13}{server.bytes_received:>12}"
+              f"{elapsed / count * 1e3:>12.3f}")
+    finally:
+        server.stop()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sends", type=int, default=200)
+    ap.add_argument("--change-every", type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"{'sender':<22}{'requests':>9}{'connections':>13}{'bytes':>12}{'ms / send':>12}")
+    run("requests.post", lambda url, data: requests.post(url, json=data), args.sends, args.change_every)
+
+    for compress in (False, True):
+        publishers = {}
+
+        def send(url, data):
+            if url not in publishers:
+                publishers[url] = MarginPublisher(url, compress=compress)
+            publishers[url].publish(data)
+
+        run(f"MarginPublisher{' gzip' if compress else ''}", send, args.sends, args.change_every)
+        for p in publishers.values():
+            p.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Catch-up after a SERVER_URL outage: the old sender vs the spooled, batched one
+
+    python benchmarks/bench_spool.py [--outage 360] [--batch 500]
+
+`--outage` snapshots (one per 10 s tick, so 360 is an hour) are taken while
+a local stub receiver drops every connection. The old sender loses them
+and sends only the current one when the link is back; sending each one as
+its own uncompressed POST shows what a queue without batching would cost.
+The spool (client/spool.py) keeps them on disk, is reopened from disk as
+if the sender had been restarted during the outage, then drains in
+batches. In the flaky run the receiver takes in two batches without
+answering, so they are sent again and it sees duplicate keys. In the 413
+run it refuses bodies over 4 KB, and in the 400 run one snapshot, which
+ends up in rejected.jsonl.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.normpath(os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.samples import HEADERS, make_row
+from benchmarks.stub_server import StubReceiver
+from client.publisher import MarginPublisher
+from client.spool import SnapshotSpool, SpoolSender
+
+
+def snapshots(count: int) -> list:
+    rng = random.Random(0)
+    return [dict(zip(HEADERS, make_row(rng, i))) for i in range(count)]
+
+
+def old_sender(snaps: list, per_snapshot: bool) -> dict:
+    server = StubReceiver().start()
+    publisher = MarginPublisher(server.url, timeout=(1, 2), retries=0)
+    try:
+        server.down = True
+        for data in snaps:
+            try:
+                publisher.publish(data)
+            except requests.RequestException:
+                pass   # printed and forgotten
+        server.down = False
+        before = server.bytes_received
+        start = time.perf_counter()
+        for data in (snaps if per_snapshot else snaps[-1:]):
+            publisher.publish(data, force=True)
+        return {
+            "delivered": server.requests,
+            "requests": server.requests,
+            "kb": (server.bytes_received - before) / 1024,
+            "seconds": time.perf_counter() - start,
+            "duplicates": 0,
+            "rejected": 0,
+        }
+    finally:
+        publisher.close()
+        server.stop()
+
+
+def spooled(snaps: list, encoding: str, batch: int, lose: int = 0, max_body: int = 0, reject: bytes = None) -> dict:
+    server = StubReceiver().start()
+    publisher = MarginPublisher(server.url, timeout=(1, 2), retries=0)
+    with tempfile.TemporaryDirectory(prefix="mcx-spool-") as workdir:
+        try:
+            sender = SpoolSender(SnapshotSpool(workdir), publisher, batch_records=batch, encoding=encoding)
+            server.down = True
+            for i, data in enumerate(snaps):
+                sender.offer(data, 1759482906.0 + 10 * i)
+                try:
+                    sender.drain()
+                except requests.RequestException:
+                    pass
+            # restarted during the outage
+            sender.spool.close()
+            sender = SpoolSender(SnapshotSpool(workdir), publisher, batch_records=batch, encoding=encoding)
+
+            server.down = False
+            server.lose_responses = lose
+            server.max_body = max_body
+            server.reject = reject
+            start = time.perf_counter()
+            while sender.spool.backlog:
+                try:
+                    sender.drain()
+                except requests.RequestException:
+                    pass
+            elapsed = time.perf_counter() - start
+            sender.spool.close()
+            return {
+                "delivered": len(server.keys),
+                "requests": server.requests,
+                "kb": server.bytes_received / 1024,
+                "seconds": elapsed,
+                "duplicates": server.duplicates,
+                "rejected": sender.spool.rejected,
+            }
+        finally:
+            publisher.close()
+            server.stop()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--outage", type=int, default=360, help="snapshots taken while the server is down")
+    ap.add_argument("--batch", type=int, default=500, help="records per batch")
+    args = ap.parse_args()
+
+    snaps = snapshots(args.outage)
+    print(f"{'sender':<22}{'delivered':>10}{'requests':>9}{'KB':>9}{'catch-up ms':>13}{'dupes':>7}{'rejected':>10}")
+    runs = [
+        ("old, current only", lambda: old_sender(snaps, False)),
+        ("old, one per snapshot", lambda: old_sender(snaps, True)),
+        ("spool none", lambda: spooled(snaps, "none", args.batch)),
+        ("spool gzip", lambda: spooled(snaps, "gzip", args.batch)),
+        ("spool zstd", lambda: spooled(snaps, "zstd", args.batch)),
+        ("spool zstd, batch 50", lambda: spooled(snaps, "zstd", 50)),
+        ("spool zstd, flaky", lambda: spooled(snaps, "zstd", 50, lose=2)),
+        ("spool zstd, 413", lambda: spooled(snaps, "zstd", args.batch, max_body=4096)),
+        ("spool zstd, 400", lambda: spooled(snaps, "zstd", args.batch, reject=b'"seq": 100,')),
+    ]
+    for label, run in runs:
+        r = run()
+        print(f"{label:<22}{r['delivered']:>10}{r['requests']:>9}{r['kb']:>9.1f}{r['seconds'] * 1e3:>13.1f}"
+              f"{r['duplicates']:>7}{r['rejected']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Import time of the three services and restart-to-first-capture latency of the proxy
+
+    python benchmarks/bench_startup.py [--runs 10] [--json out.json]
+
+Every run is a fresh interpreter importing a copy of the script from a temp
+dir with the bench config (benchmarks/harness.py), so nothing is cached in
+sys.modules and the real config/ and calls/ are never touched.
+
+- import: loading the script, heavy third-party imports included (for the
+  proxy, mitmproxy itself is imported beforehand, mitmdump already has it)
+- first capture: loading the addon and running one unfiltered margin flow
+  through request()/response() until curr_response.txt is on disk
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.normpath(os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.harness import summarize
+
+SCRIPTS = {
+    "proxy": "mcx_stateful_proxy.py",
+    "parser": "parser/margin_table_parser.py",
+    "sender": "client/margin_data_sender.py",
+}
+
+
+def child(target: str, workdir: str):
+    """Runs in the fresh interpreter, prints the measured seconds"""
+    import io
+    import time
+    import contextlib
+
+    from benchmarks.harness import load_isolated, write_config
+    write_config(workdir)
+
+    if target == "first_capture":
+        from benchmarks.flow_replay import FlowFactory
+        flow = FlowFactory().make("margin_unfiltered")
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            module = load_isolated(SCRIPTS["proxy"], workdir)
+            addon = module.addons[0]
+            addon.request(flow)
+            addon.response(flow)
+        elapsed = time.perf_counter() - start
+        if not os.path.exists(module.MARGIN_RESPONSE_FILE):
+            raise SystemExit("no capture recorded")
+        addon.done()
+    else:
+        if target == "proxy":
+            import mitmproxy.http  # noqa: F401
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            module = load_isolated(SCRIPTS[target], workdir)
+        elapsed = time.perf_counter() - start
+        if target == "proxy":
+            module.addons[0].done()
+    print(elapsed)
+
+
+def measure_once(target: str) -> float:
+    with tempfile.TemporaryDirectory(prefix="mcx-startup-") as workdir:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", target, workdir],
+                             cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def run(runs: int = 10) -> dict:
+    results = {}
+    for target in ("proxy", "parser", "sender", "first_capture"):
+        results[target] = summarize([measure_once(target) for _ in range(runs)])
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--json", help="write the results here")
+    ap.add_argument("--child", nargs=2, metavar=("TARGET", "WORKDIR"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    results = run(args.runs)
+    print(f"{'':<15}{'p50 ms':>10}{'p90 ms':>10}{'max ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<15}{r['p50_ms']:>10.2f}{r['p90_ms']:>10.2f}{r['max_ms']:>10.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
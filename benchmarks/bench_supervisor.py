@@ -0,0 +1,190 @@
+"""
+Memory and capture-to-publish latency: three processes (start-proxy.bat) vs mcx_supervisor.py
+
+    python benchmarks/bench_supervisor.py [--captures 5] [--only three|supervisor] [--parser-processes 0]
+
+Both setups run from a copy of the repo under a temp dir, with a config
+that monitors the local RSK335 mock (benchmarks/mock_rsk335.py) and sends
+to the local stub receiver, so nothing leaves the machine. Margin requests
+go through the proxy to the mock; the latency is from sending the request
+to the stub receiving the snapshot. RSS is the sum over the process tree
+after the captures (read from /proc, so Linux only). Needs mitmproxy.
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import signal
+import socket
+import argparse
+import tempfile
+import subprocess
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.normpath(os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.harness import summarize, write_config
+from benchmarks.mock_rsk335 import MockRSK335
+from benchmarks.samples import make_request_body
+from benchmarks.stub_server import StubReceiver
+
+IGNORE = shutil.ignore_patterns(".git", "calls", "results", "__pycache__", "config.ini",
+                                "credentials.*", "margin-utilization-view.*")
+
+MITMDUMP = [sys.executable, "-c", "from mitmproxy.tools.main import mitmdump; mitmdump()"]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"nothing listening on {port}")
+
+
+def tree_rss_kb(pid: int) -> int:
+    """VmRSS of pid and all its descendants, in kB"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except OSError:
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+
+    total, todo = 0, [pid]
+    while todo:
+        p = todo.pop()
+        todo += children.get(p, [])
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+def make_workdir(workdir: str, mock: MockRSK335, receiver: StubReceiver, parser_processes: int = 0) -> str:
+    repo = os.path.join(workdir, "repo")
+    shutil.copytree(ROOT_DIR, repo, ignore=IGNORE)
+    path = write_config(repo, server_url=receiver.url,
+                        extra=f"\n[SUPERVISOR]\nPARSER_PROCESSES = {parser_processes}\n")
+
+    origin = f"http://127.0.0.1:{mock.server_address[1]}"
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    text = text.replace("TARGET_HOST = eclear.mcxccl.com", "TARGET_HOST = 127.0.0.1")
+    text = text.replace("https://eclear.mcxccl.com", origin)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return repo
+
+
+def start(setup: str, repo: str, port: int) -> list:
+    out = subprocess.DEVNULL
+    if setup == "supervisor":
+        return [subprocess.Popen([sys.executable, "mcx_supervisor.py", "-p", str(port)],
+                                 cwd=repo, stdout=out, stderr=out)]
+    return [
+        subprocess.Popen(MITMDUMP + ["-p", str(port), "-s", "mcx_stateful_proxy.py"], cwd=repo, stdout=out, stderr=out),
+        subprocess.Popen([sys.executable, os.path.join("parser", "margin_table_parser.py")], cwd=repo, stdout=out, stderr=out),
+        subprocess.Popen([sys.executable, os.path.join("client", "margin_data_sender.py")], cwd=repo, stdout=out, stderr=out),
+    ]
+
+
+def capture(session, mock: MockRSK335, receiver: StubReceiver, proxy: str, timeout: float = 30.0) -> float:
+    """Send one margin request through the proxy, seconds until the receiver got a snapshot"""
+    seen = receiver.requests
+    start = time.monotonic()
+    body = make_request_body(str(int(time.time() * 1000)), "5Hg1xYyM0kH4YOnpsw96zBJey")
+    session.post(mock.url, data=body, proxies={"http": proxy}, timeout=10,
+                 headers={"Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+                          "Cookie": "JSESSIONID=J1; AlteonP=A1"})
+    while receiver.requests == seen:
+        if time.monotonic() - start > timeout:
+            raise TimeoutError("no snapshot reached the receiver")
+        time.sleep(0.001)
+    return time.monotonic() - start
+
+
+def run(setup: str, captures: int, parser_processes: int = 0) -> dict:
+    mock = MockRSK335(rows=50).start()
+    receiver = StubReceiver().start()
+    procs = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="mcx-supervisor-") as workdir:
+            repo = make_workdir(workdir, mock, receiver, parser_processes)
+            port = free_port()
+            started = time.monotonic()
+            procs = start(setup, repo, port)
+            wait_for_port(port)
+            listening = time.monotonic() - started
+
+            session = requests.Session()
+            session.trust_env = False
+            latencies = []
+            for _ in range(captures):
+                latencies.append(capture(session, mock, receiver, f"http://127.0.0.1:{port}"))
+                time.sleep(0.2)
+            rss = sum(tree_rss_kb(p.pid) for p in procs)
+
+            for p in procs:
+                p.send_signal(signal.SIGINT)
+            for p in procs:
+                p.wait(15)
+            return {
+                "processes": len(procs),
+                "listening_s": round(listening, 3),
+                "rss_mb": round(rss / 1024, 1),
+                "capture_to_publish": summarize(latencies),
+            }
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.kill()
+        mock.stop()
+        receiver.stop()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--captures", type=int, default=5)
+    ap.add_argument("--only", choices=("three", "supervisor"))
+    ap.add_argument("--parser-processes", type=int, default=0, help="PARSER_PROCESSES for the supervisor")
+    ap.add_argument("--json", help="write the results here")
+    args = ap.parse_args()
+
+    results = {}
+    for setup in ([args.only] if args.only else ["three", "supervisor"]):
+        print(f"running {setup} ...")
+        results[setup] = run(setup, args.captures, args.parser_processes)
+
+    print(f"{'':<12}{'procs':>6}{'RSS MB':>9}{'p50 ms':>10}{'max ms':>10}")
+    for setup, r in results.items():
+        c = r["capture_to_publish"]
+        print(f"{setup:<12}{r['processes']:>6}{r['rss_mb']:>9}{c['p50_ms']:>10.1f}{c['max_ms']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
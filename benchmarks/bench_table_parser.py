@@ -0,0 +1,114 @@
+"""
+Parse time and peak memory: streaming RSK335_Table extractor vs BeautifulSoup
+
+    python benchmarks/bench_table_parser.py [--pages captured1.txt captured2.txt ...]
+
+Without --pages it generates synthetic RSK335 pages of a few sizes. Each
+measurement runs in a fresh interpreter so peak RSS is not polluted by the
+previous run.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.normpath(os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.samples import make_rsk335_page
+
+# (data rows, kb of markup before the table)
+SYNTHETIC_PAGES = [(1, 0), (500, 0), (500, 2048), (20_000, 0)]
+
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def child(mode: str, path: str, repeat: int):
+    import tracemalloc
+    from parser import margin_table_parser
+    from parser.rsk335_stream import extract_margin_table
+
+    parse = extract_margin_table if mode == "stream" else margin_table_parser._parse_with_bs4
+    rss_before = _peak_rss_kb()
+
+    tracemalloc.start()
+    result = parse(path)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(path)
+        timings.append(time.perf_counter() - start)
+
+    rss_after = _peak_rss_kb()
+    print(json.dumps({
+        "best_ms": min(timings) * 1e3,
+        "traced_peak_kb": traced_peak // 1024,
+        "rss_growth_kb": None if rss_before is None else rss_after - rss_before,
+        "result": result,
+    }))
+
+
+def run(mode: str, path: str, repeat: int) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", mode, path, "--repeat", str(repeat)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    # margin_table_parser prints its paths on import, the json is the last line
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", nargs="*", help="captured curr_response.txt files to use instead of synthetic pages")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1], args.repeat)
+        return
+
+    tmp_files = []
+    pages = args.pages
+    if not pages:
+        pages = []
+        for rows, padding_kb in SYNTHETIC_PAGES:
+            fd, path = tempfile.mkstemp(suffix=".txt")
+            with os.fdopen(fd, "wb") as f:
+                f.write(make_rsk335_page(rows=rows, padding_kb=padding_kb))
+            pages.append(path)
+            tmp_files.append(path)
+
+    try:
+        print(f"{'page':<34}{'mode':<8}{'best ms':>10}{'py peak KB':>12}{'RSS +KB':>10}")
+        for path in pages:
+            label = f"{os.path.basename(path)[:18]} {os.path.getsize(path) / 1e6:.2f} MB"
+            results = {}
+            for mode in ("bs4", "stream"):
+                r = results[mode] = run(mode, path, args.repeat)
+                rss = "-" if r["rss_growth_kb"] is None else r["rss_growth_kb"]
+                print(f"{label:<34}{mode:<8}{r['best_ms']:>10.2f}{r['traced_peak_kb']:>12}{rss:>10}")
+            if results["bs4"]["result"] != results["stream"]["result"]:
+                print(f"  WARNING: results differ for {path}")
+    finally:
+        for path in tmp_files:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
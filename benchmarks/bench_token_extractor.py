@@ -0,0 +1,119 @@
+"""
+Microbenchmark: legacy per-cookie regex loop vs proxy.token_extractor
+
+    python benchmarks/bench_token_extractor.py
+"""
+import os
+import re
+import sys
+import timeit
+from urllib.parse import parse_qsl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from proxy.token_extractor import (
+    extract_request_tokens,
+    extract_response_tokens,
+    parse_cookie_header,
+    parse_set_cookie_headers,
+)
+
+COOKIE_HEADER = (
+    "AlteonP=BI1pZUNEqMARRScUPrUeWg$$; JSESSIONID=0001yM1wiYyBx6q5G7-06bIr0Ji:-O2BCN8; "
+    "TS01d67e35=01de3801a585e35076b6512abe23204aa490f4bbb5d60985112aa78406cd4eb7; "
+    "TS254a1510027=08f91e7fa6ab200030c0214206635d3993fbd093741a15ff485bc29a3ac7b8a2"
+)
+SET_COOKIES = [
+    "JSESSIONID=0001yM1wiYyBx6q5G7-06bIr0Ji:-O2BCN8; Path=/; Secure; HttpOnly",
+    "TS01d67e35=01de3801a585e35076b6512abe23204aa490f4bbb5d60985112aa78406cd4eb7; Path=/",
+]
+REQUEST_BODY = (
+    "propertyMap(MCB_SearchWC_wca_bpid_Cmb)=DFLT&MCB_SearchWC_wca_bpid=&GRID_RESPONSE=RSK335_Table"
+    "&sQuery=Client+Code++Equals++DFLT+AND+TM+%2F+CP++Equals++DFLT+AND+CM++Equals++DFLT"
+    "&IXHRts=1759482906778&XHR=true&rndaak=5Hg1xYyM0kH4YOnpsw96zBJey&theme=black&tabId=panel2"
+    + "&favouriteData=&ExtnRadioValues=%7B%7D" * 40
+).encode()
+
+COOKIE_NAMES = ["AlteonP", "JSESSIONID", "TS01d67e35", "TS254a1510027"]
+
+
+def make_response_body(rows: int, tokens_at_end: bool = False) -> bytes:
+    tokens = "<input type='hidden' id='IXHRts' value='IXHRts=1759482906779'>\n" \
+             "<input type='hidden' id='rndaak' value='rndaak=8kT2mQpL0aZ7wXcV1bN3yR4u'>\n"
+    head = "<html><head><title>Margin Utilization View</title></head><body>\n"
+    table = ["<table id='RSK335_Table'><thead><tr>"]
+    table += [f"<th>Column {i}</th>" for i in range(12)]
+    table.append("</tr></thead><tbody>")
+    row = "<tr>" + "".join(f"<td class='num'>12,34,56,{i:03d}.00</td>" for i in range(12)) + "</tr>\n"
+    table.append(row * rows)
+    table.append("</tbody></table>")
+    body = "".join(table)
+    if tokens_at_end:
+        return (head + body + tokens + "</body></html>").encode()
+    return (head + tokens + body + "</body></html>").encode()
+
+
+# ---- legacy implementation, as it was inside StatefulCredentialsProxy ----
+def legacy_request(cookie_header: str, body: bytes) -> dict:
+    creds = {}
+    for name in COOKIE_NAMES:
+        m = re.search(rf"{name}=([^;]+)", cookie_header)
+        if m:
+            creds[name] = m.group(1)
+    # form posts went through flow.request.urlencoded_form, i.e. a full parse_qsl
+    form = dict(parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True))
+    if "IXHRts" in form:
+        creds["IXHRts"] = form["IXHRts"]
+    if "rndaak" in form:
+        creds["rndaak"] = form["rndaak"]
+    return creds
+
+
+def legacy_response(set_cookies: list, body: bytes) -> dict:
+    creds = {}
+    for sc in set_cookies:
+        for name in COOKIE_NAMES:
+            m = re.search(rf"{name}=([^;]+)", sc)
+            if m:
+                creds[name] = m.group(1)
+    text = body.decode("utf-8", "replace")
+    m_ixhrts = re.search(r"IXHRts[#*#=](\d+)", text)
+    if m_ixhrts:
+        creds["IXHRts"] = m_ixhrts.group(1)
+    m_rndaak = re.search(r"rndaak[#*#=]([^<]+)", text)
+    if m_rndaak:
+        creds["rndaak"] = m_rndaak.group(1).strip()
+    return creds
+
+
+def new_request(cookie_header: str, body: bytes) -> dict:
+    creds = parse_cookie_header(cookie_header)
+    creds.update(extract_request_tokens(body))
+    return creds
+
+
+def new_response(set_cookies: list, body: bytes) -> dict:
+    creds = parse_set_cookie_headers(set_cookies)
+    creds.update(extract_response_tokens(body))
+    return creds
+
+
+def bench(label: str, legacy, new, args, number: int):
+    assert legacy(*args) == new(*args), f"{label}: results differ"
+    t_old = min(timeit.repeat(lambda: legacy(*args), number=number, repeat=5)) / number
+    t_new = min(timeit.repeat(lambda: new(*args), number=number, repeat=5)) / number
+    print(f"{label:<34} legacy {t_old * 1e6:>10.1f} us   new {t_new * 1e6:>10.1f} us   x{t_old / t_new:>6.1f}")
+
+
+def main():
+    bench("request (form body)", legacy_request, new_request, (COOKIE_HEADER, REQUEST_BODY), 2000)
+    for rows, number in ((10, 2000), (2_000, 50), (20_000, 5)):
+        for at_end in (False, True):
+            body = make_response_body(rows, tokens_at_end=at_end)
+            where = "end" if at_end else "top"
+            label = f"response {len(body) / 1e6:.2f} MB, tokens {where}"
+            bench(label, legacy_response, new_response, (SET_COOKIES, body), number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Replay synthetic mitmproxy flows through the StatefulCredentialsProxy hooks, in-process
+
+    python benchmarks/flow_replay.py [--flows 2000] [--rows 50] [--json out.json]
+
+The addon is a copy of mcx_stateful_proxy.py loaded from a temp dir with the
+bench config (benchmarks/harness.py), so it records, stores tokens and
+writes credentials.json there, not in the working tree. Needs mitmproxy.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+from mitmproxy import http
+from mitmproxy.test import tflow
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCH_DIR, '..')))
+
+from benchmarks.harness import AUTO_CAPTURE_FLAG, MARGIN_URL, load_isolated, summarize, write_config
+from benchmarks.samples import make_request_body, make_rsk335_page
+
+# share of each kind of flow in a replay, roughly what a browser session looks like
+FLOW_MIX = {
+    "other_host": 0.55,       # everything the browser does outside eclear
+    "target_page": 0.25,      # eclear pages and assets under MONITORED_URL
+    "margin_unfiltered": 0.1,
+    "margin_filtered": 0.05,
+    "margin_auto_capture": 0.05,
+}
+
+
+def load_addon(workdir: str, server_url: str = "", extra_config: str = ""):
+    """Fresh addon module and instance rooted at workdir"""
+    write_config(workdir, server_url, extra_config)
+    module = load_isolated("mcx_stateful_proxy.py", workdir)
+    return module, module.addons[0]
+
+
+class FlowFactory:
+    """Synthetic HTTPFlows with realistic bodies and a moving IXHRts/rndaak"""
+
+    def __init__(self, rows: int = 1, padding_kb: int = 0, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.ixhrts = 1759482906778
+        self.rndaak = "5Hg1xYyM0kH4YOnpsw96zBJey"
+        # a handful of pages, rendering one per flow would dominate the replay
+        self.pages = [make_rsk335_page(rows=rows, padding_kb=padding_kb, seed=i) for i in range(4)]
+
+    def make(self, kind: str) -> http.HTTPFlow:
+        self.ixhrts += self.rng.randint(50, 200)
+        if self.rng.random() < 0.05:
+            self.rndaak = "".join(self.rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(25))
+        cookies = f"JSESSIONID=J{self.ixhrts % 7}; AlteonP=A1; TS01d67e35=t1; TS254a1510027=t2"
+
+        if kind == "other_host":
+            request = http.Request.make("GET", "https://www.example.com/static/app.js", b"", {"Cookie": "x=1"})
+            response = http.Response.make(200, b"//" + b"x" * 2048, {"Content-Type": "application/javascript"})
+        elif kind == "target_page":
+            request = http.Request.make("GET", "https://eclear.mcxccl.com/Bancs/RSK/menu.do?x=1", b"",
+                                        {"Cookie": cookies})
+            response = http.Response.make(200, b"<html>" + b"<div>menu</div>" * 200 + b"</html>",
+                                          {"Content-Type": "text/html", "Set-Cookie": "AlteonP=A2; Path=/"})
+        else:
+            body = make_request_body(str(self.ixhrts), self.rndaak)
+            if kind == "margin_filtered":
+                body = body.replace(b"MCB_SearchWC_wca_bpid=&", b"MCB_SearchWC_wca_bpid=CL000001&", 1)
+            elif kind == "margin_auto_capture":
+                body = f"{AUTO_CAPTURE_FLAG}=1&".encode() + make_request_body("", "")
+            request = http.Request.make("POST", MARGIN_URL, body, {
+                "Cookie": cookies,
+                "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+            })
+            page = self.rng.choice(self.pages).replace(b"IXHRts=1759482906779", b"IXHRts=%d" % (self.ixhrts + 1), 1)
+            response = http.Response.make(200, page, {
+                "Content-Type": "text/html; charset=UTF-8",
+                "Set-Cookie": f"JSESSIONID=J{self.ixhrts % 7}; Path=/",
+            })
+        return tflow.tflow(req=request, resp=response)
+
+    def mix(self, count: int, mix: dict = FLOW_MIX) -> list:
+        kinds = self.rng.choices(list(mix), weights=list(mix.values()), k=count)
+        return [(kind, self.make(kind)) for kind in kinds]
+
+
+def replay(addon, flows) -> dict:
+    """Run request() then response() for every flow, latency per hook and flow kind"""
+    timings = {}
+    start = time.perf_counter()
+    for kind, flow in flows:
+        t0 = time.perf_counter()
+        addon.request(flow)
+        t1 = time.perf_counter()
+        addon.response(flow)
+        t2 = time.perf_counter()
+        timings.setdefault(("request", kind), []).append(t1 - t0)
+        timings.setdefault(("response", kind), []).append(t2 - t1)
+        timings.setdefault(("request", "all"), []).append(t1 - t0)
+        timings.setdefault(("response", "all"), []).append(t2 - t1)
+    elapsed = time.perf_counter() - start
+
+    results = {f"{hook}.{kind}": summarize(samples) for (hook, kind), samples in sorted(timings.items())}
+    results["flows_per_s"] = round(len(flows) / elapsed, 1)
+    return results
+
+
+def run(flows: int = 2000, rows: int = 50, padding_kb: int = 64, seed: int = 0) -> dict:
+    with tempfile.TemporaryDirectory(prefix="mcx-replay-") as workdir:
+        module, addon = load_addon(workdir)
+        factory = FlowFactory(rows=rows, padding_kb=padding_kb, seed=seed)
+        # warm the classifier cache, template and capture store like a running proxy
+        replay(addon, factory.mix(50))
+        results = replay(addon, factory.mix(flows))
+        addon.done()
+        results["addon_metrics"] = module.METRICS.snapshot()
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--flows", type=int, default=2000)
+    ap.add_argument("--rows", type=int, default=50, help="data rows in the margin responses")
+    ap.add_argument("--padding-kb", type=int, default=64, help="markup before RSK335_Table")
+    ap.add_argument("--json", help="write the results here")
+    args = ap.parse_args()
+
+    results = run(args.flows, args.rows, args.padding_kb)
+    print(f"{'hook.flow kind':<34}{'n':>7}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, r in results.items():
+        if isinstance(r, dict) and "p50_ms" in r:
+            print(f"{name:<34}{r['n']:>7}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['max_ms']:>10.3f}")
+    print(f"{results['flows_per_s']} flows/s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
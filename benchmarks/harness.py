@@ -0,0 +1,127 @@
+"""Shared pieces of the benchmark suite: isolated module loading, timing and result files"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import subprocess
+import importlib.util
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.normpath(os.path.join(BENCH_DIR, '..'))
+
+MARGIN_URL = "https://eclear.mcxccl.com/Bancs/RSK/RSK335.do"
+AUTO_CAPTURE_FLAG = "MCX_AUTO_CAPTURE"
+
+# everything the addon, parser and sender read from config.ini, pointing at eclear
+# only by name: nothing here ever opens a connection to it
+BENCH_CONFIG = """\
+[CREDENTIALS]
+TARGET_HOST = eclear.mcxccl.com
+MONITORED_URL = https://eclear.mcxccl.com/Bancs/
+MARGIN_URL = {margin_url}
+SERVER_URL = {server_url}
+
+[PIPELINE]
+ENABLED = false
+
+[LOGGING]
+LEVEL = WARNING
+
+[DEFAULTS]
+DEFAULT_MARGIN_PAYLOAD_TEMPLATE = {template}
+AUTO_CAPTURE_FLAG = {flag}
+"""
+
+
+def write_config(workdir: str, server_url: str = "", extra: str = "") -> str:
+    from benchmarks.samples import REQUEST_BODY
+
+    os.makedirs(os.path.join(workdir, "config"), exist_ok=True)
+    path = os.path.join(workdir, "config", "config.ini")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(BENCH_CONFIG.format(margin_url=MARGIN_URL, server_url=server_url,
+                                    template=REQUEST_BODY, flag=AUTO_CAPTURE_FLAG))
+        f.write(extra)
+    return path
+
+
+def load_isolated(rel_path: str, workdir: str, name: str = None):
+    """
+    Import a copy of the script at ROOT_DIR/rel_path from workdir.
+
+    The scripts derive config.ini, calls/, credentials.json etc. from their
+    own location, so a copy under a temp dir reads the bench config and
+    writes nowhere near the real ones. Their package imports (proxy.*,
+    client.*, parser.*) still resolve to the repo through sys.path.
+    """
+    src = os.path.join(ROOT_DIR, rel_path)
+    dst = os.path.join(workdir, rel_path)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copyfile(src, dst)
+
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+    name = name or "bench_" + os.path.splitext(rel_path.replace(os.sep, "_").replace("/", "_"))[0]
+    spec = importlib.util.spec_from_file_location(name, dst)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(fn, number: int, warmup: int = 3) -> dict:
+    """Call fn() `number` times, return latency percentiles and throughput"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(number):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples, time.perf_counter() - start)
+
+
+def summarize(samples: list, elapsed: float = None) -> dict:
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+    elapsed = sum(samples) if elapsed is None else elapsed
+
+    def pct(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e3
+
+    return {
+        "n": len(samples),
+        "ops_per_s": round(len(samples) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(sum(samples) / len(samples) * 1e3, 4),
+        "p50_ms": round(pct(0.50), 4),
+        "p90_ms": round(pct(0.90), 4),
+        "p99_ms": round(pct(0.99), 4),
+        "max_ms": round(ordered[-1] * 1e3, 4),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def environment() -> dict:
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_results(path: str, results: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+        f.write("\n")
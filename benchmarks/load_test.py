@@ -0,0 +1,341 @@
+"""
+Concurrent replay of mitmproxy flows through the StatefulCredentialsProxy hooks
+
+    python benchmarks/load_test.py [--flows 5000] [--threads 8] [--tasks 8] [--rate 1000]
+                                   [--flows-file dump.mitm] [--json out.json]
+
+Like flow_replay.py, but request() and response() are called from
+`--threads` threads and from `--tasks` asyncio tasks on one event loop (the
+way mitmproxy itself runs hooks) at the same time, the way several browser
+tabs and scripted clients share the proxy. Flows are synthetic (see
+FlowFactory) or read from a mitmproxy dump, which is cycled through until
+`--flows` have been sent. `--rate` paces them at that many flows/s across
+all workers, 0 sends them as fast as the hooks take them.
+
+Besides hook latency it times how long the hooks wait for the addon's
+lock, each write of curr_request.txt/curr_response.txt (under that lock),
+_record_*_flow and _save_credentials on the hook path, and the background
+credentials.json writes. After done() it checks that credentials.json,
+credentials.shm and the addon agree, that the tokens are ones some flow
+carried, that curr_*.txt hold the latest capture of their kind and match
+handoff.shm, that the handoff seq never went back, and that every capture
+in the ring reads back.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import itertools
+import threading
+
+from mitmproxy import http
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCH_DIR, '..')))
+
+from benchmarks.flow_replay import FlowFactory, load_addon
+from benchmarks.harness import summarize
+from proxy.capture_handoff import CaptureHandoffReader
+from proxy.credential_store import SharedCredentialsReader
+from proxy.flow_body import decoded_body
+from proxy.token_extractor import extract_request_tokens, extract_response_tokens
+
+# a file write or credentials save slower than this counts as a stall
+STALL_MS = 10.0
+
+
+class TimedLock:
+    """Stand-in for the addon's lock that records how long each acquire waited and how long it was held"""
+
+    def __init__(self, lock):
+        self._lock = lock
+        self.waits = []
+        self.holds = []
+        self._acquired = threading.local()
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self._lock.acquire()
+        self._acquired.at = time.perf_counter()
+        self.waits.append(self._acquired.at - start)
+        return self
+
+    def __exit__(self, *exc):
+        self.holds.append(time.perf_counter() - self._acquired.at)
+        self._lock.release()
+
+
+def timed(fn, samples: list):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+    return wrapper
+
+
+class Probes:
+    """Timing wrappers around the addon's lock and file writes, installed in place"""
+
+    def __init__(self, module, addon):
+        self.samples = {name: [] for name in ("lock_wait", "lock_hold", "capture_write", "record_request_flow",
+                                              "record_response_flow", "save_credentials", "credentials_write")}
+        self.published = {}   # kind -> handoff seqs in publish order
+
+        self.lock = TimedLock(module._lock)
+        self.lock.waits = self.samples["lock_wait"]
+        self.lock.holds = self.samples["lock_hold"]
+        addon.lock = self.lock
+
+        # module globals are looked up at call time, so the hooks pick these up
+        module.replace_file = timed(module.replace_file, self.samples["capture_write"])
+        module._save_credentials = timed(module._save_credentials, self.samples["save_credentials"])
+        writer = module._credential_writer
+        writer._write = timed(writer._write, self.samples["credentials_write"])
+        addon._record_request_flow = timed(addon._record_request_flow, self.samples["record_request_flow"])
+        addon._record_response_flow = timed(addon._record_response_flow, self.samples["record_response_flow"])
+
+        if addon.handoff is not None:
+            publish = addon.handoff.publish
+
+            def recording_publish(kind, seq, stat, timestamp=None):
+                # called under the addon lock, so the order here is the publish order
+                self.published.setdefault(kind, []).append(seq)
+                publish(kind, seq, stat, timestamp)
+            addon.handoff.publish = recording_publish
+
+    def report(self, stall_ms: float = STALL_MS) -> dict:
+        results = {}
+        for name, samples in self.samples.items():
+            results[name] = summarize(samples)
+            if samples and name not in ("lock_wait", "lock_hold"):
+                results[name]["stalls"] = sum(1 for s in samples if s * 1e3 > stall_ms)
+        return results
+
+
+def load_flows(path: str) -> list:
+    """HTTP flows with a response from a mitmproxy dump (mitmdump -w)"""
+    from mitmproxy import io
+
+    with open(path, "rb") as f:
+        return [flow for flow in io.FlowReader(f).stream() if isinstance(flow, http.HTTPFlow) and flow.response]
+
+
+def make_flows(count: int, flows_file: str = None, rows: int = 50, padding_kb: int = 64, seed: int = 0) -> list:
+    if not flows_file:
+        return FlowFactory(rows=rows, padding_kb=padding_kb, seed=seed).mix(count)
+    loaded = load_flows(flows_file)
+    if not loaded:
+        raise SystemExit(f"No HTTP flows with a response in {flows_file}")
+    # the hooks rewrite flows in place, every replay gets its own copy
+    return [("dump", flow.copy()) for flow, _ in zip(itertools.cycle(loaded), range(count))]
+
+
+def issued_tokens(flows: list) -> dict:
+    """Every IXHRts/rndaak some flow carried, the final credentials must hold one of them"""
+    issued = {}
+    for _, flow in flows:
+        tokens = extract_request_tokens(decoded_body(flow.request))
+        if flow.response:
+            tokens.update(extract_response_tokens(decoded_body(flow.response)))
+        for name, value in tokens.items():
+            issued.setdefault(name, set()).add(value)
+    return issued
+
+
+class Replay:
+    """Hands the flows out to threads and asyncio tasks, paced to `rate` flows/s"""
+
+    def __init__(self, addon, flows: list, rate: float = 0):
+        self.addon = addon
+        self.flows = flows
+        self.rate = rate
+        self.timings = {}
+        self.errors = []
+        self.late = 0
+        self._next = itertools.count()   # next() on it is atomic, no lock needed
+        self._start = None
+
+    def _take(self):
+        i = next(self._next)
+        if i >= len(self.flows):
+            return None, 0.0
+        delay = self._start + i / self.rate - time.perf_counter() if self.rate else 0.0
+        if delay < -0.1:
+            self.late += 1
+        return self.flows[i], delay
+
+    def _call(self, hook: str, kind: str, flow):
+        start = time.perf_counter()
+        try:
+            getattr(self.addon, hook)(flow)
+        except Exception as e:
+            self.errors.append(f"{hook}: {e!r}")
+        elapsed = time.perf_counter() - start
+        self.timings.setdefault((hook, kind), []).append(elapsed)
+        self.timings.setdefault((hook, "all"), []).append(elapsed)
+
+    def _thread_worker(self):
+        while True:
+            item, delay = self._take()
+            if item is None:
+                return
+            if delay > 0:
+                time.sleep(delay)
+            kind, flow = item
+            self._call("request", kind, flow)
+            self._call("response", kind, flow)
+
+    async def _task_worker(self):
+        while True:
+            item, delay = self._take()
+            if item is None:
+                return
+            await asyncio.sleep(max(delay, 0))
+            kind, flow = item
+            self._call("request", kind, flow)
+            # the upstream round trip, other tasks' hooks run meanwhile
+            await asyncio.sleep(0)
+            self._call("response", kind, flow)
+
+    async def _tasks(self, count: int):
+        await asyncio.gather(*(self._task_worker() for _ in range(count)))
+
+    def run(self, threads: int, tasks: int) -> float:
+        self._start = time.perf_counter()
+        workers = [threading.Thread(target=self._thread_worker, name=f"replay-{i}") for i in range(threads)]
+        if tasks:
+            workers.append(threading.Thread(target=asyncio.run, args=(self._tasks(tasks),), name="replay-loop"))
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return time.perf_counter() - self._start
+
+
+def check_consistency(module, addon, probes: Probes, issued: dict) -> dict:
+    """Problems found in what the addon left behind, empty lists when it is consistent"""
+    problems = {"credentials": [], "captures": []}
+    credentials = addon.credentials
+
+    with open(module.CREDENTIALS_FILE, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    if saved != credentials:
+        diff = sorted(k for k in set(saved) | set(credentials) if saved.get(k) != credentials.get(k))
+        problems["credentials"].append(f"credentials.json differs from the addon in {diff}")
+
+    reader = SharedCredentialsReader(module.SHARED_CREDENTIALS_FILE)
+    shared = reader.read()
+    reader.close()
+    if shared is not None and shared != credentials:
+        problems["credentials"].append("credentials.shm differs from the addon")
+
+    for name, values in issued.items():
+        if name in credentials and credentials[name] not in values:
+            problems["credentials"].append(f"{name}={credentials[name]!r} was never carried by a flow")
+
+    handoff = CaptureHandoffReader(module.CAPTURE_HANDOFF_FILE)
+    for kind, path in (("request", module.MARGIN_REQUEST_FILE), ("response", module.MARGIN_RESPONSE_FILE)):
+        latest = addon.captures.latest(kind)
+        if latest is None:
+            continue
+        with open(path, "rb") as f:
+            current = f.read()
+        if current != addon.captures.read(latest):
+            problems["captures"].append(f"curr_{kind}.txt is not the latest {kind} capture ({latest.seq})")
+
+        published = handoff.read(kind)
+        stat = os.stat(path)
+        if published is None:
+            problems["captures"].append(f"no handoff for {kind}")
+        elif (published.size, published.mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            problems["captures"].append(f"handoff.shm does not describe curr_{kind}.txt")
+
+        seqs = probes.published.get(kind, [])
+        backwards = sum(1 for a, b in zip(seqs, seqs[1:]) if b < a)
+        if backwards:
+            problems["captures"].append(f"{kind} handoff seq went back {backwards} time(s) in {len(seqs)} publishes")
+    handoff.close()
+
+    unreadable = 0
+    for entry in addon.captures.captures():
+        try:
+            if len(addon.captures.read(entry)) != entry.size and not entry.encoding:
+                unreadable += 1
+        except Exception:
+            unreadable += 1
+    if unreadable:
+        problems["captures"].append(f"{unreadable} capture(s) in the ring do not read back")
+    return problems
+
+
+def run(flows: int = 5000, threads: int = 8, tasks: int = 8, rate: float = 0, flows_file: str = None,
+        rows: int = 50, padding_kb: int = 64, seed: int = 0) -> dict:
+    replay_flows = make_flows(flows, flows_file, rows, padding_kb, seed)
+    issued = issued_tokens(replay_flows)
+    with tempfile.TemporaryDirectory(prefix="mcx-load-") as workdir:
+        module, addon = load_addon(workdir)
+        # warm the classifier cache, template and capture store like a running proxy
+        warm = Replay(addon, make_flows(50, flows_file, rows, padding_kb, seed + 1))
+        warm.run(1, 0)
+        issued_warm = issued_tokens(warm.flows)
+        for name, values in issued_warm.items():
+            issued.setdefault(name, set()).update(values)
+
+        probes = Probes(module, addon)
+        replay = Replay(addon, replay_flows, rate)
+        elapsed = replay.run(threads, tasks)
+        addon.done()
+
+        results = {f"{hook}.{kind}": summarize(samples) for (hook, kind), samples in sorted(replay.timings.items())}
+        results.update(probes.report())
+        results["flows_per_s"] = round(len(replay_flows) / elapsed, 1)
+        results["late"] = replay.late
+        results["errors"] = replay.errors[:20]
+        results["consistency"] = check_consistency(module, addon, probes, issued)
+        results["addon_metrics"] = module.METRICS.snapshot()
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--flows", type=int, default=5000)
+    ap.add_argument("--threads", type=int, default=8, help="threads calling the hooks")
+    ap.add_argument("--tasks", type=int, default=8, help="asyncio tasks calling the hooks, on one event loop")
+    ap.add_argument("--rate", type=float, default=0, help="flows/s across all workers, 0 = as fast as possible")
+    ap.add_argument("--flows-file", help="replay this mitmproxy dump instead of synthetic flows")
+    ap.add_argument("--rows", type=int, default=50, help="data rows in the margin responses")
+    ap.add_argument("--padding-kb", type=int, default=64, help="markup before RSK335_Table")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="write the results here")
+    args = ap.parse_args()
+
+    results = run(args.flows, args.threads, args.tasks, args.rate, args.flows_file, args.rows, args.padding_kb,
+                  args.seed)
+    print(f"{'hook / probe':<34}{'n':>7}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'stalls':>8}")
+    for name, r in results.items():
+        if isinstance(r, dict) and "p50_ms" in r:
+            print(f"{name:<34}{r['n']:>7}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['max_ms']:>10.3f}"
+                  f"{r.get('stalls', ''):>8}")
+    print(f"{results['flows_per_s']} flows/s, {results['late']} flows more than 100 ms behind --rate, "
+          f"{len(results['errors'])} hook errors")
+    for error in results["errors"]:
+        print(f"  {error}")
+
+    problems = [p for found in results["consistency"].values() for p in found]
+    print("consistent" if not problems else "INCONSISTENT:")
+    for problem in problems:
+        print(f"  {problem}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if problems or results["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
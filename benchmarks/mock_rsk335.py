@@ -0,0 +1,118 @@
+"""
+Local mock of eclear's RSK335.do margin endpoint
+
+    python benchmarks/mock_rsk335.py --port 8335 --rows 500 --latency 0.05
+
+Serves synthetic RSK335 pages (benchmarks/samples.py) to POSTs on
+/Bancs/RSK/RSK335.do, with a new IXHRts in every response and a new
+rndaak every --rotate-every responses.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCH_DIR, '..')))
+
+from benchmarks.samples import make_rsk335_page
+
+MARGIN_PATH = "/Bancs/RSK/RSK335.do"
+# the rndaak make_rsk335_page() puts in its pages
+DEFAULT_RNDAAK = "8kT2mQpL0aZ7wXcV1bN3yR4u"
+RNDAAK_ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+
+class MockRSK335(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, rows: int = 1, padding_kb: int = 0, latency: float = 0.0,
+                 pages: int = 8, rotate_every: int = 20):
+        self.rows = rows
+        self.padding_kb = padding_kb
+        self.latency = latency
+        self.rotate_every = rotate_every
+        self.connections = 0
+        self.requests = 0
+        self._count_lock = threading.Lock()
+        self._token = 1759482906778
+        self._rndaak = DEFAULT_RNDAAK
+        # a few pages rendered up front, generating one per request would dominate the timings
+        self._pages = [make_rsk335_page(rows=rows, padding_kb=padding_kb, seed=i) for i in range(pages)]
+        super().__init__(("127.0.0.1", port), _Handler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{MARGIN_PATH}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="mock-rsk335", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def next_page(self) -> bytes:
+        with self._count_lock:
+            self.requests += 1
+            self._token += random.randint(50, 200)
+            token = str(self._token)
+            if self.rotate_every and self.requests % self.rotate_every == 0:
+                self._rndaak = "".join(random.choice(RNDAAK_ALPHABET) for _ in range(len(DEFAULT_RNDAAK)))
+            rndaak = self._rndaak
+            page = self._pages[self.requests % len(self._pages)]
+        # token churn: every response carries a fresh IXHRts (same length, so a cheap replace)
+        page = page.replace(b"IXHRts=1759482906779", b"IXHRts=" + token.encode(), 1)
+        if rndaak != DEFAULT_RNDAAK:
+            page = page.replace(b"rndaak=" + DEFAULT_RNDAAK.encode(), b"rndaak=" + rndaak.encode(), 1)
+        return page
+
+    def process_request(self, request, client_address):
+        with self._count_lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.split("?")[0] != MARGIN_PATH:
+            self.send_error(404)
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        body = self.server.next_page()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Set-Cookie", f"JSESSIONID=mock{self.server.requests:08d}; Path=/")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8335)
+    ap.add_argument("--rows", type=int, default=1)
+    ap.add_argument("--padding-kb", type=int, default=0)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds of server think time per request")
+    ap.add_argument("--rotate-every", type=int, default=20, help="new rndaak every N responses, 0 = never")
+    args = ap.parse_args()
+
+    server = MockRSK335(args.port, args.rows, args.padding_kb, args.latency, rotate_every=args.rotate_every)
+    print(f"Mock RSK335 listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
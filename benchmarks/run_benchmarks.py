@@ -0,0 +1,176 @@
+"""
+The benchmark suite: addon hooks, parse_response, send_data and make_mcx_margin_request
+
+    python benchmarks/run_benchmarks.py [--quick] [--out results.json] [--compare baseline.json]
+
+Everything runs offline: margin fetches go to the local RSK335 mock
+(benchmarks/mock_rsk335.py), sends to the stub receiver
+(benchmarks/stub_server.py), and the scripts are loaded as copies under a
+temp dir so they never touch the real config/, calls/ or parser outputs.
+
+Results go to benchmarks/results/<git revision>.json by default. With
+--compare, every p50 that got more than --tolerance slower than in the
+baseline file is reported and the exit status is 1.
+"""
+import os
+import io
+import sys
+import json
+import random
+import argparse
+import itertools
+import tempfile
+import contextlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCH_DIR, '..')))
+
+from benchmarks.harness import git_revision, load_isolated, measure, write_config, write_results
+from benchmarks.mock_rsk335 import MockRSK335
+from benchmarks.samples import HEADERS, make_row, make_rsk335_page
+from benchmarks.stub_server import StubReceiver
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# (data rows, kb of markup before the table)
+PARSE_PAGES = [(1, 0), (500, 256), (5000, 0)]
+PARSE_MODES = ("stream", "columns", "bs4")
+
+
+def bench_hooks(quick: bool) -> dict:
+    from benchmarks import flow_replay
+    return flow_replay.run(flows=500 if quick else 3000)
+
+
+def bench_parse_response(quick: bool) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="mcx-bench-") as workdir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            parser = load_isolated("parser/margin_table_parser.py", workdir)
+        os.makedirs(os.path.dirname(parser.RESPONSE_FILE_PATH), exist_ok=True)
+
+        for rows, padding_kb in PARSE_PAGES:
+            with open(parser.RESPONSE_FILE_PATH, "wb") as f:
+                f.write(make_rsk335_page(rows=rows, padding_kb=padding_kb))
+            for mode in PARSE_MODES:
+                if mode == "bs4" and rows > 500:
+                    continue   # seconds per call, not worth it every run
+                number = 3 if quick else max(5, 20000 // max(rows, 100))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results[f"{mode}.rows{rows}.pad{padding_kb}k"] = measure(
+                        lambda: parser.parse_response(mode), number, warmup=1)
+    return results
+
+
+def bench_send_data(quick: bool) -> dict:
+    results = {}
+    server = StubReceiver().start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="mcx-bench-") as workdir:
+            write_config(workdir, server_url=server.url)
+            with contextlib.redirect_stdout(io.StringIO()):
+                sender = load_isolated("client/margin_data_sender.py", workdir)
+
+            # two snapshots to alternate between, so every send is a change
+            rng = random.Random(0)
+            paths = []
+            for i in range(2):
+                path = os.path.join(workdir, f"view{i}.json")
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(dict(zip(HEADERS, make_row(rng, i))), f)
+                paths.append(path)
+
+            number = 50 if quick else 500
+            with contextlib.redirect_stdout(io.StringIO()):
+                sender.FILE_PATH = paths[0]
+                results["unchanged"] = measure(sender.send_data, number)
+
+                flip = itertools.count()
+
+                def send_changed():
+                    sender.FILE_PATH = paths[next(flip) % 2]
+                    sender.send_data()
+
+                results["changed"] = measure(send_changed, number)
+            sender.get_publisher().close()
+        results["connections"] = server.connections
+    finally:
+        server.stop()
+    return results
+
+
+def bench_margin_request(quick: bool) -> dict:
+    from client.mcx_client import make_mcx_margin_request
+
+    credentials = {"AlteonP": "A1", "JSESSIONID": "J1", "TS01d67e35": "t1", "TS254a1510027": "t2",
+                   "IXHRts": "1759482906778", "rndaak": "5Hg1xYyM0kH4YOnpsw96zBJey"}
+    results = {}
+    for rows in (1, 500):
+        server = MockRSK335(rows=rows).start()
+        try:
+            results[f"rows{rows}"] = measure(
+                lambda: make_mcx_margin_request(credentials, url=server.url).content,
+                20 if quick else 200)
+        finally:
+            server.stop()
+    return results
+
+
+BENCHMARKS = {
+    "hooks": bench_hooks,
+    "parse_response": bench_parse_response,
+    "send_data": bench_send_data,
+    "make_mcx_margin_request": bench_margin_request,
+}
+
+
+def compare(results: dict, baseline_path: str, tolerance: float) -> list:
+    """(name, baseline p50, new p50) for every p50 that regressed by more than tolerance"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+
+    def p50s(tree, prefix=""):
+        for key, value in tree.items():
+            if isinstance(value, dict):
+                if "p50_ms" in value:
+                    yield prefix + key, value["p50_ms"]
+                else:
+                    yield from p50s(value, f"{prefix}{key}.")
+
+    old = dict(p50s(baseline))
+    return [(name, old[name], new) for name, new in p50s(results)
+            if name in old and old[name] and new > old[name] * (1 + tolerance)]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--quick", action="store_true", help="fewer iterations, for a smoke run")
+    ap.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="run just these")
+    ap.add_argument("--out", help="results file (default benchmarks/results/<revision>.json)")
+    ap.add_argument("--compare", help="baseline results file to check for regressions")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown vs the baseline")
+    args = ap.parse_args()
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        print(f"running {name} ...")
+        results[name] = BENCHMARKS[name](args.quick)
+
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{git_revision()}.json")
+    write_results(out, results)
+    print(f"results written to {out}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: p50 {old:.3f} ms -> {new:.3f} ms")
+        if regressions:
+            sys.exit(1)
+        print(f"no p50 regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
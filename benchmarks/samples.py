@@ -0,0 +1,76 @@
+"""Synthetic RSK335 pages and request bodies shared by the benchmarks"""
+import random
+
+HEADERS = [
+    "Client Code", "TM / CP", "CM", "Account Type", "Category", "Value Date",
+    "Collateral", "Initial Margin", "Exposure Margin", "Additional Margin",
+    "Total Margin", "Utilization %",
+]
+
+REQUEST_BODY = (
+    "propertyMap(MCB_SearchWC_wca_bpid_Cmb)=DFLT&MCB_SearchWC_wca_bpid=&propertyMap(MCB_SearchWC_wca_bpid_op)="
+    "&MCB_SearchWC_wca_actype=&propertyMap(MCB_SearchWC_wca_associatedtm_Cmb)=DFLT&MCB_SearchWC_wca_associatedtm="
+    "&propertyMap(MCB_SearchWC_wca_associatedcm_Cmb)=DFLT&MCB_SearchWC_wca_associatedcm=&MCB_SearchWC_wca_category="
+    "&MCB_SearchWC_wca_CMName=DFLT&MCB_SearchWC_wca_TMName=DFLT&GRID_RESPONSE=RSK335_Table&operationType=ET"
+    "&sQuery=Client+Code++Equals++DFLT+AND+TM+%2F+CP++Equals++DFLT+AND+CM++Equals++DFLT"
+    "&IXHRts={IXHRts}&XHR=true&rndaak={rndaak}&theme=black&tabId=panel2"
+    + "&favouriteData=&ExtnAttrDropDownValueDesc=%7B%7D&ExtnRadioValues=%7B%7D" * 16
+)
+
+
+def indian_format(value: float) -> str:
+    """12345678.5 -> '1,23,45,678.50'"""
+    whole, frac = f"{value:.2f}".split(".")
+    sign = "-" if whole.startswith("-") else ""
+    whole = whole.lstrip("-")
+    head, tail = whole[:-3], whole[-3:]
+    groups = []
+    while len(head) > 2:
+        groups.insert(0, head[-2:])
+        head = head[:-2]
+    if head:
+        groups.insert(0, head)
+    return sign + ",".join(groups + [tail]) + "." + frac
+
+
+def make_row(rng: random.Random, i: int) -> list:
+    total = rng.uniform(1e5, 5e9)
+    used = total * rng.uniform(0, 1)
+    return [
+        f"CL{i:06d}", f"TM{i % 97:04d}", "CM0001", "CLIENT", "NORMAL", "17-10-2026",
+        indian_format(total * 1.2), indian_format(used * 0.6), indian_format(used * 0.3),
+        indian_format(used * 0.1), indian_format(used), f"{used / total * 100:.2f}",
+    ]
+
+
+def make_rsk335_page(rows: int = 1, padding_kb: int = 0, ixhrts: str = "1759482906779",
+                     rndaak: str = "8kT2mQpL0aZ7wXcV1bN3yR4u", tokens_at_end: bool = False,
+                     seed: int = 0) -> bytes:
+    """An RSK335 margin view with `rows` data rows and `padding_kb` of unrelated markup before the table"""
+    rng = random.Random(seed)
+    tokens = (
+        f"<input type='hidden' id='IXHRts' value='IXHRts={ixhrts}'>\n"
+        f"<input type='hidden' id='rndaak' value='rndaak={rndaak}'>\n"
+    )
+    parts = ["<html><head><title>Margin Utilization View</title></head><body>\n"]
+    if not tokens_at_end:
+        parts.append(tokens)
+    if padding_kb:
+        filler = "<div class='menu'><span>Bancs</span><a href='#'>RSK335</a></div>\n"
+        parts.append(filler * (padding_kb * 1024 // len(filler) + 1))
+
+    parts.append("<table id='RSK335_Table' class='grid'><thead><tr>")
+    parts += [f"<th><span>{h}</span></th>" for h in HEADERS]
+    parts.append("</tr></thead><tbody>\n")
+    for i in range(rows):
+        parts.append("<tr>" + "".join(f"<td class='num'> {v} </td>" for v in make_row(rng, i)) + "</tr>\n")
+    parts.append("</tbody></table>\n")
+
+    if tokens_at_end:
+        parts.append(tokens)
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def make_request_body(ixhrts: str = "1759482906778", rndaak: str = "5Hg1xYyM0kH4YOnpsw96zBJey") -> bytes:
+    return REQUEST_BODY.format(IXHRts=ixhrts, rndaak=rndaak).encode("utf-8")
@@ -0,0 +1,104 @@
+"""Local stand-in for the remote margin receiver (SERVER_URL), counts connections and bytes"""
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubReceiver(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0):
+        self.connections = 0
+        self.requests = 0
+        self.bytes_received = 0
+        self.payloads = []
+        # while set, connections are closed without an answer, like a link that is down
+        self.down = False
+        self.dropped = 0
+        # idempotency keys of the batch items received, and how many came again
+        self.keys = set()
+        self.duplicates = 0
+        # this many requests are taken in but never answered, the client cannot tell they arrived
+        self.lose_responses = 0
+        # bodies larger than this get a 413, decoded bodies containing `reject` a 400
+        self.max_body = 0
+        self.reject = None
+        self._count_lock = threading.Lock()
+        super().__init__(("127.0.0.1", port), _Handler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/margin"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="stub-receiver", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def process_request(self, request, client_address):
+        with self._count_lock:
+            self.connections += 1
+            if self.down:
+                self.dropped += 1
+        if self.down:
+            self.shutdown_request(request)
+            return
+        super().process_request(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out as separate writes, without this keep-alive
+    # connections hit the Nagle / delayed-ACK 40 ms stall
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server._count_lock:
+            self.server.requests += 1
+            self.server.bytes_received += len(body)
+        if self.server.down:
+            # went down while this connection was open
+            self.close_connection = True
+            return
+        if self.server.max_body and len(body) > self.server.max_body:
+            return self._answer(413, b'{"status": "too large"}')
+        encoding = self.headers.get("Content-Encoding")
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "zstd":
+            import zstandard
+            body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+        if self.server.reject is not None and self.server.reject in body:
+            return self._answer(400, b'{"status": "bad record"}')
+        self.server.payloads.append(body)
+        if body.startswith(b'{"type": "batch"'):
+            with self.server._count_lock:
+                for item in json.loads(body)["items"]:
+                    if item["key"] in self.server.keys:
+                        self.server.duplicates += 1
+                    self.server.keys.add(item["key"])
+
+        with self.server._count_lock:
+            lose = self.server.lose_responses > 0
+            if lose:
+                self.server.lose_responses -= 1
+        if lose:
+            self.close_connection = True
+            return
+
+        self._answer(200, b'{"status": "ok"}')
+
+    def _answer(self, status: int, out: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, format, *args):
+        pass
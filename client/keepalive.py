@@ -0,0 +1,316 @@
+import os
+import sys
+import time
+import math
+import threading
+from collections import deque
+from datetime import datetime
+
+CLIENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if __name__ == "__main__":
+    # run as a script: put the repo root on sys.path for the package imports below
+    sys.path.insert(0, os.path.normpath(os.path.join(CLIENT_DIR, '..')))
+
+from proxy.settings import open_settings
+
+CONFIG_FILE_PATH = os.path.join(CLIENT_DIR, '..', 'config', 'config.ini')
+CREDENTIALS_FILE = os.path.normpath(os.path.join(CLIENT_DIR, '..', 'config', 'credentials.json'))
+
+# what an expired eclear session answers with, instead of the page
+EXPIRED_STATUSES = {401, 403, 440}
+EXPIRED_REDIRECT_MARKERS = ("login", "logout", "expired", "timeout")
+# a password field or the container's login action in the first LOGIN_PAGE_SCAN bytes
+LOGIN_PAGE_MARKERS = (b'type="password"', b"type='password'", b"j_security_check")
+LOGIN_PAGE_SCAN = 64 * 1024
+
+# how often the loop re-reads the credentials (cheap, see SharedCredentialsReader)
+POLL_INTERVAL = 1.0
+# a last_updated this soon after one of our own requests was caused by it
+OWN_REQUEST_WINDOW = 5.0
+# keep-alives are sent after this fraction of the shortest idle time a session was seen expiring at
+LIFETIME_SAFETY = 0.5
+LIFETIME_SAMPLES = 8
+
+
+def parse_last_updated(value):
+    """
+    credentials.json last_updated -> epoch seconds, None if unset.
+
+    The proxy writes datetime.now().isoformat() + "Z", i.e. local time
+    despite the Z, so it is read back as local time.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.rstrip("Z")).timestamp()
+    except ValueError:
+        return None
+
+
+def is_login_page(response) -> bool:
+    """
+    True for a 200 that is eclear's login form, e.g. a redirect to it that
+    requests followed. Only the start of the body is looked at.
+    """
+    url = (getattr(response, "url", "") or "").lower()
+    if any(marker in url for marker in EXPIRED_REDIRECT_MARKERS):
+        return True
+    head = response.content[:LOGIN_PAGE_SCAN].lower()
+    return any(marker in head for marker in LOGIN_PAGE_MARKERS)
+
+
+def is_expired(response, read_body: bool = False) -> bool:
+    """
+    True if eclear answered as for a dead session: status, redirect to
+    login, or with `read_body` its login page. A page that merely lacks
+    RSK335_Table (maintenance, partial render) is not a logout.
+    """
+    if response.status_code in EXPIRED_STATUSES:
+        return True
+    if 300 <= response.status_code < 400:
+        location = response.headers.get("Location", "").lower()
+        return any(marker in location for marker in EXPIRED_REDIRECT_MARKERS)
+    if read_body and response.status_code == 200:
+        return is_login_page(response)
+    return False
+
+
+class KeepAliveScheduler:
+    """
+    Keeps the eclear session the proxy captured alive between the
+    auto-refresher's page loads, and stands in for the refresher when it
+    stops loading the page.
+
+    - every credentials change the proxy records (last_updated) counts as
+      activity; a GET keep-alive (MarginFetcher.ping) is only sent after
+      `interval()` seconds without any, so a working refresher means no
+      keep-alives at all
+    - interval() starts at `interval`; once a session has been found expired
+      after N idle seconds, longer than any session was found alive after,
+      it is LIFETIME_SAFETY * the shortest such N, kept within
+      [min_interval, max_interval]. Sessions ending sooner (logout, server
+      restart) do not shrink it, and it never probes beyond `interval` to
+      find the real timeout.
+    - browser activity gives the refresher's phase. When it missed its last
+      load, the session is checked `prewarm_lead` seconds before the next
+      one is due, and with `prewarm_fetch` a margin request goes out through
+      the proxy in its place, so the feed keeps getting captures
+    - a dead session gets no more requests until the credentials show a new
+      login; fetch() returns None meanwhile instead of spending a full page
+    """
+
+    def __init__(self, fetcher, load_credentials, ping_url: str, margin_url: str = None,
+                 interval: float = 600, min_interval: float = 60, max_interval: float = 1200,
+                 refresher_period: float = 300, prewarm_lead: float = 15, prewarm_fetch: bool = True,
+                 clock=time.time):
+        self.fetcher = fetcher
+        self.load_credentials = load_credentials
+        self.ping_url = ping_url
+        self.margin_url = margin_url
+        self.base_interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.refresher_period = refresher_period
+        self.prewarm_lead = prewarm_lead
+        self.prewarm_fetch = prewarm_fetch
+        self.clock = clock
+
+        self.alive = None           # None until the first request or browser activity
+        self.last_activity = None   # epoch seconds of the last request known to reach eclear
+        self.refreshed_at = None    # last browser activity, the refresher's phase
+        self.lifetimes = deque(maxlen=LIFETIME_SAMPLES)
+        self.longest_idle = 0.0     # the longest idle time a session was found alive after
+
+        self.keepalives = 0
+        self.prewarms = 0
+        self.fetches = 0
+        self.skipped_dead = 0
+        self.expiries = 0
+        self.errors = 0
+
+        self._session_key = None
+        self._last_updated = None
+        self._own_from = self._own_until = 0.0
+        self._prewarmed_for = None
+        self._retry_at = 0.0
+        self._stop = threading.Event()
+
+    def interval(self) -> float:
+        if not self.lifetimes:
+            return min(max(self.base_interval, self.min_interval), self.max_interval)
+        return min(max(LIFETIME_SAFETY * min(self.lifetimes), self.min_interval), self.max_interval)
+
+    def next_refresh(self, now: float):
+        """When the refresher is expected to load the page next, None before it was seen"""
+        if self.refreshed_at is None or self.refresher_period <= 0:
+            return None
+        periods = max(1, math.ceil((now - self.refreshed_at) / self.refresher_period))
+        return self.refreshed_at + periods * self.refresher_period
+
+    def observe(self, credentials: dict, now: float):
+        key = (credentials.get("JSESSIONID", ""), credentials.get("AlteonP", ""))
+        if key != self._session_key:
+            if self._session_key is not None and self.alive is False:
+                print("[KeepAlive] New session in the credentials, resuming.")
+                self.alive = None
+            self._session_key = key
+
+        updated = parse_last_updated(credentials.get("last_updated"))
+        if updated is None or updated == self._last_updated:
+            return
+        self._last_updated = updated
+        self.last_activity = max(self.last_activity or 0.0, updated)
+        if not (self._own_from <= updated <= self._own_until):
+            # the browser got fresh tokens, so the session was alive then
+            self.refreshed_at = updated
+            if self.alive is not False:
+                self.alive = True
+
+    def step(self) -> float:
+        """Do whatever is due now, returns the seconds until something may be due again"""
+        now = self.clock()
+        try:
+            credentials = self.load_credentials()
+        except (OSError, ValueError) as e:
+            print(f"[KeepAlive] Could not load credentials: {e}")
+            return POLL_INTERVAL
+        self.observe(credentials, now)
+
+        if self.alive is False or not credentials.get("JSESSIONID"):
+            return POLL_INTERVAL
+
+        refresh = self.next_refresh(now)
+        if (refresh is not None and self.prewarm_lead > 0 and refresh != self._prewarmed_for
+                and now >= refresh - self.prewarm_lead):
+            self._prewarmed_for = refresh
+            # only when the refresher skipped its last load, otherwise it has this one
+            if refresh - self.refreshed_at > self.refresher_period:
+                self.prewarm(credentials, now)
+        elif now >= self._retry_at and (self.last_activity is None
+                                        or now - self.last_activity >= self.interval()):
+            self.keepalive(credentials, now)
+
+        wait = POLL_INTERVAL
+        if self.last_activity is not None:
+            wait = min(wait, max(self.last_activity + self.interval(), self._retry_at) - now)
+        return max(wait, 0.0)
+
+    def keepalive(self, credentials: dict, now: float) -> bool:
+        """GET ping_url on the session; False if it turned out to be dead (or unreachable)"""
+        self.keepalives += 1
+        self._mark_own(now)
+        try:
+            response = self.fetcher.ping(credentials, self.ping_url)
+        except Exception as e:
+            self.errors += 1
+            # not a verdict on the session, try again after min_interval
+            self._retry_at = now + self.min_interval
+            print(f"[KeepAlive] Keep-alive failed: {e}")
+            return False
+        return self._outcome(is_expired(response), now)
+
+    def prewarm(self, credentials: dict, now: float):
+        self.prewarms += 1
+        if self.keepalive(credentials, now) and self.prewarm_fetch and self.margin_url:
+            try:
+                self.fetch(credentials)
+            except Exception as e:
+                self.errors += 1
+                print(f"[KeepAlive] Pre-warm fetch failed: {e}")
+
+    def fetch(self, credentials: dict = None, filters: dict = None):
+        """A full margin request, unless the session is known to be dead (None then)"""
+        if self.alive is False:
+            self.skipped_dead += 1
+            return None
+        credentials = credentials or self.load_credentials()
+        now = self.clock()
+        self.fetches += 1
+        self._mark_own(now)
+        response = self.fetcher.fetch(credentials, filters, url=self.margin_url)
+        self._outcome(is_expired(response, read_body=True), now)
+        return response
+
+    def run(self):
+        print(f"[KeepAlive] Keeping {self.ping_url} alive, refresher every {self.refresher_period:.0f}s")
+        while not self._stop.is_set():
+            self._stop.wait(self.step())
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {
+            "alive": self.alive,
+            "interval": round(self.interval(), 1),
+            "keepalives": self.keepalives,
+            "prewarms": self.prewarms,
+            "fetches": self.fetches,
+            "skipped_dead": self.skipped_dead,
+            "expiries": self.expiries,
+            "errors": self.errors,
+        }
+
+    def _mark_own(self, now: float):
+        self._own_from, self._own_until = now, now + OWN_REQUEST_WINDOW
+
+    def _outcome(self, expired: bool, now: float) -> bool:
+        if not expired:
+            if self.last_activity is not None:
+                self.longest_idle = max(self.longest_idle, now - self.last_activity)
+            self.alive = True
+            self.last_activity = now
+            return True
+
+        if self.alive is not False and self.last_activity is not None:
+            idle = now - self.last_activity
+            if idle > self.longest_idle:
+                # longer idle than any session survived, the timeout may be shorter than interval()
+                self.lifetimes.append(idle)
+                print(f"[KeepAlive] Session expired after {idle / 60:.1f} min idle, log in again. "
+                      f"Keep-alive interval is now {self.interval():.0f}s.")
+            else:
+                # sessions survived longer idle times: logged out or ended server-side
+                print(f"[KeepAlive] Session ended after {idle / 60:.1f} min idle, log in again.")
+        self.expiries += 1
+        self.alive = False
+        return False
+
+
+def build_scheduler(settings):
+    """KeepAliveScheduler for the [KEEPALIVE] settings, talking to eclear through the proxy"""
+    from client.margin_fetcher import MarginFetcher
+    from client.mcx_client import MARGIN_URL, load_shared_credentials
+
+    proxies = {"http": settings.keepalive_proxy, "https": settings.keepalive_proxy} if settings.keepalive_proxy else None
+    fetcher = MarginFetcher(url=settings.margin_url or MARGIN_URL, max_workers=1, rate_per_host=1.0,
+                            verify=settings.keepalive_verify, proxies=proxies)
+    ping_url = settings.keepalive_url or (settings.monitored_urls[0] if settings.monitored_urls else MARGIN_URL)
+
+    return KeepAliveScheduler(
+        fetcher,
+        lambda: load_shared_credentials(CREDENTIALS_FILE),
+        ping_url,
+        margin_url=settings.margin_url or MARGIN_URL,
+        interval=settings.keepalive_interval,
+        min_interval=settings.keepalive_min_interval,
+        max_interval=settings.keepalive_max_interval,
+        refresher_period=settings.refresher_period,
+        prewarm_lead=settings.prewarm_lead,
+        prewarm_fetch=settings.prewarm_fetch,
+    )
+
+
+if __name__ == '__main__':
+    settings = open_settings(CONFIG_FILE_PATH).get()
+    if not settings.mtime_ns:
+        print(f"ERROR: Could not read configuration file at: {settings.path}")
+
+    scheduler = build_scheduler(settings)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print("\nKeep-alive stopped by user.")
+    finally:
+        print(f"Keep-alive stats: {scheduler.stats()}")
+        scheduler.fetcher.close()
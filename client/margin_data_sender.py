@@ -1,37 +1,91 @@
-import requests
 import json
 import time
 import os
-import configparser
+import sys
+import logging
 
 CLIENT_DIR = os.path.dirname(os.path.abspath(__file__))
 # CLIENT_DIR C:\Users\admin01\Desktop\get_margin_data\client
 
-print("CLIENT_DIR", CLIENT_DIR)
+if __name__ == "__main__":
+    # run as a script: put the repo root on sys.path for the package imports below
+    sys.path.insert(0, os.path.normpath(os.path.join(CLIENT_DIR, '..')))
 
-CONFIG_FILE_PATH = os.path.join(CLIENT_DIR, '..', 'config', 'config.ini')
-
-config = configparser.ConfigParser()
-read_files = config.read(CONFIG_FILE_PATH)
+from proxy.settings import open_settings
 
-if not read_files:
-    print(f"ERROR: Could not read configuration file at: {CONFIG_FILE_PATH}")
+CONFIG_FILE_PATH = os.path.join(CLIENT_DIR, '..', 'config', 'config.ini')
 
-SERVER_URL = config['CREDENTIALS']['SERVER_URL']
+# parsed on the first send, and again whenever config.ini is edited
+SETTINGS = open_settings(CONFIG_FILE_PATH)
 
 path_with_dots = os.path.join(CLIENT_DIR, '..', 'parser', 'margin-utilization-view.json')
 FILE_PATH = os.path.normpath(path_with_dots)
 
+# one keep-alive session, built on the first send and rebuilt only when the sender settings change
+publisher = None
+_publisher_key = None
+# with SPOOL = true in [SENDER], every snapshot goes through the on-disk spool (./spool.py)
+spool_sender = None
+# seconds of each 10 s tick spent catching up on a backlog
+DRAIN_BUDGET = 8
+
+def get_publisher():
+    """The MarginPublisher for the current settings, requests is only imported here"""
+    global publisher, _publisher_key, spool_sender
+    settings = SETTINGS.get()
+    key = settings.sender_options
+    if publisher is not None and key == _publisher_key:
+        return publisher
+
+    if not settings.mtime_ns:
+        print(f"ERROR: Could not read configuration file at: {settings.path}")
+
+    if publisher is not None:
+        # config.ini was edited, start over with a new session (and a keyframe)
+        publisher.close()
+        if spool_sender is not None:
+            spool_sender.close()
+            spool_sender = None
+        print(f"Settings reloaded from {settings.path}")
+
+    # with DIFF on, keyframes plus changed fields instead of the full snapshot every cycle
+    from client.publisher import publisher_from_settings
+    publisher = publisher_from_settings(settings)
+    if settings.sender_spool:
+        from client.spool import open_spool_sender
+        spool_sender = open_spool_sender(settings, publisher)
+    _publisher_key = key
+    return publisher
+
+def send_spooled(data):
+    """Spool the snapshot, then send what the server does not have yet"""
+    seq = spool_sender.offer(data, os.path.getmtime(FILE_PATH))
+    # raises when the server is unreachable, the snapshot is safe in the spool by then
+    delivered = spool_sender.drain(time.monotonic() + DRAIN_BUDGET)
+    if seq is None and not delivered:
+        print("No change since last send, skipped.")
+    else:
+        print(f"Sent {delivered} snapshot(s) to {publisher.server_url}, "
+              f"{spool_sender.spool.backlog} waiting in the spool.")
+
 def send_data():
     """Reads data from the JSON file and sends it to the server."""
+    import requests
+
     try:
         with open(FILE_PATH, 'r') as f:
             data = json.load(f)
 
-        response = requests.post(SERVER_URL, json=data)
-        
-        if response.status_code == 200:
-            print(f"Data sent successfully to {SERVER_URL}. Server response: {response.text}")
+        publisher = get_publisher()
+        if spool_sender is not None:
+            send_spooled(data)
+            return
+        response = publisher.publish(data)
+
+        if response is None:
+            print("No change since last send, skipped.")
+        elif response.status_code == 200:
+            print(f"Data sent successfully to {publisher.server_url}. Server response: {response.text}")
         else:
             print(f"Failed to send data. Status code: {response.status_code}, Response: {response.text}")
             
@@ -41,12 +95,22 @@ def send_data():
         print(f"Error: The file '{FILE_PATH}' is not a valid JSON file.\n")
     except requests.exceptions.RequestException as e:
         print(f"Error connecting to the server: {e}\n")
+        if spool_sender is not None:
+            print(f"{spool_sender.spool.backlog} snapshot(s) kept in the spool.\n")
 
 if __name__ == '__main__':
+    # the spool reports through logging
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     print("Starting data transmission...")
     try:
         while True:
             send_data()
             time.sleep(10)
     except KeyboardInterrupt:
-        print("\nTransmission stopped by user.")
\ No newline at end of file
+        print("\nTransmission stopped by user.")
+        if spool_sender is not None:
+            print(f"Spool stats: {spool_sender.stats()}")
+            spool_sender.close()
+        if publisher is not None:
+            print(f"Sender stats: {publisher.stats()}")
+            publisher.close()
\ No newline at end of file
@@ -0,0 +1,150 @@
+import time
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from client.mcx_client import (
+    MARGIN_HEADERS,
+    MARGIN_URL,
+    cookie_header,
+    encode_margin_payload,
+)
+
+# sessions kept open at once, the least recently used one is closed past this
+MAX_SESSIONS = 8
+
+
+class RateLimiter:
+    """Token bucket, `rate` requests per second with bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class MarginFetcher:
+    """
+    Concurrent RSK335 margin requests for several sessions and filter combinations.
+
+    Each account (JSESSIONID) gets its own pooled keep-alive session with
+    the constant headers; its Cookie header is updated in place when the
+    other cookies rotate, and the least recently used session is closed
+    once there are more than MAX_SESSIONS. A request only encodes the
+    tokens and filter fields into the pre-encoded payload. At most
+    `max_workers` requests are in flight, and requests to one host are
+    spaced by a token bucket of `rate_per_host` per second.
+    """
+
+    def __init__(self, url: str = MARGIN_URL, max_workers: int = 4, rate_per_host: float = 2.0,
+                 burst: int = 2, timeout=(3.05, 30), verify: bool = True, proxies: dict = None,
+                 auto_capture_flag: str = ""):
+        self.url = url
+        self.max_workers = max_workers
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.timeout = timeout
+        self.verify = verify
+        self.proxies = proxies
+        # through the proxy: a body carrying the flag is rewritten with its freshest tokens
+        self._prefix = f"{auto_capture_flag}=1&".encode("utf-8") if auto_capture_flag else b""
+
+        self._sessions = OrderedDict()   # JSESSIONID -> Session, least recently used first
+        self._limiters = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="margin-fetch")
+
+    def fetch(self, credentials: dict, filters: dict = None, url: str = None) -> requests.Response:
+        """One margin request, blocking; tokens come from credentials"""
+        url = url or self.url
+        session = self._session_for(credentials)
+        body = self._prefix + encode_margin_payload(credentials.get("IXHRts", ""), credentials.get("rndaak", ""), filters)
+
+        self._limiter_for(url).acquire()
+        return session.post(url, data=body, timeout=self.timeout, verify=self.verify)
+
+    def ping(self, credentials: dict, url: str) -> requests.Response:
+        """
+        Lightweight GET on the session of `credentials`: redirects are not
+        followed and the body is never read, only the status and headers.
+        """
+        session = self._session_for(credentials)
+        self._limiter_for(url).acquire()
+        response = session.get(url, timeout=self.timeout, verify=self.verify, allow_redirects=False, stream=True)
+        response.close()
+        return response
+
+    def submit(self, credentials: dict, filters: dict = None, url: str = None):
+        """Queue a fetch on the worker pool, returns a concurrent.futures.Future"""
+        return self._executor.submit(self.fetch, credentials, filters, url)
+
+    def fetch_all(self, jobs) -> list:
+        """
+        Run (credentials, filters) jobs concurrently, results in job order.
+        Each result is a requests.Response or the exception that request raised.
+        """
+        futures = [self.submit(credentials, filters) for credentials, filters in jobs]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def _session_for(self, credentials: dict) -> requests.Session:
+        key = credentials.get("JSESSIONID", "")
+        cookies = cookie_header(credentials)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update(MARGIN_HEADERS)
+                if self.proxies:
+                    session.proxies.update(self.proxies)
+                self._sessions[key] = session
+                while len(self._sessions) > MAX_SESSIONS:
+                    # e.g. the account logged in again, its old JSESSIONID is not coming back
+                    self._sessions.popitem(last=False)[1].close()
+            else:
+                self._sessions.move_to_end(key)
+            # the TS*/AlteonP cookies rotate within a session, the connections stay
+            if session.headers.get("Cookie") != cookies:
+                session.headers["Cookie"] = cookies
+            return session
+
+    def _limiter_for(self, url: str) -> RateLimiter:
+        host = urlsplit(url).netloc
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = RateLimiter(self.rate_per_host, self.burst)
+            return limiter
@@ -1,152 +1,217 @@
 import requests
 import json
+import os
+import sys
 from typing import Dict, Any
+from urllib.parse import quote_plus
+
+CLIENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if __name__ == "__main__":
+    # run as a script: put the repo root on sys.path for the package imports below
+    sys.path.insert(0, os.path.normpath(os.path.join(CLIENT_DIR, '..')))
+
+from proxy.credential_store import SharedCredentialsReader
+
+SHARED_CREDENTIALS_FILE = os.path.normpath(os.path.join(CLIENT_DIR, '..', 'config', 'credentials.shm'))
+
+_shared_reader = SharedCredentialsReader(SHARED_CREDENTIALS_FILE)
 
 def load_credentials(file_path: str = "../config/credentials.json") -> Dict[str, Any]:
     """Load credentials from JSON file"""
     with open(file_path, 'r') as f:
         return json.load(f)
 
-def make_mcx_margin_request(credentials: Dict[str, Any]) -> requests.Response:
+def load_shared_credentials(fallback_path: str = "../config/credentials.json") -> Dict[str, Any]:
+    """
+    Load the proxy's latest credentials from shared memory
+
+    The json is only parsed again when the proxy has published a new version,
+    falls back to reading fallback_path when the proxy is not running.
+    """
+    credentials = _shared_reader.read()
+    if credentials:
+        return credentials
+    return load_credentials(fallback_path)
+
+# Built once at import, every request only fills in the tokens (and filters)
+MARGIN_URL = "https://eclear.mcxccl.com/Bancs/RSK/RSK335.do"
+
+MARGIN_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:143.0) Gecko/20100101 Firefox/143.0",
+    "Accept": "*/*",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate, br, zstd",
+    "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+    "X-Requested-With": "XMLHttpRequest",
+    "Origin": "https://eclear.mcxccl.com",
+    "Connection": "keep-alive",
+    "Referer": "https://eclear.mcxccl.com/Bancs/RSK/RSK335.do?app=bancsapp?prefix=/RSK&page=/RSK335.do&confViewSize=22&reqType=0&mode=DEF_MODE&cParent=&parentName=blank&browserType=IE55&GuiWinName=RSK335&compname=RSK&locale=&winlocale=&over_ride_button=Cancel&AvlHt=726&AvlWd=983&tblWd=967&GuiBrowserInst=0&theme=black&confViewSize=22&pageId=RSK335&wintitle=Margin%20Utilization%20View&availHeight=820&availWidth=1067&tabid=2&tabId=panel2",
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "same-origin",
+    "Priority": "u=0"
+}
+
+MARGIN_PAYLOAD = {
+    "propertyMap(MCB_SearchWC_wca_bpid_Cmb)": "DFLT",
+    "MCB_SearchWC_wca_bpid": "",
+    "propertyMap(MCB_SearchWC_wca_bpid_op)": "",
+    "MCB_SearchWC_wca_actype": "",
+    "propertyMap(MCB_SearchWC_wca_actype_op)": "",
+    "propertyMap(MCB_SearchWC_wca_associatedtm_Cmb)": "DFLT",
+    "MCB_SearchWC_wca_associatedtm": "",
+    "propertyMap(MCB_SearchWC_wca_associatedtm_op)": "",
+    "propertyMap(MCB_SearchWC_wca_associatedcm_Cmb)": "DFLT",
+    "MCB_SearchWC_wca_associatedcm": "",
+    "propertyMap(MCB_SearchWC_wca_associatedcm_op)": "",
+    "MCB_SearchWC_wca_valuedate": "",
+    "propertyMap(MCB_SearchWC_wca_valuedate_op)": "",
+    "MCB_SearchWC_wca_category": "",
+    "propertyMap(MCB_SearchWC_wca_category_op)": "",
+    "MCB_SearchWC_wca_CMName": "DFLT",
+    "propertyMap(MCB_SearchWC_wca_CMName_op)": "",
+    "MCB_SearchWC_wca_TMName": "DFLT",
+    "propertyMap(MCB_SearchWC_wca_TMName_op)": "",
+    "MCB_SearchWC_wca_datedummy1": "",
+    "propertyMap(MCB_SearchWC_wca_datedummy1_op)": "",
+    "MCB_SearchWC_wca_datedummy2": "",
+    "propertyMap(MCB_SearchWC_wca_datedummy2_op)": "",
+    "GRID_RESPONSE": "RSK335_Table",
+    "operationType": "ET",
+    "searchClicked": "true",
+    "PageNum": "0",
+    "service": "qryMarginUtilView",
+    "windowName": "RSK335",
+    "MODE": "DEF_MODE",
+    "compName": "RSK",
+    "lgbinst": "0",
+    "WRITE_APP": "true",
+    "REQ_TYPE": "0",
+    "sQuery": "Client Code  Equals  DFLT AND TM / CP  Equals  DFLT AND CM  Equals  DFLT",
+    "AvlWd": "969",
+    "tblWd": "947",
+    "MCBrowserEventInformation": "sourceElementName~|~Search#*#eventType~|~click#*#butId~|~null",
+    "IXHRts": "",  # Dynamic value from credentials
+    "XHR": "true",
+    "rndaak": "",  # Dynamic value from credentials
+    "theme": "black",
+    "tabId": "panel2",
+    "mode": "DEF_MODE",
+    "GuiBrowserInst": "0",
+    "parentName": "blank",
+    "parentToChildCopyData": "",
+    "childToParentCopyData": "",
+    "parentTabId": "",
+    "childToParentJavaCopyFlag": "",
+    "openedFromBtn": "",
+    "confViewSize": "22",
+    "favouriteData": "",
+    "ExtnAttrDropDownValueDesc": "{}",
+    "ExtnRadioValues": "{}",
+    "butvalue": "",
+    "reqType": "1",
+    "childTabId": "",
+    "popupctrl": "",
+    "callPopUp": "",
+    "frombsle": "NO",
+    "fromTblBtn": "NO",
+    "functionName": "",
+    "ifCallPaint": "0",
+    "controlName": "",
+    "param": "",
+    "WindowName": "",
+    "parentSelectedRow": "",
+    "browserType": "IE55",
+    "GuiWinName": "RSK335",
+    "compname": "RSK",
+    "locale": "",
+    "winlocale": "",
+    "SortedColumnName": "",
+    "over_ride_button": "Cancel",
+    "parentToChildData": ""
+}
+
+COOKIE_NAMES = ("AlteonP", "JSESSIONID", "TS01d67e35", "TS254a1510027")
+
+# Fields that change per request, everything else is pre-encoded once
+TOKEN_FIELDS = ("IXHRts", "rndaak")
+FILTER_FIELDS = (
+    "MCB_SearchWC_wca_bpid",
+    "MCB_SearchWC_wca_associatedtm",
+    "MCB_SearchWC_wca_associatedcm",
+    "sQuery",
+)
+
+def _compile_payload(payload: Dict[str, str], dynamic_fields) -> list:
+    """
+    Turn the payload dict into a list of pre-encoded bytes segments, with the
+    name of a dynamic field (str) wherever its value has to be substituted
+    """
+    segments = []
+    static = []
+    for i, (name, value) in enumerate(payload.items()):
+        sep = "&" if i else ""
+        if name in dynamic_fields:
+            static.append(f"{sep}{quote_plus(name)}=")
+            segments.append("".join(static).encode("ascii"))
+            segments.append(name)
+            static = []
+        else:
+            static.append(f"{sep}{quote_plus(name)}={quote_plus(value)}")
+    segments.append("".join(static).encode("ascii"))
+    return segments
+
+_PAYLOAD_SEGMENTS = _compile_payload(MARGIN_PAYLOAD, TOKEN_FIELDS + FILTER_FIELDS)
+_ENCODED_DEFAULTS = {name: quote_plus(MARGIN_PAYLOAD[name]).encode("ascii") for name in TOKEN_FIELDS + FILTER_FIELDS}
+
+def encode_margin_payload(ixhrts: str, rndaak: str, filters: Dict[str, str] = None) -> bytes:
+    """urlencoded margin request body, only the values passed in get encoded per call"""
+    encoded = dict(_ENCODED_DEFAULTS)
+    encoded["IXHRts"] = quote_plus(str(ixhrts)).encode("ascii")
+    encoded["rndaak"] = quote_plus(str(rndaak)).encode("ascii")
+    if filters:
+        for name, value in filters.items():
+            if name not in encoded:
+                raise KeyError(f"{name} is not one of FILTER_FIELDS")
+            encoded[name] = quote_plus(str(value)).encode("ascii")
+    return b"".join(seg if isinstance(seg, bytes) else encoded[seg] for seg in _PAYLOAD_SEGMENTS)
+
+def margin_filter(bpid: str = "", tm: str = "", cm: str = "") -> Dict[str, str]:
+    """Filter fields for one client code (bpid), TM / CP and CM combination"""
+    return {
+        "MCB_SearchWC_wca_bpid": bpid,
+        "MCB_SearchWC_wca_associatedtm": tm,
+        "MCB_SearchWC_wca_associatedcm": cm,
+        "sQuery": (
+            f"Client Code  Equals  {bpid or 'DFLT'} AND TM / CP  Equals  {tm or 'DFLT'} "
+            f"AND CM  Equals  {cm or 'DFLT'}"
+        ),
+    }
+
+def cookie_header(credentials: Dict[str, Any]) -> str:
+    return "; ".join(f"{name}={credentials.get(name, '')}" for name in COOKIE_NAMES)
+
+def make_mcx_margin_request(credentials: Dict[str, Any], url: str = MARGIN_URL) -> requests.Response:
     """
     Make POST request to MCX clearing margin utilization endpoint
     
     Args:
         credentials: Dictionary containing cookies and payload_tokens
+        url: margin endpoint, defaults to the live RSK335.do
         
     Returns:
         requests.Response object
     """
-    
-    # URL
-    url = "https://eclear.mcxccl.com/Bancs/RSK/RSK335.do"
-    
-    # Headers
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:143.0) Gecko/20100101 Firefox/143.0",
-        "Accept": "*/*",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate, br, zstd",
-        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-        "X-Requested-With": "XMLHttpRequest",
-        "Origin": "https://eclear.mcxccl.com",
-        "Connection": "keep-alive",
-        "Referer": "https://eclear.mcxccl.com/Bancs/RSK/RSK335.do?app=bancsapp?prefix=/RSK&page=/RSK335.do&confViewSize=22&reqType=0&mode=DEF_MODE&cParent=&parentName=blank&browserType=IE55&GuiWinName=RSK335&compname=RSK&locale=&winlocale=&over_ride_button=Cancel&AvlHt=726&AvlWd=983&tblWd=967&GuiBrowserInst=0&theme=black&confViewSize=22&pageId=RSK335&wintitle=Margin%20Utilization%20View&availHeight=820&availWidth=1067&tabid=2&tabId=panel2",
-        "Sec-Fetch-Dest": "empty",
-        "Sec-Fetch-Mode": "cors",
-        "Sec-Fetch-Site": "same-origin",
-        "Priority": "u=0"
-    }
+    headers = dict(MARGIN_HEADERS)
+    headers["Cookie"] = cookie_header(credentials)
 
-    # {
-#   "AlteonP": "BI1pZUNEqMARRScUPrUeWg$$",
-#   "JSESSIONID": "0001yM1wiYyBx6q5G7-06bIr0Ji:-O2BCN8",
-#   "TS01d67e35": "01de3801a585e35076b6512abe23204aa490f4bbb5d60985112aa78406cd4eb7c18603065166140522f684a35e427358113be816a42463d616a6466a0071d77d0f09b0a5edc3e381164c84ff1d8f3f004ac773917f",
-#   "TS254a1510027": "08f91e7fa6ab200030c0214206635d3993fbd093741a15ff485bc29a3ac7b8a2ef0cb37f10f414d4088bd9e8211130005fa88faaa026bdfbe804c77d0417ff61643ae4f4f10f85c012894b339a657ec95fd82d5e63a92e1a50701e33628801b6",
-#   "IXHRts": "1759482906778",
-#   "rndaak": "5Hg1xYyM0kH4YOnpsw96zBJey",
-#   "last_updated": "2025-10-03T14:45:09.860564Z"
-# }
-    
-    # Cookies from credentials
-    cookies = {}
-    # cookies = credentials.get("cookies", {})
-    cookies["AlteonP"] = credentials.get("AlteonP", "")
-    cookies["JSESSIONID"] = credentials.get("JSESSIONID", "")
-    cookies["TS01d67e35"] = credentials.get("TS01d67e35", "")
-    cookies["TS254a1510027"] = credentials.get("TS254a1510027", "")
-    
     # Payload tokens from credentials
-    # payload_tokens = credentials.get("payload_tokens", {})
-    # payload_tokens = {}
-    ixhrts = credentials.get("IXHRts", "")
-    rndaak = credentials.get("rndaak", "")
-    
-    # Construct payload data
-    payload = {
-        "propertyMap(MCB_SearchWC_wca_bpid_Cmb)": "DFLT",
-        "MCB_SearchWC_wca_bpid": "",
-        "propertyMap(MCB_SearchWC_wca_bpid_op)": "",
-        "MCB_SearchWC_wca_actype": "",
-        "propertyMap(MCB_SearchWC_wca_actype_op)": "",
-        "propertyMap(MCB_SearchWC_wca_associatedtm_Cmb)": "DFLT",
-        "MCB_SearchWC_wca_associatedtm": "",
-        "propertyMap(MCB_SearchWC_wca_associatedtm_op)": "",
-        "propertyMap(MCB_SearchWC_wca_associatedcm_Cmb)": "DFLT",
-        "MCB_SearchWC_wca_associatedcm": "",
-        "propertyMap(MCB_SearchWC_wca_associatedcm_op)": "",
-        "MCB_SearchWC_wca_valuedate": "",
-        "propertyMap(MCB_SearchWC_wca_valuedate_op)": "",
-        "MCB_SearchWC_wca_category": "",
-        "propertyMap(MCB_SearchWC_wca_category_op)": "",
-        "MCB_SearchWC_wca_CMName": "DFLT",
-        "propertyMap(MCB_SearchWC_wca_CMName_op)": "",
-        "MCB_SearchWC_wca_TMName": "DFLT",
-        "propertyMap(MCB_SearchWC_wca_TMName_op)": "",
-        "MCB_SearchWC_wca_datedummy1": "",
-        "propertyMap(MCB_SearchWC_wca_datedummy1_op)": "",
-        "MCB_SearchWC_wca_datedummy2": "",
-        "propertyMap(MCB_SearchWC_wca_datedummy2_op)": "",
-        "GRID_RESPONSE": "RSK335_Table",
-        "operationType": "ET",
-        "searchClicked": "true",
-        "PageNum": "0",
-        "service": "qryMarginUtilView",
-        "windowName": "RSK335",
-        "MODE": "DEF_MODE",
-        "compName": "RSK",
-        "lgbinst": "0",
-        "WRITE_APP": "true",
-        "REQ_TYPE": "0",
-        "sQuery": "Client Code  Equals  DFLT AND TM / CP  Equals  DFLT AND CM  Equals  DFLT",
-        "AvlWd": "969",
-        "tblWd": "947",
-        "MCBrowserEventInformation": "sourceElementName~|~Search#*#eventType~|~click#*#butId~|~null",
-        "IXHRts": ixhrts,  # Dynamic value from credentials
-        "XHR": "true",
-        "rndaak": rndaak,  # Dynamic value from credentials
-        "theme": "black",
-        "tabId": "panel2",
-        "mode": "DEF_MODE",
-        "GuiBrowserInst": "0",
-        "parentName": "blank",
-        "parentToChildCopyData": "",
-        "childToParentCopyData": "",
-        "parentTabId": "",
-        "childToParentJavaCopyFlag": "",
-        "openedFromBtn": "",
-        "confViewSize": "22",
-        "favouriteData": "",
-        "ExtnAttrDropDownValueDesc": "{}",
-        "ExtnRadioValues": "{}",
-        "butvalue": "",
-        "reqType": "1",
-        "childTabId": "",
-        "popupctrl": "",
-        "callPopUp": "",
-        "frombsle": "NO",
-        "fromTblBtn": "NO",
-        "functionName": "",
-        "ifCallPaint": "0",
-        "controlName": "",
-        "param": "",
-        "WindowName": "",
-        "parentSelectedRow": "",
-        "browserType": "IE55",
-        "GuiWinName": "RSK335",
-        "compname": "RSK",
-        "locale": "",
-        "winlocale": "",
-        "SortedColumnName": "",
-        "over_ride_button": "Cancel",
-        "parentToChildData": ""
-    }
+    payload = encode_margin_payload(credentials.get("IXHRts", ""), credentials.get("rndaak", ""))
     
     # Make POST request
     response = requests.post(
         url=url,
         headers=headers,
-        cookies=cookies,
         data=payload,
         verify=True  # Set to False if SSL verification fails
     )
@@ -157,7 +222,7 @@ def main():
     """Main execution function"""
     try:
         # Load credentials
-        credentials = load_credentials("credentials.json")
+        credentials = load_shared_credentials("credentials.json")
         
         # Make request
         print("Making POST request to MCX clearing...")
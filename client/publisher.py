@@ -0,0 +1,164 @@
+import gzip
+import json
+import time
+import random
+import hashlib
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class MarginPublisher:
+    """
+    POSTs margin snapshots to the remote server over one pooled keep-alive session.
+
+    - a snapshot identical to the last one the server accepted is not sent again
+    - connection errors, timeouts and 429/5xx are retried with exponential
+      backoff and full jitter, other statuses are returned as they are
+    - bodies are gzip-compressed when `compress` is set (the receiver must
+      understand Content-Encoding: gzip)
+    - with a `differ` (snapshot_diff.SnapshotDiffer) only keyframes and
+      changed fields are sent instead of the full snapshot
+    """
+
+    def __init__(self, server_url: str, timeout=DEFAULT_TIMEOUT, retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 compress: bool = False, pool_size: int = 2, differ=None):
+        self.server_url = server_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.compress = compress
+        self.differ = differ
+
+        self.sent = 0
+        self.skipped = 0
+        self.retried = 0
+        self.failed = 0
+        self.bytes_sent = 0
+
+        self._last_digest = None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Content-Type"] = "application/json"
+        if compress:
+            self.session.headers["Content-Encoding"] = "gzip"
+
+    def publish(self, data, force: bool = False):
+        """
+        Send data unless it is unchanged since the last accepted send.
+
+        Returns the final requests.Response, or None when the send was
+        skipped. Raises requests.RequestException once retries run out.
+        """
+        if self.differ is not None:
+            return self._publish_changes(data, force)
+
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        if not force and digest == self._last_digest:
+            self.skipped += 1
+            return None
+
+        if self.compress:
+            body = gzip.compress(body, compresslevel=6)
+
+        response = self._post(body)
+        if response.status_code == 200:
+            self._last_digest = digest
+            self.sent += 1
+        else:
+            self.failed += 1
+        return response
+
+    def publish_batch(self, body: bytes, idempotency_key: str, encoding: str = None):
+        """
+        POST an already encoded (and compressed with `encoding`) batch,
+        see spool.SpoolSender. Retried like publish(), returns the final
+        requests.Response, raises requests.RequestException once retries run out.
+        """
+        response = self._post(body, {"Idempotency-Key": idempotency_key, "Content-Encoding": encoding})
+        if response.status_code == 200:
+            self.sent += 1
+        else:
+            self.failed += 1
+        return response
+
+    def stats(self) -> dict:
+        stats = {
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "retried": self.retried,
+            "failed": self.failed,
+            "bytes_sent": self.bytes_sent,
+        }
+        if self.differ is not None:
+            stats.update(self.differ.stats())
+        return stats
+
+    def close(self):
+        self.session.close()
+
+    def _publish_changes(self, data, force: bool):
+        if force:
+            self.differ.reset()
+        message = self.differ.diff(data)
+        if message is None:
+            self.skipped += 1
+            return None
+
+        body = json.dumps(message, ensure_ascii=False).encode("utf-8")
+        if self.compress:
+            body = gzip.compress(body, compresslevel=6)
+
+        response = self._post(body)
+        if response.status_code == 200:
+            self.differ.commit(message)
+            self.sent += 1
+        else:
+            self.failed += 1
+        return response
+
+    def _post(self, body: bytes, headers: dict = None) -> requests.Response:
+        attempt = 0
+        while True:
+            try:
+                self.bytes_sent += len(body)
+                # a None header value drops the session's one, e.g. Content-Encoding
+                response = self.session.post(self.server_url, data=body, timeout=self.timeout, headers=headers)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    self.failed += 1
+                    raise
+
+            attempt += 1
+            self.retried += 1
+            time.sleep(self._backoff(attempt))
+
+    def _backoff(self, attempt: int) -> float:
+        # "full jitter": uniform in [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+def publisher_from_settings(settings) -> MarginPublisher:
+    """
+    MarginPublisher for SERVER_URL and the [SENDER] settings, with a
+    SnapshotDiffer when DIFF is on; shared by margin_data_sender.py, the
+    supervisor and the proxy's pipeline so they all send the same way
+    """
+    differ = None
+    if settings.sender_diff:
+        from client.snapshot_diff import SnapshotDiffer
+        differ = SnapshotDiffer(settings.sender_keyframe_interval, settings.sender_diff_abs_threshold,
+                                settings.sender_diff_rel_threshold)
+    return MarginPublisher(settings.server_url, timeout=(3.05, settings.sender_timeout),
+                           retries=settings.sender_retries, compress=settings.sender_gzip, differ=differ)
@@ -0,0 +1,293 @@
+import os
+import sys
+import time
+import threading
+from datetime import datetime
+
+import requests
+
+CLIENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if __name__ == "__main__":
+    # run as a script: put the repo root on sys.path for the package imports below
+    sys.path.insert(0, os.path.normpath(os.path.join(CLIENT_DIR, '..')))
+
+from client.keepalive import is_expired
+from parser.margin_columns import parse_number
+from parser.rsk335_stream import extract_margin_table
+from proxy.capture_handoff import CaptureHandoffReader
+from proxy.settings import open_settings
+
+CONFIG_FILE_PATH = os.path.join(CLIENT_DIR, '..', 'config', 'config.ini')
+CREDENTIALS_FILE = os.path.normpath(os.path.join(CLIENT_DIR, '..', 'config', 'credentials.json'))
+HANDOFF_FILE = os.path.normpath(os.path.join(CLIENT_DIR, '..', 'calls', 'browser-calls', 'handoff.shm'))
+
+WEEKDAYS = ("MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN")
+
+# how often the loop looks at the credentials and the handoff, at most this long asleep
+POLL_INTERVAL = 1.0
+# a long wait is cut at this, so a session opening is not slept through
+MAX_SLEEP = 60.0
+# weight of the newest sample in the smoothed rate of change and response time
+RATE_ALPHA = 0.5
+LATENCY_ALPHA = 0.3
+# quiet values let the interval grow by at most this factor per poll
+MAX_GROWTH = 2.0
+# a response, and the smoothed response time, this many times the fastest one seen mean the server is struggling
+SLOW_FACTOR = 3.0
+# the backoff factor doubles per struggling response up to this
+MAX_BACKOFF = 8.0
+BACKOFF_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_sessions(value: str) -> list:
+    """'09:00-17:00, 17:00-23:55' -> [(540, 1020), (1020, 1435)] in minutes of the day"""
+    sessions = []
+    for part in value.replace("\n", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, end = (datetime.strptime(t.strip(), "%H:%M") for t in part.split("-"))
+        sessions.append((start.hour * 60 + start.minute, end.hour * 60 + end.minute))
+    return sessions
+
+
+def parse_days(value: str) -> frozenset:
+    """'MON,TUE' -> frozenset({0, 1}), datetime.weekday() numbers"""
+    return frozenset(WEEKDAYS.index(day.strip().upper()[:3]) for day in value.split(",") if day.strip())
+
+
+def change_rate(old: dict, new: dict, seconds: float) -> float:
+    """Largest relative change per second over the numeric fields both snapshots have"""
+    if seconds <= 0:
+        return 0.0
+    rate = 0.0
+    for name, text in new.items():
+        if name not in old:
+            continue
+        before, after = parse_number(old[name]), parse_number(text)
+        if before is None or after is None:
+            continue
+        rate = max(rate, abs(after - before) / max(abs(before), 1.0) / seconds)
+    return rate
+
+
+class RefreshScheduler:
+    """
+    Requests the margin view through the proxy, as often as the values
+    call for.
+
+    - in a trading session, the interval is the one at which the fastest
+      moving numeric field changes by about `target_change` (relative)
+      between two polls, from a smoothed rate of change; when values go
+      quiet it grows by at most MAX_GROWTH per poll up to `session_interval`
+    - outside `sessions` on `days` (local time) it is `off_session_interval`
+    - 429/5xx, errors and responses SLOW_FACTOR times slower than the
+      fastest seen double a backoff factor (up to MAX_BACKOFF), healthy
+      ones halve it again; Retry-After is honoured
+    - whatever happens, the interval stays within [min_interval, max_interval]
+    - a capture the proxy recorded from the browser (the refresher) counts
+      as a poll, so the next one is not due before the interval has passed
+      since it
+    - a dead session gets no requests until the credentials show a new login
+    """
+
+    def __init__(self, fetcher, load_credentials, margin_url: str = None, min_interval: float = 10,
+                 max_interval: float = 1800, session_interval: float = 60, off_session_interval: float = 1800,
+                 target_change: float = 0.005, sessions=((540, 1435),), days=frozenset(range(5)),
+                 handoff: CaptureHandoffReader = None, clock=time.time):
+        self.fetcher = fetcher
+        self.load_credentials = load_credentials
+        self.margin_url = margin_url
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.session_interval = session_interval
+        self.off_session_interval = off_session_interval
+        self.target_change = target_change
+        self.sessions = list(sessions)
+        self.days = days
+        self.handoff = handoff
+        self.clock = clock
+
+        self.alive = None
+        self.rate = 0.0               # smoothed relative change per second
+        self.latency = None           # smoothed response time
+        self.fastest = None
+        self.backoff = 1.0
+        self.last_poll = None         # our last request, or the last browser capture after it
+        self.snapshot = None
+        self.snapshot_at = None
+
+        self.polls = 0
+        self.browser_captures = 0
+        self.backoffs = 0
+        self.expiries = 0
+        self.errors = 0
+        self.parse_misses = 0
+
+        self._adaptive = session_interval
+        self._not_before = 0.0
+        self._session_key = None
+        self._seen_seq = None
+        self._stop = threading.Event()
+
+    def in_session(self, now: float) -> bool:
+        local = datetime.fromtimestamp(now)
+        if local.weekday() not in self.days:
+            return False
+        minute = local.hour * 60 + local.minute
+        return any(start <= minute < end for start, end in self.sessions)
+
+    def interval(self, now: float) -> float:
+        base = self._adaptive if self.in_session(now) else self.off_session_interval
+        return min(max(base * self.backoff, self.min_interval), self.max_interval)
+
+    def step(self) -> float:
+        """Poll if one is due, returns the seconds until one may be due"""
+        now = self.clock()
+        try:
+            credentials = self.load_credentials()
+        except (OSError, ValueError) as e:
+            print(f"[Refresh] Could not load credentials: {e}")
+            return POLL_INTERVAL
+
+        key = (credentials.get("JSESSIONID", ""), credentials.get("AlteonP", ""))
+        if key != self._session_key:
+            if self._session_key is not None and self.alive is False:
+                print("[Refresh] New session in the credentials, resuming.")
+                self.alive = None
+            self._session_key = key
+        if self.alive is False or not credentials.get("JSESSIONID"):
+            return POLL_INTERVAL
+
+        captured = self.handoff.read("response") if self.handoff is not None else None
+        if captured is not None and captured.seq != self._seen_seq:
+            # a capture we did not request: the browser loaded the page
+            self._seen_seq = captured.seq
+            self.browser_captures += 1
+            self.last_poll = max(self.last_poll or 0.0, captured.timestamp)
+
+        due = max(self.last_poll + self.interval(now) if self.last_poll is not None else now, self._not_before)
+        if now >= due:
+            self.poll(credentials, now)
+            if self.handoff is not None:
+                # the proxy records our response before handing it back
+                captured = self.handoff.read("response")
+                self._seen_seq = captured.seq if captured is not None else None
+            due = max(now + self.interval(now), self._not_before)
+        return min(max(due - now, 0.0), MAX_SLEEP if self.handoff is None else POLL_INTERVAL)
+
+    def poll(self, credentials: dict, now: float):
+        self.polls += 1
+        self.last_poll = now
+        try:
+            response = self.fetcher.fetch(credentials, url=self.margin_url)
+        except requests.RequestException as e:
+            self.errors += 1
+            self._back_off(True)
+            print(f"[Refresh] Margin request failed: {e}")
+            return
+
+        if is_expired(response, read_body=True):
+            self.expiries += 1
+            self.alive = False
+            print("[Refresh] Session expired, waiting for a new login.")
+            return
+        self.alive = True
+
+        if response.status_code != 200:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                self._not_before = now + min(float(retry_after), self.max_interval)
+            self._back_off(response.status_code in BACKOFF_STATUSES)
+            print(f"[Refresh] eclear answered {response.status_code}, interval {self.interval(now):.0f}s")
+            return
+
+        elapsed = response.elapsed.total_seconds()
+        self.fastest = elapsed if self.fastest is None else min(self.fastest, elapsed)
+        self.latency = elapsed if self.latency is None else LATENCY_ALPHA * elapsed + (1 - LATENCY_ALPHA) * self.latency
+        # both: one slow response is noise, and after a long backoff the average is stale
+        slow = SLOW_FACTOR * max(self.fastest, 0.05)
+        self._back_off(elapsed > slow and self.latency > slow)
+
+        table = extract_margin_table(response.content)
+        if table:
+            if self.snapshot is not None:
+                rate = change_rate(self.snapshot, table, now - self.snapshot_at)
+                self.rate = RATE_ALPHA * rate + (1 - RATE_ALPHA) * self.rate
+            self.snapshot, self.snapshot_at = table, now
+            wanted = self.target_change / self.rate if self.rate > 0 else self.session_interval
+            self._adaptive = min(wanted, self._adaptive * MAX_GROWTH, self.session_interval)
+        else:
+            # maintenance or error page, a partial render: the session is still alive
+            self.parse_misses += 1
+            print("[Refresh] No RSK335_Table in the margin response, keeping the last snapshot.")
+
+    def run(self):
+        print(f"[Refresh] Polling {self.margin_url}, {self.min_interval:.0f}..{self.max_interval:.0f}s")
+        while not self._stop.is_set():
+            self._stop.wait(self.step())
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        now = self.clock()
+        return {
+            "alive": self.alive,
+            "interval": round(self.interval(now), 1),
+            "rate": self.rate,
+            "backoff": self.backoff,
+            "polls": self.polls,
+            "browser_captures": self.browser_captures,
+            "backoffs": self.backoffs,
+            "expiries": self.expiries,
+            "errors": self.errors,
+            "parse_misses": self.parse_misses,
+        }
+
+    def _back_off(self, struggling: bool):
+        if struggling:
+            self.backoffs += 1
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+        else:
+            self.backoff = max(self.backoff / 2, 1.0)
+
+
+def build_scheduler(settings):
+    """RefreshScheduler for the [REFRESH] settings, talking to eclear through the proxy"""
+    from client.margin_fetcher import MarginFetcher
+    from client.mcx_client import MARGIN_URL, load_shared_credentials
+
+    proxies = {"http": settings.refresh_proxy, "https": settings.refresh_proxy} if settings.refresh_proxy else None
+    fetcher = MarginFetcher(url=settings.margin_url or MARGIN_URL, max_workers=1, rate_per_host=1.0,
+                            verify=settings.refresh_verify, proxies=proxies,
+                            auto_capture_flag=settings.auto_capture_flag if proxies else "")
+
+    return RefreshScheduler(
+        fetcher,
+        lambda: load_shared_credentials(CREDENTIALS_FILE),
+        margin_url=settings.margin_url or MARGIN_URL,
+        min_interval=settings.refresh_min_interval,
+        max_interval=settings.refresh_max_interval,
+        session_interval=settings.refresh_session_interval,
+        off_session_interval=settings.refresh_off_session_interval,
+        target_change=settings.refresh_target_change,
+        sessions=parse_sessions(settings.refresh_sessions),
+        days=parse_days(settings.refresh_days),
+        handoff=CaptureHandoffReader(HANDOFF_FILE),
+    )
+
+
+if __name__ == '__main__':
+    settings = open_settings(CONFIG_FILE_PATH).get()
+    if not settings.mtime_ns:
+        print(f"ERROR: Could not read configuration file at: {settings.path}")
+
+    scheduler = build_scheduler(settings)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print("\nRefresh scheduler stopped by user.")
+    finally:
+        print(f"Refresh stats: {scheduler.stats()}")
+        scheduler.fetcher.close()
@@ -0,0 +1,86 @@
+import time
+
+from parser.margin_columns import parse_number
+
+
+class SnapshotDiffer:
+    """
+    Turns full margin snapshots into change-only messages.
+
+        {"type": "keyframe", "seq": 7, "data": {...every field...}}
+        {"type": "delta", "seq": 8, "base": 7, "changed": {...changed fields...}}
+
+    Deltas are computed against the last snapshot the server accepted
+    (see commit()), so a failed send is folded into the next one. A delta's
+    `base` is the seq of the previous accepted message; a receiver that
+    missed it should ignore deltas until the next keyframe, which is sent
+    every `keyframe_interval` seconds and whenever the set of fields changes.
+
+    Numeric cells ('1,23,45,678.50') only count as changed when they moved
+    by more than `abs_threshold` and more than `rel_threshold` times the
+    published value.
+    """
+
+    def __init__(self, keyframe_interval: float = 300.0, abs_threshold: float = 0.0,
+                 rel_threshold: float = 0.0):
+        self.keyframe_interval = keyframe_interval
+        self.abs_threshold = abs_threshold
+        self.rel_threshold = rel_threshold
+
+        self.keyframes = 0
+        self.deltas = 0
+        self.unchanged = 0
+
+        self._published = None   # last accepted snapshot
+        self._seq = 0
+        self._last_keyframe = 0.0
+
+    def diff(self, snapshot: dict, now: float = None):
+        """The message to send for `snapshot`, None if nothing worth sending changed"""
+        now = time.monotonic() if now is None else now
+        seq = self._seq + 1
+
+        if (self._published is None
+                or snapshot.keys() != self._published.keys()
+                or now - self._last_keyframe >= self.keyframe_interval):
+            return {"type": "keyframe", "seq": seq, "data": dict(snapshot)}
+
+        changed = {
+            field: value for field, value in snapshot.items()
+            if self._changed(self._published[field], value)
+        }
+        if not changed:
+            self.unchanged += 1
+            return None
+        return {"type": "delta", "seq": seq, "base": self._seq, "changed": changed}
+
+    def commit(self, message: dict, now: float = None):
+        """Record `message` as accepted by the server"""
+        now = time.monotonic() if now is None else now
+        self._seq = message["seq"]
+        if message["type"] == "keyframe":
+            self._published = dict(message["data"])
+            self._last_keyframe = now
+            self.keyframes += 1
+        else:
+            self._published.update(message["changed"])
+            self.deltas += 1
+
+    def reset(self):
+        """Force a keyframe next time, e.g. after the receiver restarted"""
+        self._published = None
+
+    def stats(self) -> dict:
+        return {"keyframes": self.keyframes, "deltas": self.deltas, "unchanged": self.unchanged}
+
+    def _changed(self, old, new) -> bool:
+        if old == new:
+            return False
+        if not isinstance(old, str) or not isinstance(new, str):
+            return True
+
+        old_num, new_num = parse_number(old), parse_number(new)
+        if old_num is None or new_num is None:
+            return True
+        moved = abs(new_num - old_num)
+        return moved > self.abs_threshold and moved > self.rel_threshold * abs(old_num)
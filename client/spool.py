@@ -0,0 +1,382 @@
+import os
+import gzip
+import json
+import time
+import uuid
+import zlib
+import struct
+import logging
+
+CLIENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+from proxy.capture_handoff import replace_file
+
+log = logging.getLogger(__name__)
+
+SPOOL_DIR = os.path.normpath(os.path.join(CLIENT_DIR, '..', 'calls', 'sender-spool'))
+
+# record: body length (I) | crc32 of the body (I) | seq (Q) | timestamp (d) | body
+RECORD = struct.Struct("<IIQd")
+SEGMENT_SUFFIX = ".log"
+SEGMENT_BYTES = 4 * 1024 * 1024
+MAX_BYTES = 256 * 1024 * 1024
+
+ENCODINGS = ("zstd", "gzip", "none")
+# the server refuses something in the batch, not the endpoint: split it down to the record
+RECORD_STATUSES = (413, 422)
+
+
+class SnapshotSpool:
+    """
+    Append-only on-disk queue of snapshots waiting for the server.
+
+    Records go into segment files named after the seq of their first
+    record, a new one every `segment_bytes`. The seq the server last
+    acknowledged is kept in `acked`, replaced atomically; segments holding
+    only acknowledged records are deleted. A record cut short at the end of
+    the last segment (power lost mid-append) is truncated away on open.
+    Past `max_bytes` the oldest segments are dropped, oldest snapshots first.
+    """
+
+    def __init__(self, directory: str = SPOOL_DIR, segment_bytes: int = SEGMENT_BYTES,
+                 max_bytes: int = MAX_BYTES, fsync: bool = True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.dropped = 0
+        self.rejected = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self.spool_id = self._read_id()
+        self.acked = self._read_acked()
+        self._segments = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                                if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+        self.next_seq = self._recover()
+        self._bytes = sum(os.path.getsize(self._path(first)) for first in self._segments)
+        self._cursor = None   # (segment, offset) of the first record after acked, found on the next read
+        self._ends = {}       # seq -> (segment, offset after it), of the records the last read() returned
+        self._file = None
+
+    @property
+    def backlog(self) -> int:
+        return self.next_seq - 1 - self.acked
+
+    def append(self, body: bytes, timestamp: float = None) -> int:
+        """Store body (a JSON snapshot), returns its seq"""
+        if self._file is None or self._file.tell() >= self.segment_bytes:
+            self._roll()
+        seq = self.next_seq
+        timestamp = time.time() if timestamp is None else timestamp
+        self._file.write(RECORD.pack(len(body), zlib.crc32(body), seq, timestamp) + body)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.next_seq += 1
+        self._bytes += RECORD.size + len(body)
+        self._enforce_limit()
+        return seq
+
+    def read(self, max_records: int = 500, max_bytes: int = 1024 * 1024) -> list:
+        """Oldest unacknowledged records as (seq, timestamp, body), at least one if there is any"""
+        records = []
+        self._ends = {}
+        if not self.backlog:
+            return records
+        if self._cursor is None:
+            self._cursor = self._seek(self.acked + 1)
+
+        segment, offset = self._cursor
+        size = 0
+        for first in self._segments[self._segments.index(segment):]:
+            with open(self._path(first), "rb") as f:
+                f.seek(offset if first == segment else 0)
+                while len(records) < max_records:
+                    header = f.read(RECORD.size)
+                    if len(header) < RECORD.size:
+                        break
+                    length, crc, seq, timestamp = RECORD.unpack(header)
+                    body = f.read(length)
+                    if len(body) < length:
+                        break
+                    if records and size + length > max_bytes:
+                        return records
+                    records.append((seq, timestamp, body))
+                    self._ends[seq] = (first, f.tell())
+                    size += length
+            if len(records) >= max_records:
+                break
+        return records
+
+    def ack(self, seq: int):
+        """The server has every record up to seq"""
+        if seq <= self.acked:
+            return
+        self._cursor = self._ends.get(seq)
+        self._ends = {}
+        self.acked = seq
+        replace_file(os.path.join(self.directory, "acked"), str(seq).encode("ascii"))
+
+        # segments whose records are all acknowledged, the current one is kept for appends
+        while len(self._segments) > 1 and self._segments[1] <= seq + 1:
+            self._remove(self._segments.pop(0))
+        if self._cursor is not None and self._cursor[0] not in self._segments:
+            self._cursor = None
+
+    def reject(self, record, status: int):
+        """
+        Set aside a record the server refuses for good in rejected.jsonl, with
+        the status it got, and acknowledge it so the records behind it go out
+        """
+        seq, timestamp, body = record
+        with open(os.path.join(self.directory, "rejected.jsonl"), "ab") as f:
+            f.write(b'{"seq": %d, "ts": %.3f, "status": %d, "data": %s}\n' % (seq, timestamp, status, body))
+        self.rejected += 1
+        log.warning(f"[Spool] Server refused snapshot {seq} with {status}, moved to rejected.jsonl")
+        self.ack(seq)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> dict:
+        return {
+            "backlog": self.backlog,
+            "acked": self.acked,
+            "segments": len(self._segments),
+            "bytes": self._bytes,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
+
+    def _path(self, first: int) -> str:
+        return os.path.join(self.directory, f"{first:020d}{SEGMENT_SUFFIX}")
+
+    def _read_id(self) -> str:
+        path = os.path.join(self.directory, "id")
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            spool_id = uuid.uuid4().hex
+            replace_file(path, spool_id.encode("ascii"))
+            return spool_id
+
+    def _read_acked(self) -> int:
+        try:
+            with open(os.path.join(self.directory, "acked"), "r", encoding="ascii") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _recover(self) -> int:
+        """Next seq to append, cutting a torn record off the end of the last segment"""
+        if not self._segments:
+            return self.acked + 1
+        last = self._segments[-1]
+        seq, good = last, 0
+        with open(self._path(last), "r+b") as f:
+            while True:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    break
+                length, crc, record_seq, _ = RECORD.unpack(header)
+                body = f.read(length)
+                if len(body) < length or zlib.crc32(body) != crc:
+                    break
+                seq, good = record_seq + 1, f.tell()
+            if good != os.fstat(f.fileno()).st_size:
+                log.warning(f"[Spool] Truncating a torn record at the end of {self._path(last)}")
+                f.truncate(good)
+        return max(seq, self.acked + 1)
+
+    def _seek(self, seq: int):
+        """(segment, offset) of record seq, or of the end of the spool"""
+        segment = self._segments[0]
+        for first in self._segments:
+            if first <= seq:
+                segment = first
+        with open(self._path(segment), "rb") as f:
+            offset = 0
+            while True:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return segment, offset
+                length, _, record_seq, _ = RECORD.unpack(header)
+                if record_seq >= seq:
+                    return segment, offset
+                f.seek(length, os.SEEK_CUR)
+                offset = f.tell()
+
+    def _roll(self):
+        if self._file is not None:
+            self._file.close()
+        if not self._segments or os.path.getsize(self._path(self._segments[-1])) >= self.segment_bytes:
+            self._segments.append(self.next_seq)
+        self._file = open(self._path(self._segments[-1]), "ab")
+
+    def _enforce_limit(self):
+        while self._bytes > self.max_bytes and len(self._segments) > 1:
+            first = self._segments.pop(0)
+            lost_until = self._segments[0] - 1
+            if lost_until > self.acked:
+                self.dropped += lost_until - self.acked
+                log.warning(f"[Spool] Spool full, dropped snapshots up to {lost_until}")
+                self.acked = lost_until
+                replace_file(os.path.join(self.directory, "acked"), str(lost_until).encode("ascii"))
+            self._remove(first)
+            self._cursor = None
+
+    def _remove(self, first: int):
+        try:
+            self._bytes -= os.path.getsize(self._path(first))
+            os.remove(self._path(first))
+        except OSError as e:
+            log.error(f"[Spool] Could not remove {self._path(first)}: {e}")
+
+
+def encode_batch(spool_id: str, records: list) -> bytes:
+    """
+    {"type": "batch", "spool": ..., "items": [{"key": "<spool>-<seq>", "seq": 7, "ts": ..., "data": {...}}]}
+    assembled from the stored JSON without parsing it again
+    """
+    items = b",".join(b'{"key": "%s-%d", "seq": %d, "ts": %.3f, "data": %s}'
+                      % (spool_id.encode("ascii"), seq, seq, ts, body) for seq, ts, body in records)
+    return b'{"type": "batch", "spool": "%s", "items": [%s]}' % (spool_id.encode("ascii"), items)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+class SpoolSender:
+    """
+    At-least-once delivery of margin snapshots through a SnapshotSpool.
+
+    offer() spools a snapshot unless it is the same as the last one
+    offered; drain() POSTs the backlog oldest first, up to `batch_records`
+    records or `batch_bytes` per request, compressed with `encoding`, and
+    acknowledges a batch only when the server answered 200. Each item
+    carries an idempotency key (spool id and seq) and each request an
+    Idempotency-Key header for its seq range, so the receiver can drop what
+    it already has after a retry. `max_rate` caps the drain at that many
+    bytes per second on the wire, 0 = no cap.
+
+    A 413 or 422 halves the batch and sends again, down to a single record,
+    which is then set aside with SnapshotSpool.reject() before going back
+    to `batch_records`. A 400 is split the same way, but a single record is
+    only rejected once a smaller batch got a 200 in the same drain, so a
+    server that does not take batches at all never empties the spool. A
+    batch size that got past a 413 is kept. Any other answer, 404, 410 or
+    a 5xx, leaves the batch at the head of the spool until the next drain.
+    """
+
+    def __init__(self, spool: SnapshotSpool, publisher, batch_records: int = 500,
+                 batch_bytes: int = 1024 * 1024, max_rate: float = 0, encoding: str = "zstd"):
+        self.spool = spool
+        self.publisher = publisher
+        self.batch_records = batch_records
+        self.batch_bytes = batch_bytes
+        self.max_rate = max_rate
+        self.encoding = encoding
+
+        self.batches = 0
+        self.delivered = 0
+        self.bytes_sent = 0
+        self._last_body = None
+        self._limit = batch_records   # records per batch, lowered by 400/413/422 answers
+
+    def offer(self, data: dict, timestamp: float = None):
+        """Spool data, returns its seq, None when it is unchanged"""
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if body == self._last_body:
+            return None
+        self._last_body = body
+        return self.spool.append(body, timestamp)
+
+    def drain(self, deadline: float = None) -> int:
+        """
+        Send the backlog until it is empty, a request fails, or time.monotonic()
+        passes deadline; returns the number of records delivered.
+        Raises requests.RequestException when the server cannot be reached.
+        """
+        delivered = 0
+        refused = 0   # size of the first batch refused with a 400 in this drain
+        accepted = False   # a smaller batch got a 200 after it, the batch format is fine
+        while self.spool.backlog:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            records = self.spool.read(self._limit, self.batch_bytes)
+            if not records:
+                break
+            first, last = records[0][0], records[-1][0]
+            body = compress(encode_batch(self.spool.spool_id, records), self.encoding)
+
+            start = time.monotonic()
+            response = self.publisher.publish_batch(body, f"{self.spool.spool_id}-{first}-{last}",
+                                                    None if self.encoding == "none" else self.encoding)
+            status = response.status_code
+            if status in RECORD_STATUSES or status == 400:
+                if status == 400 and not refused:
+                    refused = len(records)
+                if len(records) > 1:
+                    # narrow it down to the record the server will not take
+                    self._limit = len(records) // 2
+                    log.info(f"[Spool] Server returned {status} for {first}..{last}, "
+                             f"sending batches of {self._limit}")
+                    continue
+                if status == 400 and not accepted:
+                    # not even one record gets through, more likely the endpoint than the data
+                    log.warning(f"[Spool] Server returned 400 for snapshot {first} and every smaller batch, "
+                                f"keeping them")
+                    self._limit = self.batch_records
+                    break
+                self.spool.reject(records[0], status)
+                self._limit = self.batch_records
+                continue
+            if status != 200:
+                log.warning(f"[Spool] Server returned {status} for {first}..{last}, keeping them")
+                break
+            if refused and len(records) < refused:
+                accepted = True
+            self.spool.ack(last)
+            self.batches += 1
+            self.bytes_sent += len(body)
+            delivered += len(records)
+
+            if self.max_rate > 0:
+                pause = len(body) / self.max_rate - (time.monotonic() - start)
+                if pause > 0:
+                    time.sleep(pause)
+        self.delivered += delivered
+        return delivered
+
+    def stats(self) -> dict:
+        stats = {"batches": self.batches, "delivered": self.delivered, "bytes_sent": self.bytes_sent}
+        stats.update(self.spool.stats())
+        return stats
+
+    def close(self):
+        self.spool.close()
+        self.publisher.close()
+
+
+def open_spool_sender(settings, publisher, directory: str = SPOOL_DIR) -> SpoolSender:
+    """SpoolSender for the [SENDER] settings, posting through publisher"""
+    encoding = settings.sender_spool_compression
+    if encoding not in ENCODINGS:
+        log.warning(f"[Spool] Unknown SPOOL_COMPRESSION {encoding!r}, using zstd")
+        encoding = "zstd"
+    if settings.sender_diff:
+        # compressing a whole batch already removes what repeats between snapshots
+        log.warning("[Spool] DIFF does not apply to spooled sends, every snapshot is sent whole")
+    spool = SnapshotSpool(directory, max_bytes=settings.sender_spool_max_mb * 1024 * 1024)
+    return SpoolSender(spool, publisher, batch_records=settings.sender_batch_records,
+                       batch_bytes=settings.sender_batch_kb * 1024, max_rate=settings.sender_max_kbps * 1024,
+                       encoding=encoding)
@@ -1,51 +1,63 @@
 import os
-import re
 import json
+import time
 import threading
-import tempfile
-import configparser
 from mitmproxy import http
 from datetime import datetime
-from urllib.parse import parse_qs
-import configparser
-import time
-import random
+
+from proxy.capture_handoff import CaptureHandoffWriter, replace_file
+from proxy.capture_store import CaptureStore
+from proxy.credential_store import CredentialStore
+from proxy.credential_writer import CredentialWriter
+from proxy.filter_classifier import FilterClassifier
+from proxy.flow_body import content_encoding, decoded_body
+from proxy.flow_classifier import MARGIN, NOT_TARGET, FlowClassifier
+from proxy.log import get_logger, set_level, setup_logging, stop_logging
+from proxy.metrics import Metrics, MetricsServer, StatsDumper
+from proxy.payload_template import PayloadTemplate
+from proxy.settings import open_settings
+from proxy.token_extractor import (
+    extract_request_tokens,
+    extract_response_tokens,
+    parse_cookie_header,
+    parse_set_cookie_headers,
+)
+
+log = get_logger("proxy")
 
 CURR_DIR = os.path.dirname(os.path.abspath(__file__))
 
 CONFIG_DIR = os.path.join(CURR_DIR, '.', 'config')
 CONFIG_FILE_PATH = os.path.join(CONFIG_DIR, 'config.ini')
 
-config = configparser.ConfigParser()
-read_files = config.read(CONFIG_FILE_PATH)
-
-if not read_files:
-    print(f"ERROR: Could not read configuration file at: {CONFIG_FILE_PATH}")
-
 # ----------------- CONFIG -----------------
-TARGET_HOST = config['CREDENTIALS']['TARGET_HOST']
-MONITORED_URL = config['CREDENTIALS']['MONITORED_URL']
-MARGIN_URL  = config['CREDENTIALS']['MARGIN_URL']
+# parsed on first use, and again whenever config.ini is edited (see _check_settings)
+SETTINGS = open_settings(CONFIG_FILE_PATH)
 
 CREDENTIALS_FILE  = os.path.join(CONFIG_DIR, 'credentials.json')
+SHARED_CREDENTIALS_FILE = os.path.join(CONFIG_DIR, 'credentials.shm')
 
 BROWSER_REQUEST_DIR = os.path.join(CURR_DIR, './calls', 'browser-calls', 'requests')
 BROWSER_RESPONSE_DIR = os.path.join(CURR_DIR, './calls', 'browser-calls', 'responses')
 
 MARGIN_REQUEST_FILE = os.path.join(BROWSER_REQUEST_DIR, "curr_request.txt")
 MARGIN_RESPONSE_FILE = os.path.join(BROWSER_RESPONSE_DIR, "curr_response.txt")
+# seq, size and time of the capture in each curr_*.txt, polled by the parser
+CAPTURE_HANDOFF_FILE = os.path.join(CURR_DIR, './calls', 'browser-calls', 'handoff.shm')
 
-PREV_MARGIN_REQUEST_FILE = os.path.join(BROWSER_REQUEST_DIR, "prev_request.txt")
-PREV_MARGIN_RESPONSE_FILE = os.path.join(BROWSER_RESPONSE_DIR, "prev_response.txt")
-
-os.makedirs(BROWSER_REQUEST_DIR, exist_ok=True)
-os.makedirs(BROWSER_RESPONSE_DIR, exist_ok=True)
+# history of recorded margin flows, see `python -m proxy.capture_store list`
+CAPTURE_DIR = os.path.join(CURR_DIR, './calls', 'captures')
 
-config = configparser.RawConfigParser()
-config.read(CONFIG_FILE_PATH)
+# written by the in-process pipeline when [PIPELINE] WRITE_FILES is on
+MARGIN_VIEW_FILE = os.path.join(CURR_DIR, 'parser', 'margin-utilization-view.json')
+MARGIN_HISTORY_FILE = os.path.join(CURR_DIR, 'parser', 'margin-history.sqlite3')
 
-DEFAULT_MARGIN_PAYLOAD_TEMPLATE = config["DEFAULTS"]["DEFAULT_MARGIN_PAYLOAD_TEMPLATE"]
-AUTO_CAPTURE_FLAG = config["DEFAULTS"]["AUTO_CAPTURE_FLAG"]
+METRICS = Metrics("mcx_proxy")
+METRICS.describe("hook_seconds", "Time spent in the request/response hooks, all flows", label="hook")
+METRICS.describe("step_seconds", "Time spent in each step of the hooks", label="step")
+METRICS.describe("flows_total", "Flows by what the addon did with them", label="event")
+METRICS.describe("captures_total", "Margin requests/responses added to the capture ring", label="kind")
+METRICS.describe("credential_changes_total", "Token/cookie updates that changed the credentials", label="source")
 
 _lock = threading.Lock()
 
@@ -65,229 +77,292 @@ DFLT_CHECK_FIELDS = [
     "MCB_SearchWC_wca_TMName",
 ]
 
+DEFAULT_SQUERY = "Client Code  Equals  DFLT AND TM / CP  Equals  DFLT AND CM  Equals  DFLT"
+
 
 # ----------------- UTILITIES -----------------
-def _save_credentials(creds: dict):
-    """Write latest tokens to credentials.json atomically"""
-    # always refresh last_updated on save
-    creds["last_updated"] = datetime.now().isoformat() + "Z"
+# credentials.json is written off the hook path, at most once per interval
+CREDENTIALS_WRITE_INTERVAL = 1.0
+
+_credential_writer = CredentialWriter(CREDENTIALS_FILE, min_interval=CREDENTIALS_WRITE_INTERVAL)
 
-    fd, tmp = tempfile.mkstemp(dir=CONFIG_DIR)
+
+def _save_credentials(creds):
+    """Queue latest tokens for an atomic write to credentials.json"""
+    _credential_writer.submit(creds)
+
+
+def _load_saved_credentials() -> dict:
+    """Tokens persisted by a previous run, so a restart starts from them"""
     try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(creds, f, indent=2)
-        os.replace(tmp, CREDENTIALS_FILE)
-    finally:
-        if os.path.exists(tmp):
-            try:
-                os.remove(tmp)
-            except Exception:
-                pass
+        with open(CREDENTIALS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
 
 
 
 # ----------------- MAIN ADDON -----------------
 class StatefulCredentialsProxy:
     def __init__(self):
+        settings = SETTINGS.get()
+
+        # hooks only queue log records, the stdout writes happen on a background thread
+        setup_logging(settings.log_level)
+        if not settings.mtime_ns:
+            log.error(f"Could not read configuration file at: {CONFIG_FILE_PATH}")
+
+        os.makedirs(BROWSER_REQUEST_DIR, exist_ok=True)
+        os.makedirs(BROWSER_RESPONSE_DIR, exist_ok=True)
+
         self.lock = _lock
-        self.credentials = {}
+        # hooks read lock-free snapshots, sibling processes read credentials.shm
+        self.store = CredentialStore(_load_saved_credentials(), shared_path=SHARED_CREDENTIALS_FILE)
+
+        self.filter_classifier = FilterClassifier(EMPTY_CHECK_FIELDS, DFLT_CHECK_FIELDS, DEFAULT_SQUERY)
+        # the flow classifier and the payload template follow config.ini edits
+        self._apply_settings(settings)
+
+        self.captures = CaptureStore(CAPTURE_DIR, slots=settings.capture_slots, level=settings.capture_level)
+        self.capture_store_raw = settings.capture_store_raw
+        self._current = {}   # kind -> Capture in curr_*.txt
+        try:
+            self.handoff = CaptureHandoffWriter(CAPTURE_HANDOFF_FILE)
+        except OSError as e:
+            log.warning(f"[Proxy] Capture handoff disabled, could not map {CAPTURE_HANDOFF_FILE}: {e}")
+            self.handoff = None
+
+        self.pipeline = None
+        self.pipeline_write_files = settings.pipeline_write_files
+        if settings.pipeline_enabled:
+            # requests and the parser are only imported when the pipeline is on
+            from client.publisher import publisher_from_settings
+            from parser.margin_history import MarginHistory
+            from proxy.pipeline import MarginPipeline
+
+            self.pipeline = MarginPipeline(
+                settings.server_url,
+                # the same [SENDER] settings as margin_data_sender.py and the supervisor
+                publisher_from_settings(settings),
+                workers=settings.pipeline_workers,
+                maxsize=settings.pipeline_queue_size,
+                output_path=MARGIN_VIEW_FILE if settings.pipeline_write_files else None,
+                history=MarginHistory(MARGIN_HISTORY_FILE) if settings.pipeline_write_files else None,
+            )
+
+        # Prometheus text on http://HOST:PORT/metrics (0 = off),
+        # and/or a stats line in the log every DUMP_INTERVAL seconds (0 = off)
+        self.metrics_server = None
+        host, port = settings.metrics_host, settings.metrics_port
+        if port:
+            try:
+                self.metrics_server = MetricsServer(METRICS, host, port).start()
+                log.info(f"[Proxy] metrics on http://{host}:{port}/metrics")
+            except OSError as e:
+                log.error(f"[Proxy] Could not start metrics endpoint on {host}:{port}: {e}")
+
+        self.stats_dumper = None
+        if settings.metrics_dump_interval > 0:
+            self.stats_dumper = StatsDumper(METRICS, settings.metrics_dump_interval, log).start()
+
+    def _apply_settings(self, settings):
+        """
+        Take over what can change without a restart: target hosts and URLs,
+        the auto-capture flag and payload template, and the log level.
+        Capture, pipeline and metrics settings are read once at startup.
+        """
+        # an unknown level is logged and the current one kept
+        set_level(settings.log_level)
+
+        # once per flow: host lookup first, no URL string is ever built
+        self.flow_classifier = FlowClassifier(settings.monitored_urls, settings.margin_url,
+                                              hosts=settings.target_hosts)
+
+        self.auto_capture_flag = settings.auto_capture_flag.encode("utf-8")
+        # compiled once into byte segments, a rewrite is a single join with the two tokens
+        try:
+            self.payload_template = PayloadTemplate(settings.margin_payload_template)
+        except ValueError as e:
+            log.error(f"Invalid DEFAULT_MARGIN_PAYLOAD_TEMPLATE: {e}")
+            self.payload_template = None
+        # last, so a failure above is retried on the next flow instead of leaving the old config half applied
+        self.settings = settings
+
+    def _check_settings(self):
+        settings = SETTINGS.get()
+        if settings is not self.settings:
+            self._apply_settings(settings)
+
+    @property
+    def credentials(self):
+        return self.store.snapshot()
 
     def _is_target(self, flow: http.HTTPFlow) -> bool:
         try:
-            if flow.request.host != TARGET_HOST:
-                return False
-            return flow.request.pretty_url.startswith(MONITORED_URL)
+            return self.flow_classifier.classify(flow) != NOT_TARGET
         except Exception:
             return False
+
+    def _is_margin(self, flow: http.HTTPFlow) -> bool:
+        return self.flow_classifier.classify(flow) == MARGIN
     
     def _is_unfiltered(self, flow: http.HTTPFlow) -> bool:
-        if flow.request.pretty_url != MARGIN_URL:
+        if not self._is_margin(flow):
             return False 
         
-        content = flow.request.content
+        content = decoded_body(flow.request)
         if not content:
             return False # No content to check
 
-        try:
-            form_dict_of_lists = parse_qs(content.decode('utf-8'))
-        except Exception as e:
-            print(f"[Proxy] Error parsing request body: {e}")
-            return False
-
-        # Extract the first value for each key for simplified checking
-        params = {k: v[0] for k, v in form_dict_of_lists.items()}
-
-        is_unfiltered = True
-        for field in EMPTY_CHECK_FIELDS:
-            value = params.get(field, "")
-            if value != "":
-                print(f"[Proxy] FILTERED: Skipping recording. Field '{field}' has value: '{value}'")
-                is_unfiltered = False
-                break
-
-        for field in DFLT_CHECK_FIELDS:
-            value = params.get(field, "")
-            if value != "DFLT":
-                # If any field has a value, the request is filtered.
-                print(f"[Proxy] FILTERED: Skipping recording. Field '{field}' has value: '{value}'")
-                is_unfiltered = False
-                break
-        
-        if "sQuery" in params and params["sQuery"] != "Client Code  Equals  DFLT AND TM / CP  Equals  DFLT AND CM  Equals  DFLT":
-            is_unfiltered = False
-            
-        return is_unfiltered
+        # scans only the checked fields, verdicts are cached per body
+        return self.filter_classifier.classify(content)
         
+    def _record(self, kind: str, message, path: str):
+        # the ring keeps history, curr_*.txt only shows the latest capture
+        body = decoded_body(message)
+        encoding = content_encoding(message) if self.capture_store_raw else ""
+        if encoding and body is not message.raw_content:
+            # keep the compressed bytes as received, read() decodes them
+            entry = self.captures.add(kind, message.raw_content, encoding=encoding)
+        else:
+            entry = self.captures.add(kind, body)
+
+        with self.lock:
+            # hooks run concurrently, a capture that lost the race to a newer one must not replace it
+            current = self._current.get(kind)
+            if current is not None and (entry.seq < current.seq or entry.digest == current.digest):
+                return
+            # temp file + rename: a reader gets the previous capture or this one, never half of it
+            stat = replace_file(path, body)
+            self._current[kind] = entry
+            if self.handoff is not None:
+                self.handoff.publish(kind, entry.seq, stat, entry.timestamp)
+        log.info(f"Recorded current {kind} to {path} (capture {entry.seq})")
+
     def _record_request_flow(self, flow: http.HTTPFlow):
-        if flow.request.pretty_url != MARGIN_URL:
+        if not self._is_margin(flow):
             return
 
-        with self.lock:
-            try:
-                # Check if current files exist.
-                # If so, rename them to 'prev' files.
-                if os.path.exists(MARGIN_REQUEST_FILE):
-                    os.replace(MARGIN_REQUEST_FILE, PREV_MARGIN_REQUEST_FILE)
-
-                if flow.request:
-                    with open(MARGIN_REQUEST_FILE, "wb") as f:
-                        f.write(flow.request.get_content())
-                        print(f"Recorded current request to {MARGIN_REQUEST_FILE}")
-            
-            except Exception as e:
-                print(f"Error recording files for MARGIN_URL: {e}")
+        try:
+            if flow.request:
+                self._record("request", flow.request, MARGIN_REQUEST_FILE)
+                METRICS.inc("captures_total", "request")
+        except Exception as e:
+            log.error(f"Error recording files for MARGIN_URL: {e}")
 
     def _record_response_flow(self, flow: http.HTTPFlow):
-        if flow.request.pretty_url != MARGIN_URL:
+        if not self._is_margin(flow):
             return
 
-        with self.lock:
-            try:
-                # Check if current files exist.
-                # If so, rename them to 'prev' files.
-                if os.path.exists(MARGIN_RESPONSE_FILE):
-                    os.replace(MARGIN_RESPONSE_FILE, PREV_MARGIN_RESPONSE_FILE)
-
-                if flow.response:
-                    with open(MARGIN_RESPONSE_FILE, "wb") as f:
-                        f.write(flow.response.get_content())
-                        print(f"Recorded current response to {MARGIN_RESPONSE_FILE}")
-            
-            except Exception as e:
-                print(f"Error recording files for MARGIN_URL: {e}")
+        try:
+            if flow.response:
+                self._record("response", flow.response, MARGIN_RESPONSE_FILE)
+                METRICS.inc("captures_total", "response")
+        except Exception as e:
+            log.error(f"Error recording files for MARGIN_URL: {e}")
 
     # ---- helpers for extracting tokens ----
+    def _apply_tokens(self, tokens: dict) -> bool:
+        current = self.store.snapshot()
+        changes = {k: v for k, v in tokens.items() if current.get(k) != v}
+        if not changes:
+            return False
+
+        # always refresh last_updated along with the tokens
+        changes["last_updated"] = datetime.now().isoformat() + "Z"
+        return self.store.update(changes)
+
     def _update_from_request(self, flow: http.HTTPFlow):
-        updated = False
-        cookie_header = flow.request.headers.get("Cookie", "")
-        for name in ["AlteonP", "JSESSIONID", "TS01d67e35", "TS254a1510027"]:
-            m = re.search(rf"{name}=([^;]+)", cookie_header)
-            if m:
-                self.credentials[name] = m.group(1)
-
-        if flow.request.urlencoded_form:
-            if "IXHRts" in flow.request.urlencoded_form and self.credentials.get("IXHRts") != flow.request.urlencoded_form["IXHRts"]:
-                self.credentials["IXHRts"] = flow.request.urlencoded_form["IXHRts"]
-                updated = True
-            if "rndaak" in flow.request.urlencoded_form and self.credentials.get("rndaak") != flow.request.urlencoded_form["rndaak"]:
-                self.credentials["rndaak"] = flow.request.urlencoded_form["rndaak"]
-                updated = True
-        else:
-            m_ixhrts = re.search(r"IXHRts=(\d+)", flow.request.get_text(strict=False))
-            if m_ixhrts and self.credentials.get("IXHRts") != m_ixhrts.group(1):
-                self.credentials["IXHRts"] = m_ixhrts.group(1)
-                updated = True
-            
-            m_rndaak = re.search(r"rndaak=([^&]+)", flow.request.get_text(strict=False))
-            if m_rndaak and self.credentials.get("rndaak") != m_rndaak.group(1):
-                self.credentials["rndaak"] = m_rndaak.group(1)
-                updated = True
-
-        if updated:
-            _save_credentials(self.credentials)
+        cookies = parse_cookie_header(flow.request.headers.get("Cookie", ""))
+        changed = self.store.update(cookies)
+
+        tokens = extract_request_tokens(decoded_body(flow.request))
+        if self._apply_tokens(tokens):
+            METRICS.inc("credential_changes_total", "request")
+            with METRICS.time("step_seconds", "credential_save"):
+                _save_credentials(self.credentials)
+        elif changed:
+            METRICS.inc("credential_changes_total", "request")
 
     def _update_from_response(self, flow: http.HTTPFlow):
         if not flow.response:
             return
         # Set-Cookie headers
-        updated = False
-        set_cookies = flow.response.headers.get_all("Set-Cookie")
-        for sc in set_cookies:
-            for name in ["AlteonP", "JSESSIONID", "TS01d67e35", "TS254a1510027"]:
-                m = re.search(rf"{name}=([^;]+)", sc)
-                if m:
-                    self.credentials[name] = m.group(1)
-
-        # IXHRts in body
-        body = flow.response.get_text(strict=False)
-        m_ixhrts = re.search(r"IXHRts[#*#=](\d+)", body)
-        if m_ixhrts and self.credentials.get("IXHRts") != m_ixhrts.group(1):
-            self.credentials["IXHRts"] = m_ixhrts.group(1)
-            updated = True
-
-        # rndaak in body (newly added)
-        m_rndaak = re.search(r"rndaak[#*#=]([^<]+)", body)
-        if m_rndaak and self.credentials.get("rndaak") != m_rndaak.group(1):
-            self.credentials["rndaak"] = m_rndaak.group(1).strip()
-            updated = True
-        
-        if updated:
-            print("[Proxy] Credentials updated from response.")
-            _save_credentials(self.credentials)
+        cookies = parse_set_cookie_headers(flow.response.headers.get_all("Set-Cookie"))
+        changed = self.store.update(cookies)
+
+        # IXHRts and rndaak in body
+        tokens = extract_response_tokens(decoded_body(flow.response))
+        if self._apply_tokens(tokens):
+            METRICS.inc("credential_changes_total", "response")
+            log.info("[Proxy] Credentials updated from response.")
+            with METRICS.time("step_seconds", "credential_save"):
+                _save_credentials(self.credentials)
+        elif changed:
+            METRICS.inc("credential_changes_total", "response")
 
     # this function will hit if we get margin request call from our mcx_client.py
-    def _rewrite_margin_request(self, flow: http.HTTPFlow):
-        if flow.request.pretty_url != MARGIN_URL:
-            return
+    def _rewrite_margin_request(self, flow: http.HTTPFlow) -> bool:
+        if not self._is_margin(flow):
+            return False
 
-        request_text = flow.request.get_text(strict=False)
+        raw = flow.request.raw_content
+        flag = self.auto_capture_flag
+        if not flag or not raw or flag not in raw:
+            return False
 
-        if AUTO_CAPTURE_FLAG in request_text:
-            ixhrts_val = self.credentials.get("IXHRts", "")
-            rndaak_str = self.credentials.get("rndaak", "")
-            
-            if not ixhrts_val or not rndaak_str:
-                print("[Proxy] ERROR: Missing IXHRts or rndaak for auto-capture rewrite.")
-                fresh_ixhrts = int(time.time() * 1000)
-            else:
-                try:
-                    base_ixhrts = int(ixhrts_val)
-                    jitter_ms = random.randint(50, 200)
-                    fresh_ixhrts = base_ixhrts + jitter_ms
-                    
-                except ValueError:
-                    print("[Proxy] WARNING: IXHRts token was invalid. Generating fresh epoch time.")
-                    fresh_ixhrts = int(time.time() * 1000)
-
-            final_payload = DEFAULT_MARGIN_PAYLOAD_TEMPLATE.format(
-                IXHRts=fresh_ixhrts, 
-                rndaak=rndaak_str
-            )
+        template = self.payload_template
+        if template is None:
+            log.error("[Proxy] No usable DEFAULT_MARGIN_PAYLOAD_TEMPLATE for auto-capture rewrite.")
+            return False
 
-            final_payload = DEFAULT_MARGIN_PAYLOAD_TEMPLATE.format(
-                IXHRts=ixhrts_val,
-                rndaak=rndaak_str
-            )
-            
-            flow.request.set_text(final_payload)
+        creds = self.credentials
+        ixhrts_val = creds.get("IXHRts", "")
+        rndaak_str = creds.get("rndaak", "")
+        if not ixhrts_val or not rndaak_str:
+            log.error("[Proxy] Missing IXHRts or rndaak for auto-capture rewrite.")
 
-            print("Final payload", final_payload)
+        final_payload = template.render(IXHRts=ixhrts_val, rndaak=rndaak_str)
 
-            flow.request.headers["Content-Length"] = str(len(final_payload))
+        flow.request.content = final_payload
+        flow.request.headers["Content-Length"] = str(len(flow.request.raw_content))
 
-            print(f"[Proxy] AUTO-CAPTURE: Rewrote payload for {MARGIN_URL}")
+        log.info(f"[Proxy] AUTO-CAPTURE: Rewrote payload for {self.settings.margin_url}")
+        return True
 
     # ---- mitmproxy hooks ----
     def request(self, flow: http.HTTPFlow):
-        if not self._is_target(flow):
+        start = time.perf_counter()
+        try:
+            self._check_settings()
+            self._on_request(flow)
+        finally:
+            METRICS.observe("hook_seconds", "request", time.perf_counter() - start)
+
+    def response(self, flow: http.HTTPFlow):
+        start = time.perf_counter()
+        try:
+            self._on_response(flow)
+        finally:
+            METRICS.observe("hook_seconds", "response", time.perf_counter() - start)
+
+    def _on_request(self, flow: http.HTTPFlow):
+        with METRICS.time("step_seconds", "is_target"):
+            is_target = self._is_target(flow)
+        if not is_target:
             return
+        METRICS.inc("flows_total", "targeted")
         
         # Initialize metadata flag, to be consistent between req res cycle
         flow.metadata["is_unfiltered_margin_request"] = False
 
-        if flow.request.pretty_url == MARGIN_URL:
-            if self._is_unfiltered(flow):
+        if self._is_margin(flow):
+            with METRICS.time("step_seconds", "is_unfiltered"):
+                unfiltered = self._is_unfiltered(flow)
+            if unfiltered:
                 flow.metadata["is_unfiltered_margin_request"] = True
+            else:
+                METRICS.inc("flows_total", "filtered")
 
         is_unfiltered = flow.metadata.get("is_unfiltered_margin_request", False)
 
@@ -297,19 +372,25 @@ class StatefulCredentialsProxy:
             # if its default margin req
 
             # if this request is generated by our mcx_client.py
-            self._rewrite_margin_request(flow)
+            with METRICS.time("step_seconds", "rewrite"):
+                if self._rewrite_margin_request(flow):
+                    METRICS.inc("flows_total", "rewritten")
 
             # record req in curr_request.txt fil
-            self._record_request_flow(flow)
+            with METRICS.time("step_seconds", "record"):
+                self._record_request_flow(flow)
 
         try:
             # update tokens
-            self._update_from_request(flow)
+            with METRICS.time("step_seconds", "token_update"):
+                self._update_from_request(flow)
         except Exception as e:
-            print(f"[addon] failed to write request: {e}")
+            log.error(f"[addon] failed to write request: {e}")
 
-    def response(self, flow: http.HTTPFlow):
-        if not self._is_target(flow):
+    def _on_response(self, flow: http.HTTPFlow):
+        with METRICS.time("step_seconds", "is_target"):
+            is_target = self._is_target(flow)
+        if not is_target:
             return
         
         is_unfiltered = flow.metadata.get("is_unfiltered_margin_request", False)
@@ -319,14 +400,44 @@ class StatefulCredentialsProxy:
         if is_unfiltered:
             # if its default margin req
 
+            # parse and publish straight from memory
+            if self.pipeline is not None and flow.response:
+                self.pipeline.submit(decoded_body(flow.response))
+
             # record res in curr_response.txt 
-            self._record_response_flow(flow)
+            if self.pipeline is None or self.pipeline_write_files:
+                with METRICS.time("step_seconds", "record"):
+                    self._record_response_flow(flow)
 
         try:
             # update tokens
-            self._update_from_response(flow)
+            with METRICS.time("step_seconds", "token_update"):
+                self._update_from_response(flow)
         except Exception as e:
-            print(f"[addon] failed to write response: {e}")
-
+            log.error(f"[addon] failed to write response: {e}")
+
+    def done(self):
+        # mitmproxy is shutting down, make sure the latest tokens hit the disk,
+        # cookie-only changes included (they are not saved on their own)
+        _save_credentials(self.credentials)
+        _credential_writer.close()
+        stats = _credential_writer.stats()
+        log.info(f"[Proxy] credentials.json: {stats['writes']} writes, {stats['coalesced']} coalesced, "
+                 f"{stats['submitted']} updates")
+
+        if self.pipeline is not None:
+            self.pipeline.close()
+            log.info(f"[Proxy] pipeline: {self.pipeline.stats()}")
+
+        self.captures.close()
+        if self.handoff is not None:
+            self.handoff.close()
+
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.stats_dumper is not None:
+            self.stats_dumper.stop()
+        log.info(f"[Proxy] stats: {METRICS.snapshot()}")
+        stop_logging()
 
 addons = [StatefulCredentialsProxy()]
\ No newline at end of file
@@ -0,0 +1,349 @@
+"""
+Proxy, parser and sender in one process, on one asyncio loop
+
+    python mcx_supervisor.py [-p 8080] [--listen-host 0.0.0.0] [--set mitmproxy_option=value ...]
+
+Replaces the three windows of start-proxy.bat. mitmproxy runs
+StatefulCredentialsProxy on this loop; unfiltered margin responses are
+handed over in memory to the parser task, which parses them on a worker
+process (PARSER_PROCESSES in [SUPERVISOR]), and the latest parsed snapshot
+goes to the sender task. Neither polls a file. A parser or sender task that
+fails is restarted with backoff; if the proxy itself stops, everything is
+shut down. Ctrl+C / SIGTERM drains what is queued and stops cleanly.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+CURR_DIR = os.path.dirname(os.path.abspath(__file__))
+
+from parser.rsk335_stream import extract_margin_table
+from proxy.capture_handoff import replace_file
+from proxy.flow_body import decoded_body
+from proxy.log import get_logger
+
+log = get_logger("supervisor")
+
+MARGIN_VIEW_FILE = os.path.join(CURR_DIR, 'parser', 'margin-utilization-view.json')
+# snapshot history, see parser/margin_history.py
+MARGIN_HISTORY_FILE = os.path.join(CURR_DIR, 'parser', 'margin-history.sqlite3')
+
+# bodies waiting for the parser, snapshots waiting for the sender; only the newest matter
+CAPTURE_QUEUE_SIZE = 4
+SNAPSHOT_QUEUE_SIZE = 1
+
+# how long shutdown waits for queued captures to be parsed and sent
+DRAIN_TIMEOUT = 5.0
+# a task that ran this long before failing gets the initial restart delay again
+RESTART_RESET_AFTER = 60.0
+# how long one snapshot's turn may spend sending a spooled backlog ([SENDER] SPOOL)
+SPOOL_DRAIN_BUDGET = 8.0
+
+
+def _put_latest(queue: asyncio.Queue, item) -> bool:
+    """put_nowait, dropping the oldest item when full; False if one was dropped"""
+    dropped = False
+    if queue.full():
+        queue.get_nowait()
+        queue.task_done()
+        dropped = True
+    queue.put_nowait(item)
+    return not dropped
+
+
+def _write_json(path: str, data: dict):
+    # replaced whole, a sender polling the file never reads half of it
+    replace_file(path, json.dumps(data, indent=4, ensure_ascii=False).encode("utf-8"))
+
+
+class CaptureTap:
+    """
+    mitmproxy addon added after StatefulCredentialsProxy: queues the body of
+    every unfiltered margin response for the parser task. Hooks run on the
+    loop thread, so this is a plain put_nowait.
+    """
+
+    def __init__(self, supervisor):
+        self.supervisor = supervisor
+
+    def response(self, flow):
+        if not flow.metadata.get("is_unfiltered_margin_request") or not flow.response:
+            return
+        # the body the addon already decoded for its recorder and token scan
+        self.supervisor.submit(decoded_body(flow.response))
+
+
+class Supervisor:
+    def __init__(self, proxy_module, listen_host: str, listen_port: int, options=()):
+        self.proxy_module = proxy_module
+        self.addon = proxy_module.addons[0]
+        self.metrics = proxy_module.METRICS
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.options = list(options)
+
+        self.master = None
+        self.history = None
+        self.captures = asyncio.Queue(CAPTURE_QUEUE_SIZE)
+        self.snapshots = asyncio.Queue(SNAPSHOT_QUEUE_SIZE)
+        self.stopping = asyncio.Event()
+        self.accepting = True
+
+        self.metrics.describe("supervisor_seconds", "Parse, publish and capture-to-publish latency", label="stage")
+        self.metrics.describe("supervisor_captures_total", "Captured margin responses by outcome", label="event")
+        self.metrics.describe("supervisor_restarts_total", "Parser/sender task restarts", label="task")
+
+    # ---- proxy ----
+    async def run_proxy(self):
+        from mitmproxy.options import Options
+        from mitmproxy.tools.dump import DumpMaster
+
+        opts = Options(listen_host=self.listen_host, listen_port=self.listen_port)
+        self.master = DumpMaster(opts, with_termlog=True, with_dumper=False)
+        if self.options:
+            self.master.options.set(*self.options)
+        self.master.addons.add(self.addon, CaptureTap(self))
+        log.info(f"[Supervisor] proxy listening on {self.listen_host or '*'}:{self.listen_port}")
+        await self.master.run()
+
+    def submit(self, body: bytes):
+        if not self.accepting:
+            return
+        if _put_latest(self.captures, (time.monotonic(), body)):
+            self.metrics.inc("supervisor_captures_total", "queued")
+        else:
+            self.metrics.inc("supervisor_captures_total", "dropped")
+
+    # ---- parser ----
+    async def run_parser(self):
+        settings = self.proxy_module.SETTINGS.get()
+        loop = asyncio.get_running_loop()
+
+        pool = None
+        if settings.supervisor_parser_processes > 0:
+            # spawn: same on Windows and Linux, and workers don't inherit the proxy's threads
+            pool = ProcessPoolExecutor(settings.supervisor_parser_processes,
+                                       mp_context=multiprocessing.get_context("spawn"))
+            # start the workers now, not on the first capture
+            await loop.run_in_executor(pool, extract_margin_table, b"")
+
+        try:
+            while True:
+                captured_at, body = await self.captures.get()
+                try:
+                    start = time.monotonic()
+                    table = await loop.run_in_executor(pool, extract_margin_table, body)
+                    self.metrics.observe("supervisor_seconds", "parse", time.monotonic() - start)
+                    if not table:
+                        self.metrics.inc("supervisor_captures_total", "no_table")
+                        continue
+                    self.metrics.inc("supervisor_captures_total", "parsed")
+
+                    if self.proxy_module.SETTINGS.get().supervisor_write_files:
+                        await asyncio.to_thread(_write_json, MARGIN_VIEW_FILE, table)
+                        # captured_at is monotonic, the history wants wall-clock capture times
+                        await asyncio.to_thread(self._append_history, table,
+                                                time.time() - (time.monotonic() - captured_at))
+                    _put_latest(self.snapshots, (captured_at, table))
+                finally:
+                    self.captures.task_done()
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def _append_history(self, table: dict, ts: float):
+        try:
+            if self.history is None:
+                from parser.margin_history import MarginHistory
+                self.history = MarginHistory(MARGIN_HISTORY_FILE)
+            self.history.append(table, ts)
+        except Exception as e:
+            log.error(f"[Supervisor] Could not store snapshot in history: {e}")
+
+    # ---- sender ----
+    async def run_sender(self):
+        import requests
+        from client.publisher import publisher_from_settings
+
+        settings = self.proxy_module.SETTINGS.get()
+        publisher = publisher_from_settings(settings)
+        spooler = self._make_spooler(settings, publisher)
+        try:
+            while True:
+                captured_at, table = await self.snapshots.get()
+                try:
+                    current = self.proxy_module.SETTINGS.get()
+                    if current.sender_options != settings.sender_options:
+                        # SERVER_URL or [SENDER] was edited, start over with a new session
+                        publisher.close()
+                        if spooler is not None:
+                            spooler.close()
+                        settings, publisher = current, publisher_from_settings(current)
+                        spooler = self._make_spooler(settings, publisher)
+                        log.info("[Supervisor] sender settings reloaded")
+                    if not settings.server_url:
+                        continue
+                    if spooler is not None:
+                        await self._send_spooled(spooler, table, captured_at)
+                        continue
+
+                    start = time.monotonic()
+                    try:
+                        response = await asyncio.to_thread(publisher.publish, table)
+                    except requests.RequestException as e:
+                        self.metrics.inc("supervisor_captures_total", "failed")
+                        log.error(f"[Supervisor] Error connecting to the server: {e}")
+                        continue
+                    now = time.monotonic()
+                    self.metrics.observe("supervisor_seconds", "publish", now - start)
+
+                    if response is None:
+                        self.metrics.inc("supervisor_captures_total", "unchanged")
+                    elif response.status_code == 200:
+                        self.metrics.inc("supervisor_captures_total", "published")
+                        self.metrics.observe("supervisor_seconds", "capture_to_publish", now - captured_at)
+                        log.info(f"[Supervisor] Published margin snapshot in {(now - captured_at) * 1e3:.1f} ms")
+                    else:
+                        self.metrics.inc("supervisor_captures_total", "failed")
+                        log.error(f"[Supervisor] Server returned {response.status_code}: {response.text[:200]}")
+                finally:
+                    self.snapshots.task_done()
+        finally:
+            publisher.close()
+            if spooler is not None:
+                spooler.close()
+
+    def _make_spooler(self, settings, publisher):
+        if not settings.sender_spool:
+            return None
+        from client.spool import open_spool_sender
+        return open_spool_sender(settings, publisher)
+
+    async def _send_spooled(self, spooler, table: dict, captured_at: float):
+        """Spool the snapshot, then send the backlog; an outage leaves it in the spool"""
+        import requests
+
+        await asyncio.to_thread(spooler.offer, table, time.time() - (time.monotonic() - captured_at))
+        try:
+            delivered = await asyncio.to_thread(spooler.drain, time.monotonic() + SPOOL_DRAIN_BUDGET)
+        except requests.RequestException as e:
+            self.metrics.inc("supervisor_captures_total", "spooled")
+            log.error(f"[Supervisor] Error connecting to the server, {spooler.spool.backlog} snapshot(s) "
+                      f"kept in the spool: {e}")
+            return
+        if delivered:
+            self.metrics.inc("supervisor_captures_total", "published")
+            self.metrics.observe("supervisor_seconds", "capture_to_publish", time.monotonic() - captured_at)
+
+    # ---- lifecycle ----
+    async def supervise(self, name: str, factory):
+        """Run factory() until the supervisor stops, restarting it with backoff when it fails"""
+        settings = self.proxy_module.SETTINGS.get()
+        delay = settings.supervisor_restart_delay
+        while not self.stopping.is_set():
+            started = time.monotonic()
+            try:
+                await factory()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"[Supervisor] {name} task failed: {e!r}, restarting in {delay:.1f}s")
+            self.metrics.inc("supervisor_restarts_total", name)
+
+            if time.monotonic() - started > RESTART_RESET_AFTER:
+                delay = settings.supervisor_restart_delay
+            try:
+                await asyncio.wait_for(self.stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, settings.supervisor_restart_max_delay)
+
+    def stop(self):
+        self.stopping.set()
+
+    async def run(self) -> int:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass   # Windows: Ctrl+C cancels run() instead
+
+        workers = []
+        if self.addon.pipeline is not None:
+            log.warning("[Supervisor] [PIPELINE] is enabled, the addon parses and publishes itself; "
+                        "not starting the parser and sender tasks")
+            self.accepting = False
+        else:
+            workers = [
+                asyncio.create_task(self.supervise("parser", self.run_parser), name="parser"),
+                asyncio.create_task(self.supervise("sender", self.run_sender), name="sender"),
+            ]
+        proxy = asyncio.create_task(self.run_proxy(), name="proxy")
+        stopping = asyncio.create_task(self.stopping.wait())
+
+        exit_code = 0
+        try:
+            await asyncio.wait([proxy, stopping], return_when=asyncio.FIRST_COMPLETED)
+            if proxy.done() and not proxy.cancelled() and proxy.exception() is not None:
+                exit_code = 1
+                log.error(f"[Supervisor] proxy failed, shutting down: {proxy.exception()!r}")
+        finally:
+            stopping.cancel()
+            await self.shutdown(proxy, workers)
+        return exit_code
+
+    async def shutdown(self, proxy, workers):
+        self.stopping.set()
+        self.accepting = False
+
+        # let what is already captured reach the server
+        if workers:
+            try:
+                await asyncio.wait_for(self._drain(), DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                log.warning(f"[Supervisor] gave up draining after {DRAIN_TIMEOUT}s")
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        if self.history is not None:
+            self.history.close()
+
+        log.info(f"[Supervisor] stopped, stats: {self.metrics.snapshot()}")
+        # last: the addon's done() flushes credentials.json and stops the log thread
+        if self.master is not None and not proxy.done():
+            self.master.shutdown()
+        await asyncio.gather(proxy, return_exceptions=True)
+
+    async def _drain(self):
+        await self.captures.join()
+        await self.snapshots.join()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run the proxy, parser and sender in one process")
+    ap.add_argument("-p", "--listen-port", type=int, default=8080)
+    ap.add_argument("--listen-host", default="")
+    ap.add_argument("--set", dest="options", action="append", default=[], metavar="option=value",
+                    help="mitmproxy option, like mitmdump --set")
+    args = ap.parse_args()
+
+    # imported here, not at the top: the parser's worker processes import this module too
+    import mcx_stateful_proxy
+
+    supervisor = Supervisor(mcx_stateful_proxy, args.listen_host, args.listen_port, args.options)
+    try:
+        sys.exit(asyncio.run(supervisor.run()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
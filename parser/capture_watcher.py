@@ -0,0 +1,132 @@
+import os
+import time
+import hashlib
+
+from proxy.capture_handoff import CaptureHandoffReader
+
+HASH_CHUNK_SIZE = 256 * 1024
+# times read() tries again when the file was replaced by a newer capture while reading
+READ_RETRIES = 5
+READ_RETRY_DELAY = 0.001
+
+
+def _signature(path: str):
+    """(inode, size, mtime) of path, None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def content_digest(path: str) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+class CaptureWatcher:
+    """
+    Tells when the proxy has written a new capture to `path`.
+
+    With `handoff_path` (the proxy's calls/browser-calls/handoff.shm) it
+    reads the capture seq the proxy announces after each atomic replace of
+    `path`, every `interval` seconds, and a seq already handled is skipped.
+    Without one, or until a proxy has published there, it stats the file,
+    hashes the content only when inode, size or mtime moved, and skips a
+    capture whose bytes are identical to the last one handled.
+    Call mark_done() once a capture has been handled successfully, and
+    mark_failed() when it could not be, so a capture that failed to parse
+    is retried only when it changes again.
+    """
+
+    def __init__(self, path: str, interval: float = 0.05, handoff_path: str = None, kind: str = "response"):
+        self.path = path
+        self.interval = interval
+        self.kind = kind
+        self.skipped = 0
+        self.rereads = 0
+
+        self._signature = None
+        self._digest = None
+        self._pending_digest = None
+
+        self._handoff = CaptureHandoffReader(handoff_path) if handoff_path else None
+        self._done_seq = None
+        self._failed_seq = None
+        self.pending = None   # Handoff of the capture poll() reported
+
+    @property
+    def captured_at(self):
+        """When the proxy recorded the pending capture, None without a handoff"""
+        return self.pending.timestamp if self.pending is not None else None
+
+    def poll(self) -> bool:
+        """True if path holds a capture that has not been handled yet"""
+        if self._handoff is not None:
+            handoff = self._handoff.read(self.kind)
+            if handoff is not None:
+                if handoff.seq in (self._done_seq, self._failed_seq):
+                    return False
+                self.pending = handoff
+                return True
+
+        signature = _signature(self.path)
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+
+        try:
+            digest = content_digest(self.path)
+        except FileNotFoundError:
+            return False
+        if digest == self._digest:
+            # rewritten with the same bytes, e.g. the auto-refresher on a quiet market
+            self.skipped += 1
+            return False
+
+        self._pending_digest = digest
+        return True
+
+    def read(self) -> bytes:
+        """
+        The pending capture, read into memory in one go (on Windows the proxy
+        cannot replace the file while it is open). With a handoff, a file
+        whose size and mtime are not the announced ones was replaced by a
+        newer capture meanwhile; its handoff is taken and the file read again.
+        """
+        for _ in range(READ_RETRIES):
+            with open(self.path, "rb") as f:
+                st = os.fstat(f.fileno())
+                body = f.read()
+            if self.pending is None or (st.st_size, st.st_mtime_ns) == (self.pending.size, self.pending.mtime_ns):
+                break
+            self.rereads += 1
+            handoff = self._handoff.read(self.kind)
+            if handoff is None or handoff.seq == self.pending.seq:
+                # replaced but not announced yet, the proxy publishes right after
+                time.sleep(READ_RETRY_DELAY)
+            else:
+                self.pending = handoff
+        return body
+
+    def mark_done(self):
+        if self.pending is not None:
+            self._done_seq = self.pending.seq
+        self._digest = self._pending_digest
+
+    def mark_failed(self):
+        # without a handoff poll() has taken the signature already, the same file is not reported again
+        if self.pending is not None:
+            self._failed_seq = self.pending.seq
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until poll() is True, False if timeout ran out first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.poll():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.interval)
+        return True
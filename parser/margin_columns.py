@@ -0,0 +1,99 @@
+import os
+import re
+import sys
+import math
+from array import array
+
+import msgpack
+
+FORMAT = "rsk335-columns"
+VERSION = 1
+
+# 1,23,45,678.50 / 1,234,567 / -75.80 / 12%, but not codes like 0001 or dates like 17-10-2026
+NUMBER_RE = re.compile(r"[+-]?(?:0|[1-9](?:,?\d)*)(?:\.\d+)?%?")
+
+
+def parse_number(text: str):
+    """'1,23,45,678.50' -> 12345678.5, None if the cell is not a number"""
+    text = text.strip()
+    negative = text.startswith("(") and text.endswith(")")
+    if negative:
+        text = text[1:-1]
+    if not NUMBER_RE.fullmatch(text):
+        return None
+    value = float(text.rstrip("%").replace(",", ""))
+    return -value if negative else value
+
+
+def to_columns(headers: list, rows: list) -> dict:
+    """
+    Turn row-major cell strings into {header: column}.
+
+    A column whose non-blank cells are all numbers becomes an array('d')
+    with NaN for blanks, every other column stays a list of strings.
+    """
+    columns = {}
+    for i, header in enumerate(headers):
+        cells = [row[i] if i < len(row) else "" for row in rows]
+        numbers = [parse_number(cell) if cell else math.nan for cell in cells]
+        if any(cell for cell in cells) and None not in numbers:
+            columns[header] = array("d", numbers)
+        else:
+            columns[header] = cells
+    return columns
+
+
+def pack_columns(columns: dict) -> bytes:
+    """msgpack map with numeric columns as raw little-endian float64 buffers"""
+    packed = {}
+    numeric = []
+    for header, column in columns.items():
+        if isinstance(column, array):
+            if sys.byteorder == "big":
+                column = array("d", column)
+                column.byteswap()
+            packed[header] = column.tobytes()
+            numeric.append(header)
+        else:
+            packed[header] = list(column)
+
+    rows = len(next(iter(columns.values()))) if columns else 0
+    return msgpack.packb({
+        "format": FORMAT,
+        "version": VERSION,
+        "headers": list(columns),
+        "numeric": numeric,
+        "rows": rows,
+        "columns": packed,
+    }, use_bin_type=True)
+
+
+def unpack_columns(data: bytes) -> dict:
+    doc = msgpack.unpackb(data, raw=False)
+    if doc.get("format") != FORMAT or doc.get("version") != VERSION:
+        raise ValueError(f"Not a {FORMAT} v{VERSION} document")
+
+    numeric = set(doc["numeric"])
+    columns = {}
+    for header in doc["headers"]:
+        column = doc["columns"][header]
+        if header in numeric:
+            values = array("d")
+            values.frombytes(column)
+            if sys.byteorder == "big":
+                values.byteswap()
+            column = values
+        columns[header] = column
+    return columns
+
+
+def write_columns(path: str, columns: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(pack_columns(columns))
+    os.replace(tmp, path)
+
+
+def read_columns(path: str) -> dict:
+    with open(path, "rb") as f:
+        return unpack_columns(f.read())
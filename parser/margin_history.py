@@ -0,0 +1,347 @@
+"""
+Append-only history of parsed margin snapshots, with 1-minute and 1-hour rollups.
+
+    python parser/margin_history.py serve [--port 8765]
+    python parser/margin_history.py series "Utilization %" [--since 2026-10-17T09:00] [--step 1m]
+    python parser/margin_history.py fields | snapshots [--since ...] | compact
+
+Every snapshot parse_response() (or the pipeline/supervisor) produces is
+kept with its capture time. The numeric fields are also stored per field
+as (ts, value) points and folded into per-minute and per-hour
+low/high/last rows as they arrive, so a range query reads an index range
+of one table and never parses a snapshot or a capture.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PARSER_DIR = os.path.dirname(os.path.abspath(__file__))
+if __name__ == "__main__":
+    # run as a script: put the repo root on sys.path for the package imports below
+    sys.path.insert(0, os.path.normpath(os.path.join(PARSER_DIR, '..')))
+
+from parser.margin_columns import parse_number
+
+DB_PATH = os.path.join(PARSER_DIR, "margin-history.sqlite3")
+
+# seconds per rollup bucket
+STEPS = {"1m": 60, "1h": 3600}
+
+# how long each resolution is kept, in days
+RETENTION_DAYS = {"raw": 7, "1m": 31, "1h": 400}
+# old rows are deleted and their pages given back to the file system every N appends
+COMPACT_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (ts REAL NOT NULL, data TEXT NOT NULL);
+CREATE UNIQUE INDEX IF NOT EXISTS snapshots_ts_unique ON snapshots (ts);
+CREATE TABLE IF NOT EXISTS fields (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS points (
+    field INTEGER NOT NULL, ts REAL NOT NULL, value REAL NOT NULL,
+    PRIMARY KEY (field, ts)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_{step} (
+    field INTEGER NOT NULL, bucket INTEGER NOT NULL,
+    low REAL NOT NULL, high REAL NOT NULL, last REAL NOT NULL, last_ts REAL NOT NULL, n INTEGER NOT NULL,
+    PRIMARY KEY (field, bucket)
+) WITHOUT ROWID;
+"""
+
+# a point lands in its bucket's row; `last` follows the newest capture, not the latest insert
+ROLLUP_UPSERT = """
+INSERT INTO rollup_{step} (field, bucket, low, high, last, last_ts, n) VALUES (?, ?, ?, ?, ?, ?, 1)
+ON CONFLICT (field, bucket) DO UPDATE SET
+    low = min(low, excluded.low),
+    high = max(high, excluded.high),
+    last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last ELSE last END,
+    last_ts = max(last_ts, excluded.last_ts),
+    n = n + 1
+"""
+
+
+def parse_time(value):
+    """Epoch seconds from a number, an ISO 8601 string (local time unless it has an offset) or None"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class MarginHistory:
+    """
+    SQLite in WAL mode, so readers (the query API, other processes) never
+    block the writer. Appends commit with synchronous=NORMAL: a power cut
+    can lose the last few snapshots, never corrupt the file. One connection
+    is shared by the threads of a process under a lock.
+    """
+
+    def __init__(self, path: str = DB_PATH, retention_days: dict = None, compact_every: int = COMPACT_EVERY):
+        self.path = path
+        self.retention_days = dict(RETENTION_DAYS, **(retention_days or {}))
+        self.compact_every = compact_every
+
+        self._lock = threading.Lock()
+        self._field_ids = {}
+        self._appends = 0
+
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        # must be set before the first table is created to take effect
+        self._db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        if self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'snapshots_ts'").fetchone():
+            # before captures were unique by time, a capture parsed twice was stored twice
+            self._db.execute("DELETE FROM snapshots WHERE rowid NOT IN (SELECT min(rowid) FROM snapshots GROUP BY ts)")
+            self._db.execute("DROP INDEX snapshots_ts")
+        self._db.executescript(SCHEMA + "".join(ROLLUP_SCHEMA.format(step=step) for step in STEPS))
+        self._field_ids = dict(self._db.execute("SELECT name, id FROM fields"))
+
+    # ---- writing ----
+    def append(self, snapshot: dict, ts: float = None) -> int:
+        """
+        Store one parsed snapshot captured at `ts`, returns how many numeric
+        fields it had. A capture already stored under `ts` (the same file
+        parsed again) is skipped and counts 0.
+        """
+        ts = time.time() if ts is None else ts
+        points = []
+        for name, text in snapshot.items():
+            value = parse_number(text) if isinstance(text, str) else None
+            if value is not None:
+                points.append((name, value))
+
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                inserted = self._db.execute("INSERT OR IGNORE INTO snapshots (ts, data) VALUES (?, ?)",
+                                            (ts, json.dumps(snapshot, ensure_ascii=False))).rowcount
+                if not inserted:
+                    self._db.execute("COMMIT")
+                    return 0
+                rows = [(self._field_id(name), ts, value) for name, value in points]
+                self._db.executemany("INSERT OR REPLACE INTO points (field, ts, value) VALUES (?, ?, ?)", rows)
+                for step, seconds in STEPS.items():
+                    bucket = int(ts // seconds) * seconds
+                    self._db.executemany(ROLLUP_UPSERT.format(step=step),
+                                         [(field, bucket, value, value, value, ts) for field, _, value in rows])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                # field ids handed out in the rolled back transaction are gone again
+                self._field_ids = dict(self._db.execute("SELECT name, id FROM fields"))
+                raise
+
+            self._appends += 1
+            if self.compact_every and self._appends % self.compact_every == 0:
+                self._compact(time.time())
+        return len(points)
+
+    def compact(self, now: float = None) -> dict:
+        """Drop rows older than their retention and give the freed pages back, returns rows deleted"""
+        with self._lock:
+            return self._compact(time.time() if now is None else now)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # ---- reading ----
+    def fields(self) -> list:
+        with self._lock:
+            return [name for name, in self._db.execute("SELECT name FROM fields ORDER BY name")]
+
+    def series(self, field: str, since=None, until=None, step: str = "raw") -> list:
+        """
+        (ts, value) points of `field` in [since, until], or with step "1m"/"1h"
+        (bucket start, low, high, last) rows, oldest first.
+        """
+        since, until = parse_time(since), parse_time(until)
+        if step != "raw" and step not in STEPS:
+            raise ValueError(f"Unknown step {step!r}, use raw, " + ", ".join(STEPS))
+        with self._lock:
+            # another process may be the writer, so the name is looked up, not taken from _field_ids
+            row = self._db.execute("SELECT id FROM fields WHERE name = ?", (field,)).fetchone()
+            if row is None:
+                return []
+            field_id = row[0]
+            if step == "raw":
+                sql = "SELECT ts, value FROM points WHERE field = ? AND ts >= ? AND ts <= ? ORDER BY ts"
+            else:
+                sql = (f"SELECT bucket, low, high, last FROM rollup_{step} "
+                       "WHERE field = ? AND bucket >= ? AND bucket <= ? ORDER BY bucket")
+                # the bucket that `since` falls into is part of the range
+                if since is not None:
+                    since = since // STEPS[step] * STEPS[step]
+            return self._db.execute(sql, (field_id, since if since is not None else float("-inf"),
+                                          until if until is not None else float("inf"))).fetchall()
+
+    def snapshots(self, since=None, until=None, limit: int = 1000) -> list:
+        """(ts, snapshot dict) in [since, until], oldest first"""
+        since, until = parse_time(since), parse_time(until)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT ts, data FROM snapshots WHERE ts >= ? AND ts <= ? ORDER BY ts LIMIT ?",
+                (since if since is not None else float("-inf"),
+                 until if until is not None else float("inf"), limit)).fetchall()
+        return [(ts, json.loads(data)) for ts, data in rows]
+
+    def latest(self):
+        """(ts, snapshot dict) of the newest capture, None if there is none"""
+        with self._lock:
+            row = self._db.execute("SELECT ts, data FROM snapshots ORDER BY ts DESC LIMIT 1").fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    # ---- internals ----
+    def _field_id(self, name: str) -> int:
+        field_id = self._field_ids.get(name)
+        if field_id is None:
+            self._db.execute("INSERT OR IGNORE INTO fields (name) VALUES (?)", (name,))
+            field_id = self._db.execute("SELECT id FROM fields WHERE name = ?", (name,)).fetchone()[0]
+            self._field_ids[name] = field_id
+        return field_id
+
+    def _compact(self, now: float) -> dict:
+        day = 86400
+        deleted = {}
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            cutoff = now - self.retention_days["raw"] * day
+            deleted["snapshots"] = self._db.execute("DELETE FROM snapshots WHERE ts < ?", (cutoff,)).rowcount
+            deleted["points"] = self._db.execute("DELETE FROM points WHERE ts < ?", (cutoff,)).rowcount
+            for step in STEPS:
+                cutoff = now - self.retention_days[step] * day
+                deleted[step] = self._db.execute(f"DELETE FROM rollup_{step} WHERE bucket < ?", (cutoff,)).rowcount
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        if any(deleted.values()):
+            self._db.execute("PRAGMA incremental_vacuum")
+            # fold the WAL back into the database so it does not grow with the deletes
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+
+class HistoryServer(ThreadingHTTPServer):
+    """
+    Read-only JSON API over a MarginHistory, from a daemon thread:
+
+        GET /fields
+        GET /series?field=Utilization %&since=...&until=...&step=raw|1m|1h
+        GET /snapshots?since=...&until=...&limit=1000
+        GET /latest
+
+    since/until are epoch seconds or ISO 8601 local times.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, history: MarginHistory, host: str = "127.0.0.1", port: int = 8765):
+        super().__init__((host, port), _HistoryHandler)
+        self.history = history
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="history-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _HistoryHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        history = self.server.history
+        try:
+            if url.path == "/fields":
+                result = history.fields()
+            elif url.path == "/series":
+                if "field" not in query:
+                    raise ValueError("field is required")
+                result = history.series(query["field"], query.get("since"), query.get("until"),
+                                        query.get("step", "raw"))
+            elif url.path == "/snapshots":
+                result = [{"ts": ts, "data": data} for ts, data in
+                          history.snapshots(query.get("since"), query.get("until"), int(query.get("limit", 1000)))]
+            elif url.path == "/latest":
+                latest = history.latest()
+                result = {"ts": latest[0], "data": latest[1]} if latest else None
+            else:
+                self.send_error(404)
+                return
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+
+        body = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Query the margin snapshot history")
+    ap.add_argument("--db", default=DB_PATH)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    serve = sub.add_parser("serve", help="serve the JSON API")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    sub.add_parser("fields", help="list the numeric fields")
+    series = sub.add_parser("series", help="print one field over time")
+    series.add_argument("field")
+    series.add_argument("--step", default="raw", choices=["raw", *STEPS])
+    snapshots = sub.add_parser("snapshots", help="print stored snapshots as JSON lines")
+    snapshots.add_argument("--limit", type=int, default=1000)
+    for p in (series, snapshots):
+        p.add_argument("--since")
+        p.add_argument("--until")
+    sub.add_parser("compact", help="apply the retention now")
+    args = ap.parse_args()
+
+    history = MarginHistory(args.db)
+    if args.cmd == "serve":
+        server = HistoryServer(history, args.host, args.port)
+        print(f"Margin history on http://{args.host}:{args.port}/ (fields, series, snapshots, latest)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    elif args.cmd == "fields":
+        print("\n".join(history.fields()))
+    elif args.cmd == "series":
+        for row in history.series(args.field, args.since, args.until, args.step):
+            stamp = datetime.fromtimestamp(row[0]).strftime("%Y-%m-%d %H:%M:%S")
+            print(stamp, *row[1:])
+    elif args.cmd == "snapshots":
+        for ts, data in history.snapshots(args.since, args.until, args.limit):
+            print(json.dumps({"ts": ts, "data": data}, ensure_ascii=False))
+    else:
+        print(history.compact())
+    history.close()
+
+
+if __name__ == "__main__":
+    main()
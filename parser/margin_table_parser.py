@@ -1,27 +1,54 @@
-from bs4 import BeautifulSoup
 import json
 import time
 import os
-import configparser
+import sys
+import argparse
 
 CURR_DIR = os.path.dirname(os.path.abspath(__file__))
-print("CURR_DIR", CURR_DIR)
 # CURR_DIR C:\Users\admin01\Desktop\get_margin_data\parser
+if __name__ == "__main__":
+    # run as a script: put the repo root on sys.path for the package imports below
+    sys.path.insert(0, os.path.normpath(os.path.join(CURR_DIR, '..')))
+
+from parser.capture_watcher import CaptureWatcher
+from parser.rsk335_stream import extract_margin_rows, extract_margin_table
+from proxy.capture_handoff import replace_file
 
 path_with_dots = os.path.join(CURR_DIR, '..', 'calls', 'browser-calls', 'responses', 'curr_response.txt')
 
 RESPONSE_FILE_PATH = os.path.normpath(path_with_dots)
-
-print("RESOLVED_PATH", RESPONSE_FILE_PATH) 
+# the proxy announces every capture it writes here, see proxy/capture_handoff.py
+HANDOFF_FILE_PATH = os.path.normpath(os.path.join(CURR_DIR, '..', 'calls', 'browser-calls', 'handoff.shm'))
 
 # ../calls/browser-calls/responses/curr_response.txt
 
 output_path = os.path.join(CURR_DIR, "margin-utilization-view.json")
+columns_output_path = os.path.join(CURR_DIR, "margin-utilization-view.msgpack")
+history_path = os.path.join(CURR_DIR, "margin-history.sqlite3")
+
+# "stream" reads only RSK335_Table incrementally, "bs4" builds the full BeautifulSoup tree,
+# "columns" streams every row into typed columns (margin-utilization-view.msgpack)
+PARSER_MODE = "stream"
+PARSER_MODES = ("stream", "bs4", "columns")
+
+# the sender reads the first row from margin-utilization-view.json
+WRITE_JSON = True
+# every snapshot also goes into margin-history.sqlite3 (./margin_history.py)
+WRITE_HISTORY = True
+
+# how often watch mode stats curr_response.txt, and the old fixed polling period
+WATCH_INTERVAL = 0.05
+POLL_INTERVAL = 10
 
-def parse_response():
-    # Load the uploaded response.txt file
-    with open(RESPONSE_FILE_PATH, "r", encoding="utf-8") as f:
-        content = f.read()
+def _parse_with_bs4(path, body=None):
+    from bs4 import BeautifulSoup
+
+    if body is not None:
+        content = body.decode("utf-8")
+    else:
+        # Load the uploaded response.txt file
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
 
     # Parse HTML
     soup = BeautifulSoup(content, "html.parser")
@@ -39,16 +66,109 @@ def parse_response():
             values = [td.get_text(strip=True) for td in row.find_all("td")]
 
             # Combine into dictionary
-            table_data = dict(zip(headers, values))
+            return dict(zip(headers, values))
+    return None
 
-            # Save to JSON file
-            
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(table_data, f, indent=4, ensure_ascii=False)
+def _parse_columns(path, body=None):
+    # msgpack is only needed in columns mode
+    from parser.margin_columns import to_columns, write_columns
 
-            print("table parsed")
+    table = extract_margin_rows(path if body is None else body)
+    if not table:
+        return None
 
-if __name__ == "__main__":
+    headers, rows = table
+    write_columns(columns_output_path, to_columns(headers, rows))
+    print(f"{len(rows)} rows written to {columns_output_path}")
+    return dict(zip(headers, rows[0]))
+
+_history = None
+
+def _append_history(table_data, path, captured_at=None):
+    global _history
+    if _history is None:
+        # sqlite is only opened once there is something to store
+        from parser.margin_history import MarginHistory
+        _history = MarginHistory(history_path)
+    # without a handoff, the proxy wrote the capture at mtime
+    _history.append(table_data, captured_at if captured_at is not None else os.path.getmtime(path))
+
+def parse_response(mode=None, path=RESPONSE_FILE_PATH, write_json=None, write_history=None,
+                   body=None, captured_at=None):
+    """Parse the capture at path, or body when the caller already read it"""
+    mode = mode or PARSER_MODE
+    write_json = WRITE_JSON if write_json is None else write_json
+    write_history = WRITE_HISTORY if write_history is None else write_history
+
+    table_data = None
+    if mode == "columns":
+        try:
+            table_data = _parse_columns(path, body)
+        except Exception as e:
+            # the fallback only gives the first row, no columns file
+            print(f"Columnar parse failed ({e}), falling back to BeautifulSoup")
+            mode = "bs4"
+
+    elif mode == "stream":
+        try:
+            table_data = extract_margin_table(path if body is None else body)
+        except Exception as e:
+            # fall back to the full DOM parse on anything the tokenizer chokes on
+            print(f"Streaming parse failed ({e}), falling back to BeautifulSoup")
+            mode = "bs4"
+
+    if mode == "bs4":
+        table_data = _parse_with_bs4(path, body)
+
+    if table_data and write_json:
+        # Save to JSON file, replaced whole so the sender never reads half of it
+        replace_file(output_path, json.dumps(table_data, indent=4, ensure_ascii=False).encode("utf-8"))
+
+        print("table parsed")
+
+    if table_data and write_history:
+        try:
+            _append_history(table_data, path, captured_at)
+        except Exception as e:
+            # the history is a side output, the JSON and the sender go on without it
+            print(f"Could not store snapshot in history: {e}")
+
+    return table_data
+
+def watch_responses(interval=WATCH_INTERVAL, mode=None, write_json=None, write_history=None):
+    """Parse curr_response.txt only when the proxy has recorded a new capture"""
+    watcher = CaptureWatcher(RESPONSE_FILE_PATH, interval, HANDOFF_FILE_PATH)
     while True:
-        parse_response()
-        time.sleep(10)  # wait 10 seconds
\ No newline at end of file
+        watcher.wait()
+        try:
+            body = watcher.read()
+            if parse_response(mode, write_json=write_json, write_history=write_history,
+                              body=body, captured_at=watcher.captured_at):
+                watcher.mark_done()
+            else:
+                # e.g. a login or error page, wait for the next capture
+                watcher.mark_failed()
+        except (FileNotFoundError, UnicodeDecodeError) as e:
+            # caught the file mid-rotation, the next write will trigger us again
+            print(f"Could not parse {RESPONSE_FILE_PATH}: {e}")
+            watcher.mark_failed()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Parse RSK335 captures into margin-utilization-view.json")
+    ap.add_argument("--poll", action="store_true", help=f"re-parse every {POLL_INTERVAL}s instead of watching for new captures")
+    ap.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="seconds between checks in watch mode")
+    ap.add_argument("--mode", choices=PARSER_MODES, default=PARSER_MODE, help="parser to use")
+    ap.add_argument("--no-json", dest="write_json", action="store_false", default=WRITE_JSON,
+                    help="don't write margin-utilization-view.json")
+    ap.add_argument("--no-history", dest="write_history", action="store_false", default=WRITE_HISTORY,
+                    help="don't store snapshots in margin-history.sqlite3")
+    args = ap.parse_args()
+
+    print("RESOLVED_PATH", RESPONSE_FILE_PATH)
+
+    if args.poll:
+        while True:
+            parse_response(args.mode, write_json=args.write_json, write_history=args.write_history)
+            time.sleep(POLL_INTERVAL)  # wait 10 seconds
+    else:
+        watch_responses(args.interval, args.mode, args.write_json, args.write_history)
\ No newline at end of file
@@ -0,0 +1,211 @@
+import re
+import codecs
+from html.parser import HTMLParser
+
+TABLE_ID = "RSK335_Table"
+CHUNK_SIZE = 64 * 1024
+# bytes kept from the previous chunk while looking for the table's start tag
+START_TAG_OVERLAP = 4096
+
+
+class _TableFound(Exception):
+    """Raised from inside the tokenizer once the rows we want have been read"""
+
+
+class RSK335TableParser(HTMLParser):
+    """
+    Incremental extractor for the header and data rows of RSK335_Table.
+
+    It only looks at tags inside the target table, keeps nothing else of the
+    document, and stops (raises _TableFound) as soon as the first tbody row
+    is complete, or at the end of the table with all_rows=True. Text is
+    collected the way BeautifulSoup's get_text(strip=True) does it: each
+    string stripped, then joined.
+    """
+
+    def __init__(self, table_id: str = TABLE_ID, all_rows: bool = False):
+        super().__init__(convert_charrefs=True)
+        self.table_id = table_id
+        self.all_rows = all_rows
+        self.headers = []
+        self.values = []         # cells of the row being read
+        self.rows = []           # completed, non-empty rows
+        self.done = False
+
+        self._depth = 0          # nesting depth of <table> inside the target, 0 = outside
+        self._section = None     # "thead" / "tbody" of the target table
+        self._seen_thead = False
+        self._in_row = False
+        self._cell = None        # stripped strings of the th/td being read
+        self._text = []          # raw data of the current string, split across feeds
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if self._depth == 0:
+            if tag == "table" and dict(attrs).get("id") == self.table_id:
+                self._depth = 1
+            return
+
+        if tag == "table":
+            self._depth += 1
+            return
+        if self._depth != 1:
+            return
+
+        if tag == "thead":
+            self._section = "thead" if not self._seen_thead else None
+            self._seen_thead = True
+            self._in_row = False
+        elif tag == "tbody":
+            self._close_cell()
+            self._section = "tbody"
+            self._in_row = False
+        elif tag == "tr":
+            self._close_cell()
+            if self._in_row and self._section == "tbody":
+                self._end_row()
+            self._in_row = True
+        elif tag == "th" and self._section == "thead":
+            self._close_cell()
+            self._cell = []
+        elif tag == "td" and self._section == "tbody" and self._in_row:
+            self._close_cell()
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if self._depth == 0:
+            return
+        if tag == "table":
+            self._depth -= 1
+            if self._depth == 0:
+                self._close_cell()
+                if self.values:
+                    self._end_row()
+                self.done = True
+            return
+        if self._depth != 1:
+            return
+
+        if tag in ("th", "td"):
+            self._close_cell()
+        elif tag == "tr":
+            self._close_cell()
+            if self._section == "tbody" and self._in_row:
+                self._end_row()
+            self._in_row = False
+        elif tag == "thead":
+            self._close_cell()
+            self._section = None
+            self._in_row = False
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._text.append(data)
+
+    def _flush_text(self):
+        # a string only ends at a tag, the tokenizer may hand it over in pieces
+        if self._text:
+            text = "".join(self._text).strip()
+            if text:
+                self._cell.append(text)
+            self._text = []
+
+    def _close_cell(self):
+        if self._cell is None:
+            return
+        self._flush_text()
+        text = "".join(self._cell)
+        if self._section == "thead":
+            self.headers.append(text)
+        else:
+            self.values.append(text)
+        self._cell = None
+
+    def _end_row(self):
+        if self.values:
+            self.rows.append(self.values)
+        self.values = []
+        if not self.all_rows:
+            self._finish()
+
+    def _finish(self):
+        self.done = True
+        raise _TableFound()
+
+    def result(self):
+        """{header: value} of the first row, None if the table/row was not found"""
+        if not self.rows:
+            return None
+        return dict(zip(self.headers, self.rows[0]))
+
+
+def extract_margin_table(source, table_id: str = TABLE_ID, chunk_size: int = CHUNK_SIZE):
+    """
+    Stream `source` (a file path, binary file object or bytes-like object)
+    through RSK335TableParser, reading only until the first row of the table
+    has been seen. Returns {header: value} or None.
+
+    Everything before the table's start tag is skipped with a bytes search
+    and never reaches the tokenizer.
+    """
+    parser = RSK335TableParser(table_id)
+    _parse(parser, source, chunk_size)
+    return parser.result()
+
+
+def extract_margin_rows(source, table_id: str = TABLE_ID, chunk_size: int = CHUNK_SIZE):
+    """
+    Like extract_margin_table(), but reads the whole table.
+    Returns (headers, rows) with every row a list of cell strings,
+    or None if the table has no data rows.
+    """
+    parser = RSK335TableParser(table_id, all_rows=True)
+    _parse(parser, source, chunk_size)
+
+    if not parser.rows:
+        return None
+    return parser.headers, parser.rows
+
+
+def _parse(parser: RSK335TableParser, source, chunk_size: int):
+    start_re = re.compile(
+        rb"<table\b[^>]*\bid\s*=\s*[\"']?" + re.escape(parser.table_id.encode("ascii")) + rb"[\"'\s/>]",
+        re.IGNORECASE,
+    )
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        chunks = (view[i:i + chunk_size] for i in range(0, len(view), chunk_size))
+        _feed(parser, start_re, chunks)
+    elif isinstance(source, str):
+        with open(source, "rb") as f:
+            _feed(parser, start_re, iter(lambda: f.read(chunk_size), b""))
+    else:
+        _feed(parser, start_re, iter(lambda: source.read(chunk_size), b""))
+
+
+def _feed(parser: RSK335TableParser, start_re, chunks):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = b""
+
+    try:
+        for chunk in chunks:
+            if pending is not None:
+                # still before the table, look for its start tag
+                pending += bytes(chunk)
+                m = start_re.search(pending)
+                if not m:
+                    pending = pending[-START_TAG_OVERLAP:]
+                    continue
+                chunk, pending = pending[m.start():], None
+
+            parser.feed(decoder.decode(chunk))
+            if parser.done:
+                return
+
+        if pending is None:
+            parser.feed(decoder.decode(b"", final=True))
+            parser.close()
+    except _TableFound:
+        pass
@@ -0,0 +1,137 @@
+import os
+import mmap
+import time
+import struct
+import tempfile
+from collections import namedtuple
+
+# Layout of the handoff file, one slot per kind:
+#   magic (4s) | 4 pad | request slot | response slot
+#   slot: gen (Q) | capture seq (Q) | size (Q) | timestamp (d) | mtime_ns (Q)
+# gen is a seqlock: odd while the proxy is publishing, even once done.
+# size and mtime_ns identify the file the seq belongs to, os.replace keeps both.
+HANDOFF_MAGIC = b"MCXH"
+HANDOFF_HEADER = struct.Struct("<4s4x")
+HANDOFF_SLOT = struct.Struct("<QQQdQ")
+HANDOFF_KINDS = ("request", "response")
+HANDOFF_SIZE = 4096
+
+# os.replace onto a file another process has open fails on Windows; the
+# parser only keeps it open to read it into memory, so a few short retries do
+REPLACE_RETRIES = 5
+REPLACE_RETRY_DELAY = 0.002
+
+Handoff = namedtuple("Handoff", "seq size timestamp mtime_ns")
+
+
+def _slot_offset(kind: str) -> int:
+    return HANDOFF_HEADER.size + HANDOFF_KINDS.index(kind) * HANDOFF_SLOT.size
+
+
+def replace_file(path: str, body: bytes) -> os.stat_result:
+    """
+    Write body to path via a temp file in the same dir and os.replace, readers
+    see old or new, never half. Returns the stat of what is now at path.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+            f.flush()
+            st = os.fstat(f.fileno())
+        for attempt in range(REPLACE_RETRIES):
+            try:
+                os.replace(tmp, path)
+                return st
+            except PermissionError:
+                if attempt == REPLACE_RETRIES - 1:
+                    raise
+                time.sleep(REPLACE_RETRY_DELAY)
+    finally:
+        if os.path.exists(tmp):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+class CaptureHandoffWriter:
+    """
+    Announces each capture written to curr_request.txt/curr_response.txt:
+    its capture seq (the CaptureStore's), size and time, in a small
+    memory-mapped file other processes poll without touching the capture.
+    Publish only after the file is in place.
+    """
+
+    def __init__(self, path: str):
+        # open in place rather than recreate, readers may still have it mapped
+        mode = "r+b" if os.path.exists(path) else "w+b"
+        self._file = open(path, mode)
+        if os.path.getsize(path) != HANDOFF_SIZE:
+            self._file.truncate(HANDOFF_SIZE)
+        self._mm = mmap.mmap(self._file.fileno(), HANDOFF_SIZE)
+        if HANDOFF_HEADER.unpack_from(self._mm, 0)[0] != HANDOFF_MAGIC:
+            self._mm[:HANDOFF_SIZE] = bytes(HANDOFF_SIZE)
+            HANDOFF_HEADER.pack_into(self._mm, 0, HANDOFF_MAGIC)
+
+    def publish(self, kind: str, seq: int, stat: os.stat_result, timestamp: float = None):
+        """Announce capture seq, whose file replace_file() returned stat for"""
+        offset = _slot_offset(kind)
+        gen = HANDOFF_SLOT.unpack_from(self._mm, offset)[0]
+        gen += 2 if gen % 2 == 0 else 1
+        timestamp = time.time() if timestamp is None else timestamp
+        struct.pack_into("<Q", self._mm, offset, gen - 1)
+        HANDOFF_SLOT.pack_into(self._mm, offset, gen - 1, seq, stat.st_size, timestamp, stat.st_mtime_ns)
+        struct.pack_into("<Q", self._mm, offset, gen)
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+class CaptureHandoffReader:
+    """Reads the proxy's CaptureHandoffWriter; read() is a few bytes from a mapping, no syscall"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._mm = None
+
+    def read(self, kind: str = "response", retries: int = 100):
+        """Handoff of the latest capture of `kind`, None if the proxy has not published one"""
+        if self._mm is None and not self._open():
+            return None
+        if HANDOFF_HEADER.unpack_from(self._mm, 0)[0] != HANDOFF_MAGIC:
+            return None
+
+        offset = _slot_offset(kind)
+        for _ in range(retries):
+            gen, seq, size, timestamp, mtime_ns = HANDOFF_SLOT.unpack_from(self._mm, offset)
+            if gen & 1:
+                # proxy is in the middle of a publish
+                time.sleep(0)
+                continue
+            if struct.unpack_from("<Q", self._mm, offset)[0] != gen:
+                continue
+            return Handoff(seq, size, timestamp, mtime_ns) if seq else None
+        return None
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+            self._file = None
+
+    def _open(self) -> bool:
+        try:
+            self._file = open(self.path, "rb")
+            if os.fstat(self._file.fileno()).st_size < HANDOFF_SIZE:
+                raise ValueError("handoff file not initialized")
+            self._mm = mmap.mmap(self._file.fileno(), HANDOFF_SIZE, access=mmap.ACCESS_READ)
+            return True
+        except (OSError, ValueError):
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            return False
@@ -0,0 +1,237 @@
+"""
+Ring-buffered, content-addressed history of recorded margin flows.
+
+    python -m proxy.capture_store [--dir calls/captures] list [--kind response]
+    python -m proxy.capture_store [--dir calls/captures] show SEQ > capture.txt
+"""
+import os
+import sys
+import time
+import struct
+import hashlib
+import argparse
+import threading
+from bisect import bisect_right
+from collections import Counter, namedtuple
+
+import zstandard
+
+KINDS = {"request": 1, "response": 2}
+KIND_NAMES = {v: k for k, v in KINDS.items()}
+
+# how an object is stored: "" = zstd frame written here, the rest are bodies
+# kept as they came over the wire (Content-Encoding), decoded on read()
+ENCODINGS = {"": 0, "gzip": 1, "deflate": 2, "br": 3, "zstd": 4}
+ENCODING_NAMES = {v: k for k, v in ENCODINGS.items()}
+EXTENSIONS = {"": ".zst", "gzip": ".gz", "deflate": ".deflate", "br": ".br", "zstd": ".zstd"}
+
+# seq, timestamp, kind, digest, stored body size, encoding; one fixed 64 byte slot per capture.
+# Rings written before the encoding byte have 0 there, i.e. zstd.
+SLOT = struct.Struct("<QdB16sIB")
+SLOT_SIZE = 64
+
+Capture = namedtuple("Capture", "seq timestamp kind digest size encoding")
+
+
+class CaptureStore:
+    """
+    Keeps the last `slots` captures of margin requests/responses.
+
+    Bodies are stored once per content hash under objects/ as zstd frames,
+    or with `encoding` as the compressed bytes they arrived in, which saves
+    compressing them again and defers decompressing to read(). The ring
+    itself is a preallocated index file whose slots are overwritten in
+    place, so recording a capture never renames or rewrites history.
+    A body that drops out of the ring is deleted once nothing refers to it.
+    With `read_only` the store only reads what is there, while a proxy may
+    still be writing to it: nothing is resized, cleaned up or added.
+    """
+
+    def __init__(self, directory: str, slots: int = 256, level: int = 3, read_only: bool = False):
+        self.directory = directory
+        self.slots = slots
+        self.level = level
+        self.read_only = read_only
+
+        self._objects_dir = os.path.join(directory, "objects")
+        if not read_only:
+            os.makedirs(self._objects_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._entries = {}       # slot -> Capture
+        self._refs = Counter()   # digest -> captures in the ring
+        self._seq = 0
+
+        index_path = os.path.join(directory, "index.ring")
+        size = slots * SLOT_SIZE
+        if read_only:
+            mode = "rb"
+        else:
+            mode = "r+b" if os.path.exists(index_path) else "w+b"
+        self._index = open(index_path, mode)
+        if not read_only and os.path.getsize(index_path) != size:
+            # a different ring size means different slot positions, start over
+            self._index.truncate(0)
+            self._index.truncate(size)
+        self._load()
+
+    # ---- writing ----
+    def add(self, kind: str, body: bytes, timestamp: float = None, encoding: str = "") -> Capture:
+        """Record `body`; with `encoding` (a Content-Encoding in ENCODINGS) it is kept compressed as is"""
+        if self.read_only:
+            raise ValueError("capture store opened read-only")
+        # the same bytes under another encoding are a different object
+        digest = hashlib.blake2b(body, digest_size=16, person=encoding.encode()).digest()
+        timestamp = time.time() if timestamp is None else timestamp
+
+        with self._lock:
+            known = self._refs[digest] > 0
+        # compress outside the lock, it is the expensive part
+        frame = None if known or encoding else self._compressor().compress(body)
+
+        with self._lock:
+            if self._refs[digest] == 0:
+                if encoding:
+                    frame = body
+                elif frame is None:
+                    frame = self._compressor().compress(body)
+                self._write_object(digest, encoding, frame)
+
+            self._seq += 1
+            entry = Capture(self._seq, timestamp, kind, digest, len(body), encoding)
+            slot = entry.seq % self.slots
+
+            self._index.seek(slot * SLOT_SIZE)
+            self._index.write(SLOT.pack(entry.seq, entry.timestamp, KINDS[kind], digest, entry.size,
+                                        ENCODINGS[encoding]))
+            self._index.flush()
+
+            old = self._entries.get(slot)
+            self._entries[slot] = entry
+            self._refs[digest] += 1
+            if old is not None:
+                self._release(old)
+        return entry
+
+    def close(self):
+        with self._lock:
+            self._index.close()
+
+    # ---- reading ----
+    def captures(self, kind: str = None, since: float = None, until: float = None) -> list:
+        """Captures in the ring, oldest first, optionally by kind and time range"""
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: e.seq)
+        return [
+            e for e in entries
+            if (kind is None or e.kind == kind)
+            and (since is None or e.timestamp >= since)
+            and (until is None or e.timestamp <= until)
+        ]
+
+    def at(self, timestamp: float, kind: str = "response"):
+        """The capture of `kind` that was current at `timestamp`, None if older than the ring"""
+        entries = self.captures(kind)
+        i = bisect_right([e.timestamp for e in entries], timestamp)
+        return entries[i - 1] if i else None
+
+    def latest(self, kind: str = "response"):
+        entries = self.captures(kind)
+        return entries[-1] if entries else None
+
+    def read(self, entry: Capture) -> bytes:
+        with open(self._object_path(entry.digest, entry.encoding), "rb") as f:
+            data = f.read()
+        if not entry.encoding:
+            return zstandard.ZstdDecompressor().decompress(data, max_output_size=entry.size)
+        # bodies kept as received are decoded like mitmproxy would, which is only imported for them
+        from mitmproxy.net import encoding
+        return encoding.decode(data, entry.encoding)
+
+    # ---- internals ----
+    def _compressor(self):
+        # ZstdCompressor instances must not be shared between threads
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level, write_content_size=True)
+        return compressor
+
+    def _object_path(self, digest: bytes, encoding: str = "") -> str:
+        return os.path.join(self._objects_dir, digest.hex() + EXTENSIONS[encoding])
+
+    def _write_object(self, digest: bytes, encoding: str, frame: bytes):
+        path = self._object_path(digest, encoding)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(frame)
+        os.replace(tmp, path)
+
+    def _release(self, entry: Capture):
+        digest = entry.digest
+        self._refs[digest] -= 1
+        if self._refs[digest] <= 0:
+            del self._refs[digest]
+            try:
+                os.remove(self._object_path(digest, entry.encoding))
+            except FileNotFoundError:
+                pass
+
+    def _load(self):
+        self._index.seek(0)
+        raw = self._index.read()
+        for slot in range(self.slots):
+            seq, timestamp, kind, digest, size, encoding = SLOT.unpack_from(raw, slot * SLOT_SIZE)
+            if not seq or kind not in KIND_NAMES or encoding not in ENCODING_NAMES:
+                continue
+            encoding = ENCODING_NAMES[encoding]
+            if not os.path.exists(self._object_path(digest, encoding)):
+                continue
+            self._entries[slot] = Capture(seq, timestamp, KIND_NAMES[kind], digest, size, encoding)
+            self._refs[digest] += 1
+            self._seq = max(self._seq, seq)
+        if self.read_only:
+            # a live proxy writes the object before its slot, what looks orphaned may be in flight
+            return
+
+        # bodies left behind by a crash between writing the object and its slot
+        for name in os.listdir(self._objects_dir):
+            digest_hex = name.split(".", 1)[0]
+            try:
+                digest = bytes.fromhex(digest_hex)
+            except ValueError:
+                continue
+            if name.endswith(".tmp") or digest not in self._refs:
+                os.remove(os.path.join(self._objects_dir, name))
+
+
+def main():
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'calls', 'captures')
+    ap = argparse.ArgumentParser(description="Inspect the proxy's capture history")
+    ap.add_argument("--dir", default=os.path.normpath(default_dir))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ls = sub.add_parser("list", help="list captures, oldest first")
+    ls.add_argument("--kind", choices=sorted(KINDS))
+    show = sub.add_parser("show", help="write a capture's body to stdout")
+    show.add_argument("seq", type=int)
+    args = ap.parse_args()
+
+    if not os.path.exists(os.path.join(args.dir, "index.ring")):
+        sys.exit(f"No capture store in {args.dir}")
+    # the proxy may be running, so only read: sized from the existing ring, no clean-up
+    slots = os.path.getsize(os.path.join(args.dir, "index.ring")) // SLOT_SIZE
+    store = CaptureStore(args.dir, slots=slots, read_only=True)
+
+    if args.cmd == "list":
+        for e in store.captures(args.kind):
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(e.timestamp))
+            print(f"{e.seq:>8}  {stamp}  {e.kind:<8}  {e.size:>9}  {e.encoding or '-':<7}  {e.digest.hex()}")
+    else:
+        match = [e for e in store.captures() if e.seq == args.seq]
+        if not match:
+            sys.exit(f"Capture {args.seq} is not in the ring")
+        sys.stdout.buffer.write(store.read(match[0]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import os
+import json
+import mmap
+import time
+import struct
+import threading
+from types import MappingProxyType
+
+from proxy.log import get_logger
+
+log = get_logger("credentials")
+
+# Layout of the shared credentials file:
+#   magic (4s) | seq (Q) | payload length (I) | compact json payload
+# seq is a seqlock: odd while the proxy is writing, 2 * version once done.
+SHARED_MAGIC = b"MCXC"
+SHARED_HEADER = struct.Struct("<4sQI")
+SHARED_SEQ_OFFSET = 4
+SHARED_SIZE = 64 * 1024
+
+
+class CredentialStore:
+    """
+    Versioned, copy-on-write credential store.
+
+    Readers call snapshot() and get an immutable mapping without taking any
+    lock; writers build a new dict, bump `version` and swap the reference.
+    When `shared_path` is given, every new version is also published to a
+    memory-mapped file so other processes can read it (see SharedCredentialsReader).
+    """
+
+    def __init__(self, initial: dict = None, shared_path: str = None):
+        self.version = 0
+        self._snapshot = MappingProxyType(dict(initial or {}))
+        self._write_lock = threading.Lock()
+        self._shared = None
+
+        if shared_path:
+            try:
+                self._shared = _SharedCredentialsWriter(shared_path)
+            except OSError as e:
+                log.warning(f"[Proxy] Shared credentials disabled, could not map {shared_path}: {e}")
+            else:
+                # keep counting from the last run so readers never see a version go back
+                self.version = self._shared.last_version + 1
+                self._shared.publish(self.version, dict(self._snapshot))
+
+    def snapshot(self):
+        """Current credentials, an immutable mapping that never changes under you"""
+        return self._snapshot
+
+    def get(self, name: str, default=None):
+        return self._snapshot.get(name, default)
+
+    def update(self, changes: dict) -> bool:
+        """Apply changes as a new version, returns False if nothing changed"""
+        with self._write_lock:
+            current = self._snapshot
+            if all(current.get(k) == v for k, v in changes.items()):
+                return False
+
+            data = dict(current)
+            data.update(changes)
+            self.version += 1
+            self._snapshot = MappingProxyType(data)
+
+            if self._shared is not None:
+                self._shared.publish(self.version, data)
+            return True
+
+
+class _SharedCredentialsWriter:
+    def __init__(self, path: str, size: int = SHARED_SIZE):
+        # open in place rather than recreate, readers may still have it mapped
+        mode = "r+b" if os.path.exists(path) else "w+b"
+        self._file = open(path, mode)
+        if os.path.getsize(path) != size:
+            self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        self._size = size
+
+        magic, seq, _ = SHARED_HEADER.unpack_from(self._mm, 0)
+        self.last_version = (seq + 1) // 2 if magic == SHARED_MAGIC else 0
+
+    def publish(self, version: int, data: dict):
+        payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        if SHARED_HEADER.size + len(payload) > self._size:
+            log.warning(f"[Proxy] Shared credentials payload too large ({len(payload)} bytes), not published")
+            return
+
+        seq = version * 2
+        struct.pack_into("<Q", self._mm, SHARED_SEQ_OFFSET, seq - 1)
+        self._mm[SHARED_HEADER.size:SHARED_HEADER.size + len(payload)] = payload
+        SHARED_HEADER.pack_into(self._mm, 0, SHARED_MAGIC, seq, len(payload))
+
+
+class SharedCredentialsReader:
+    """
+    Reads the credentials published by the proxy's CredentialStore.
+
+    read() only parses the json when the proxy has published a new version
+    since the last call, otherwise it returns the cached dict.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version = -1
+        self._data = None
+        self._file = None
+        self._mm = None
+
+    def read(self, retries: int = 100):
+        """Latest credentials dict, or None if the proxy has not published any"""
+        if self._mm is None and not self._open():
+            return None
+
+        for _ in range(retries):
+            magic, seq, length = SHARED_HEADER.unpack_from(self._mm, 0)
+            if magic != SHARED_MAGIC:
+                return None
+            if seq & 1:
+                # proxy is in the middle of a publish
+                time.sleep(0)
+                continue
+            if seq // 2 == self.version:
+                return self._data
+
+            payload = self._mm[SHARED_HEADER.size:SHARED_HEADER.size + length]
+            if struct.unpack_from("<Q", self._mm, SHARED_SEQ_OFFSET)[0] != seq:
+                continue
+
+            self._data = json.loads(payload)
+            self.version = seq // 2
+            return self._data
+
+        return self._data
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+            self._file = None
+
+    def _open(self) -> bool:
+        try:
+            self._file = open(self.path, "rb")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            return True
+        except (OSError, ValueError):
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            return False
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import tempfile
+import threading
+
+from proxy.log import get_logger
+
+log = get_logger("credentials")
+
+
+def write_json_atomic(path: str, data: dict):
+    """Write data to path via a temp file in the same dir and os.replace"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            try:
+                os.remove(tmp)
+            except Exception:
+                pass
+
+
+class CredentialWriter:
+    """
+    Background writer for credentials.json.
+
+    submit() only swaps the latest snapshot in and returns; a daemon thread
+    writes it at most once every `min_interval` seconds. Snapshots submitted
+    while one is still pending replace it (counted in `coalesced`), so a
+    burst of token changes costs a single write of the newest state.
+    """
+
+    def __init__(self, path: str, min_interval: float = 1.0):
+        self.path = path
+        self.min_interval = min_interval
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.writes = 0
+        self.errors = 0
+
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._pending = None
+        self._seq = 0
+        self._written_seq = 0
+        self._last_write = 0.0
+        self._closed = False
+        self._thread = None
+
+    def submit(self, creds: dict):
+        with self._cond:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._seq += 1
+            self._pending = (self._seq, dict(creds))
+            self.submitted += 1
+
+            closed = self._closed
+            if not closed:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="credential-writer", daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+
+        if closed:
+            # the writer thread is gone, write it from the caller
+            self.flush()
+
+    def flush(self):
+        """Write the pending snapshot now, from the calling thread"""
+        with self._cond:
+            pending, self._pending = self._pending, None
+        if pending is not None:
+            self._write(*pending)
+
+    def close(self, timeout: float = 5.0):
+        """Stop the writer thread, writing whatever is still pending"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "writes": self.writes,
+            "errors": self.errors,
+        }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+
+                # bounded rate: keep absorbing submits until the interval is up
+                delay = self._last_write + self.min_interval - time.monotonic()
+                while delay > 0 and not self._closed:
+                    self._cond.wait(delay)
+                    delay = self._last_write + self.min_interval - time.monotonic()
+
+                pending, self._pending = self._pending, None
+            # flush() may have taken it while we were waiting
+            if pending is not None:
+                self._write(*pending)
+
+    def _write(self, seq: int, creds: dict):
+        with self._io_lock:
+            # a newer snapshot may already be on disk if flush() raced the thread
+            if seq <= self._written_seq:
+                return
+            try:
+                write_json_atomic(self.path, creds)
+                self._written_seq = seq
+                self.writes += 1
+            except Exception as e:
+                self.errors += 1
+                log.error(f"[Proxy] Error writing credentials to {self.path}: {e}")
+            finally:
+                self._last_write = time.monotonic()
@@ -0,0 +1,97 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import unquote, unquote_plus
+
+from proxy.log import get_logger
+
+log = get_logger("filter")
+
+
+class FilterClassifier:
+    """
+    Decides whether a margin request body is the default (unfiltered) view.
+
+    Gives the same verdict as parse_qs() over the whole form followed by the
+    field checks, but only decodes the fields it cares about and returns on
+    the first one that shows a filter. Verdicts are cached by body digest,
+    since the auto-refresher sends the same body again and again. The
+    cache is shared by the hook threads under a lock; the scan runs outside it.
+    """
+
+    def __init__(self, empty_fields, dflt_fields, default_squery: str, cache_size: int = 256):
+        self.empty_fields = frozenset(empty_fields)
+        self.dflt_fields = frozenset(dflt_fields)
+        self.default_squery = default_squery
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+
+        self._wanted = self.empty_fields | self.dflt_fields | {"sQuery"}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def classify(self, body: bytes) -> bool:
+        """True if none of the checked fields carries a filter"""
+        key = hashlib.blake2b(body, digest_size=16).digest()
+        with self._lock:
+            verdict = self._cache.get(key)
+            if verdict is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return verdict
+            self.misses += 1
+
+        verdict, reason = self._scan(body)
+        if reason:
+            log.info(f"[Proxy] FILTERED: Skipping recording. {reason}")
+
+        with self._lock:
+            self._cache[key] = verdict
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return verdict
+
+    def _scan(self, body: bytes):
+        """(verdict, reason) from one pass over the urlencoded pairs"""
+        # parse_qs() rejected the whole body when it was not valid utf-8
+        if not body.isascii():
+            try:
+                body.decode("utf-8")
+            except UnicodeDecodeError:
+                return False, "Request body is not valid utf-8"
+
+        seen = set()
+        for pair in body.split(b"&"):
+            name, sep, value = pair.partition(b"=")
+            # like parse_qs: pairs without "=" or with a blank value don't count
+            if not sep or not value:
+                continue
+
+            name = self._decode_name(name)
+            if name not in self._wanted or name in seen:
+                continue
+            seen.add(name)
+
+            value = unquote_plus(value.decode("utf-8"), errors="replace")
+            if name in self.empty_fields:
+                return False, f"Field '{name}' has value: '{value}'"
+            if name in self.dflt_fields:
+                if value != "DFLT":
+                    return False, f"Field '{name}' has value: '{value}'"
+            elif value != self.default_squery:
+                return False, f"sQuery is '{value}'"
+
+        missing = self.dflt_fields - seen
+        if missing:
+            return False, f"Field '{min(missing)}' has value: ''"
+        return True, None
+
+    @staticmethod
+    def _decode_name(raw: bytes) -> str:
+        name = raw.decode("utf-8")
+        if "+" in name:
+            name = name.replace("+", " ")
+        if "%" in name:
+            name = unquote(name, errors="replace")
+        return name
@@ -0,0 +1,37 @@
+import weakref
+
+from proxy.capture_store import ENCODINGS
+
+# message -> (raw_content, decoded body); entries go away with the flow
+_decoded = weakref.WeakKeyDictionary()
+
+
+def decoded_body(message) -> bytes:
+    """
+    message.get_content(strict=False), decoded at most once per message.
+
+    The recorder, the token extractor and the pipeline/supervisor parser
+    all get the same bytes object, so a big gzip/br/zstd page is
+    decompressed once instead of once per reader (mitmproxy's own cache
+    holds a single body for all flows, and loses it to the next flow that
+    is decoded in between). The entry is keyed on raw_content, so a
+    rewritten body is decoded again. Bodies without Content-Encoding are
+    raw_content itself, no copy.
+    """
+    raw = message.raw_content
+    if not raw or "content-encoding" not in message.headers:
+        return raw
+
+    cached = _decoded.get(message)
+    if cached is not None and cached[0] is raw:
+        return cached[1]
+
+    body = message.get_content(strict=False)
+    _decoded[message] = (raw, body)
+    return body
+
+
+def content_encoding(message) -> str:
+    """The Content-Encoding of a message that a CaptureStore can keep as is, "" otherwise"""
+    ce = message.headers.get("content-encoding", "").strip().lower()
+    return ce if ce in ENCODINGS else ""
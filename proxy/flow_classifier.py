@@ -0,0 +1,72 @@
+import re
+from urllib.parse import urlsplit
+
+NOT_TARGET = 0
+TARGET = 1
+MARGIN = 2
+
+METADATA_KEY = "mcx_flow_class"
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def split_list(value: str) -> list:
+    """'a, b\\n c' -> ['a', 'b', 'c'], for list-valued config entries"""
+    return [item for item in re.split(r"[\s,]+", value or "") if item]
+
+
+def _origin_and_path(url: str):
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    port = parts.port or DEFAULT_PORTS.get(scheme)
+    path = parts.path or ("/" if parts.query else "")
+    if parts.query:
+        path += "?" + parts.query
+    return (parts.hostname or "").lower(), scheme, port, path
+
+
+class FlowClassifier:
+    """
+    Decides once per flow whether it is a monitored flow, and whether it is
+    the margin call, without building the URL string.
+
+    Flows are rejected on request.host with one dict lookup; only flows to
+    a monitored host get their scheme/port/path compared against the
+    precompiled prefixes of the monitored URLs. The verdict is kept in
+    flow.metadata, so the response hook and the helpers reuse it.
+    """
+
+    def __init__(self, monitored_urls, margin_url: str, hosts=None):
+        allowed = {h.lower() for h in hosts} if hosts else None
+
+        # host -> [(scheme, port, path prefix)]
+        self.prefixes = {}
+        for url in monitored_urls:
+            host, scheme, port, path = _origin_and_path(url)
+            if not host or (allowed is not None and host not in allowed):
+                continue
+            self.prefixes.setdefault(host, []).append((scheme, port, path))
+
+        self.margin = _origin_and_path(margin_url) if margin_url else None
+
+    def classify(self, flow) -> int:
+        cached = flow.metadata.get(METADATA_KEY)
+        if cached is not None:
+            return cached
+        verdict = self._classify(flow.request)
+        flow.metadata[METADATA_KEY] = verdict
+        return verdict
+
+    def _classify(self, request) -> int:
+        host = request.host.lower()
+        prefixes = self.prefixes.get(host)
+        if prefixes is None:
+            return NOT_TARGET
+
+        scheme, port, path = request.scheme, request.port, request.path
+        if not any(scheme == s and port == p and path.startswith(prefix) for s, p, prefix in prefixes):
+            return NOT_TARGET
+
+        if self.margin == (host, scheme, port, path):
+            return MARGIN
+        return TARGET
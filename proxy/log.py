@@ -0,0 +1,62 @@
+import sys
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+LOGGER_NAME = "mcx"
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(message)s"
+
+_listener = None
+
+
+def get_logger(name: str = None) -> logging.Logger:
+    """The "mcx" logger, or a child of it ("mcx.pipeline")"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def setup_logging(level: str = "INFO", stream=None) -> QueueListener:
+    """
+    Route the "mcx" loggers through a queue to a background thread.
+
+    Hooks only pay for building the record and an unbounded put; the write
+    to stdout happens on the listener thread. Calling it again (mitmproxy
+    reloading the script) replaces the previous listener.
+    """
+    global _listener
+    stop_logging()
+
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    logger = get_logger()
+    logger.handlers = [QueueHandler(records)]
+    logger.propagate = False
+
+    _listener = QueueListener(records, handler)
+    _listener.start()
+    logger.setLevel(logging.INFO)
+    set_level(level)
+    return _listener
+
+
+def stop_logging():
+    """Flush whatever is queued and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def set_level(level: str) -> bool:
+    """
+    Change the level of the "mcx" loggers, e.g. after config.ini was edited.
+    An unknown level is logged and the current one kept, returns False then.
+    """
+    logger = get_logger()
+    try:
+        logger.setLevel(level.upper())
+    except ValueError:
+        logger.error(f"Unknown LOGGING LEVEL {level!r}, keeping {logging.getLevelName(logger.getEffectiveLevel())}")
+        return False
+    return True
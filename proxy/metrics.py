@@ -0,0 +1,216 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds, 10 us .. 250 ms; hooks are expected to sit at the low end
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, Prometheus style (cumulative on export)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (inf if past the last bucket)"""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Counters and histograms for the addon, keyed by (name, label value).
+
+        metrics.inc("flows_total", "targeted")
+        with metrics.time("step_seconds", "is_target"):
+            ...
+    """
+
+    def __init__(self, namespace: str = "mcx_proxy"):
+        self.namespace = namespace
+        self.help = {}
+        self.labels = {}
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str, label: str = None):
+        self.help[name] = help_text
+        self.labels[name] = label
+
+    def inc(self, name: str, label: str = None, value: int = 1):
+        key = (name, label)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, label: str, seconds: float):
+        key = (name, label)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, name: str, label: str = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, label, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        """Plain dict for the periodic stats dump"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+        out = {}
+        for (name, label), value in sorted(counters.items(), key=_sort_key):
+            out[_flat_name(name, label)] = value
+        for (name, label), h in sorted(histograms.items(), key=_sort_key):
+            out[_flat_name(name, label)] = {
+                "count": h.count,
+                "mean_us": round(h.sum / h.count * 1e6, 1) if h.count else 0.0,
+                "p50_us": h.quantile(0.5) * 1e6,
+                "p99_us": h.quantile(0.99) * 1e6,
+            }
+        return out
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+
+        lines = []
+        for name in sorted({n for n, _ in counters}):
+            full = f"{self.namespace}_{name}"
+            lines += self._header(name, full, "counter")
+            for (n, label), value in sorted(counters.items(), key=_sort_key):
+                if n == name:
+                    lines.append(f"{full}{self._label(name, label)} {value}")
+
+        for name in sorted({n for n, _ in histograms}):
+            full = f"{self.namespace}_{name}"
+            lines += self._header(name, full, "histogram")
+            for (n, label), h in sorted(histograms.items(), key=_sort_key):
+                if n != name:
+                    continue
+                with h._lock:
+                    counts, total, hsum = list(h.counts), h.count, h.sum
+                cumulative = 0
+                for bound, count in zip(h.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{full}_bucket{self._label(name, label, le=le)} {cumulative}")
+                lines.append(f"{full}_sum{self._label(name, label)} {hsum}")
+                lines.append(f"{full}_count{self._label(name, label)} {total}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, name, full, kind):
+        lines = []
+        if name in self.help:
+            lines.append(f"# HELP {full} {self.help[name]}")
+        lines.append(f"# TYPE {full} {kind}")
+        return lines
+
+    def _label(self, name, value, **extra) -> str:
+        pairs = []
+        if value is not None:
+            pairs.append(f'{self.labels.get(name) or "kind"}="{value}"')
+        pairs += [f'{k}="{v}"' for k, v in extra.items()]
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _sort_key(item):
+    (name, label), _ = item
+    return name, label or ""
+
+
+def _flat_name(name, label):
+    return f"{name}.{label}" if label is not None else name
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Serves GET /metrics from a daemon thread"""
+
+    daemon_threads = True
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9464):
+        super().__init__((host, port), _MetricsHandler)
+        self.metrics = metrics
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StatsDumper:
+    """Logs Metrics.snapshot() every `interval` seconds from a daemon thread"""
+
+    def __init__(self, metrics: Metrics, interval: float, logger):
+        self.metrics = metrics
+        self.interval = interval
+        self.logger = logger
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-dump", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(1.0)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.logger.info(f"[Proxy] stats: {self.metrics.snapshot()}")
@@ -0,0 +1,31 @@
+from string import Formatter
+
+
+class PayloadTemplate:
+    """
+    A str.format() style template pre-split into encoded byte segments.
+
+    "a={IXHRts}&b={rndaak}" compiles once into [b"a=", "IXHRts", b"&b=", "rndaak"],
+    so render() is a single bytes join of the literals with the encoded values.
+    Only plain {name} fields are supported, no format specs or conversions.
+    """
+
+    def __init__(self, template: str, encoding: str = "utf-8"):
+        self.template = template
+        self.encoding = encoding
+        self.segments = []
+
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if literal:
+                self.segments.append(literal.encode(encoding))
+            if field is None:
+                continue
+            if not field or spec or conversion:
+                raise ValueError(f"Unsupported template field {{{field}}} in payload template")
+            self.segments.append(field)
+
+        self.fields = {seg for seg in self.segments if isinstance(seg, str)}
+
+    def render(self, **values) -> bytes:
+        encoded = {name: str(values[name]).encode(self.encoding) for name in self.fields}
+        return b"".join(seg if isinstance(seg, bytes) else encoded[seg] for seg in self.segments)
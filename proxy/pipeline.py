@@ -0,0 +1,147 @@
+import json
+import time
+import threading
+from collections import deque
+
+from client.publisher import MarginPublisher
+from parser.rsk335_stream import extract_margin_table
+from proxy.capture_handoff import replace_file
+from proxy.log import get_logger
+
+log = get_logger("pipeline")
+
+
+class MarginPipeline:
+    """
+    In-process parse-and-publish for unfiltered margin responses.
+
+    The response hook calls submit() with the body it already has in memory;
+    worker threads parse RSK335_Table and POST the result to `server_url`
+    through `publisher`, built from the [SENDER] settings like the sender's.
+    The queue is bounded and drops the oldest body when full, so a slow or
+    unreachable server can never stall the proxy, only lose stale snapshots.
+    close() lets the workers work off the queue for up to `timeout` seconds;
+    what is left then is counted as dropped.
+    """
+
+    def __init__(self, server_url: str, publisher: MarginPublisher, workers: int = 2, maxsize: int = 8,
+                 output_path: str = None, history=None):
+        self.server_url = server_url
+        self.output_path = output_path
+        # a parser.margin_history.MarginHistory, every snapshot is appended with its capture time
+        self.history = history
+
+        self.submitted = 0
+        self.dropped = 0
+        self.published = 0
+        self.stale = 0
+        self.failed = 0
+
+        self._queue = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._publish_lock = threading.Lock()
+        self._seq = 0
+        self._published_seq = 0
+        self._closed = False
+        # pooled keep-alive session, retries, and no re-send of unchanged snapshots
+        self._publisher = publisher
+
+        self._workers = [
+            threading.Thread(target=self._run, name=f"margin-pipeline-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._workers:
+            t.start()
+
+    def submit(self, body: bytes):
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._seq += 1
+            self._queue.append((self._seq, time.time(), body))
+            self.submitted += 1
+            self._cond.notify()
+
+    def close(self, timeout: float = 2.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for t in self._workers:
+            t.join(max(deadline - time.monotonic(), 0))
+        with self._cond:
+            # the workers did not get to these in time
+            self.dropped += len(self._queue)
+            self._queue.clear()
+
+        if any(t.is_alive() for t in self._workers):
+            # e.g. still retrying a POST, it must not find its session or the history closed under it
+            log.warning("[Pipeline] A worker is still publishing, leaving its session and the history open")
+            return
+        self._publisher.close()
+        if self.history is not None:
+            self.history.close()
+
+    def stats(self) -> dict:
+        return {
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "published": self.published,
+            "stale": self.stale,
+            "failed": self.failed,
+            "http": self._publisher.stats(),
+        }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    # closed and nothing left to publish
+                    return
+                seq, captured_at, body = self._queue.popleft()
+
+            try:
+                self._process(seq, captured_at, body)
+            except Exception as e:
+                with self._publish_lock:
+                    self.failed += 1
+                log.error(f"[Pipeline] Failed to publish margin snapshot: {e}")
+
+    def _process(self, seq: int, captured_at: float, body: bytes):
+        table_data = extract_margin_table(body)
+        if not table_data:
+            return
+
+        # publish one at a time so the server never sees an older snapshot after a newer one
+        with self._publish_lock:
+            if seq < self._published_seq:
+                self.stale += 1
+                return
+            self._published_seq = seq
+
+            if self.output_path:
+                replace_file(self.output_path,
+                             json.dumps(table_data, indent=4, ensure_ascii=False).encode("utf-8"))
+
+            if self.history is not None:
+                try:
+                    self.history.append(table_data, captured_at)
+                except Exception as e:
+                    log.error(f"[Pipeline] Could not store snapshot in history: {e}")
+
+            if self.server_url:
+                response = self._publisher.publish(table_data)
+                if response is None:
+                    return
+                if response.status_code != 200:
+                    self.failed += 1
+                    log.error(f"[Pipeline] Server returned {response.status_code}: {response.text[:200]}")
+                    return
+            # counters are only changed under _publish_lock, several workers share them
+            self.published += 1
+
+        log.info(f"[Pipeline] Published margin snapshot in {(time.time() - captured_at) * 1e3:.1f} ms")
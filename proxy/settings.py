@@ -0,0 +1,248 @@
+import os
+import time
+import threading
+import configparser
+from typing import NamedTuple
+
+from proxy.flow_classifier import split_list
+from proxy.log import get_logger
+
+log = get_logger("settings")
+
+# how often get() stats config.ini for an edit, at most
+CHECK_INTERVAL = 1.0
+
+
+class Settings(NamedTuple):
+    """Everything the proxy, pipeline and sender read from config.ini, parsed once"""
+    path: str
+    mtime_ns: int = 0   # 0 when the file could not be read
+
+    # [CREDENTIALS], the host/URL lists may be separated by commas or newlines
+    target_hosts: tuple = ()
+    monitored_urls: tuple = ()
+    margin_url: str = ""
+    server_url: str = ""
+
+    # [DEFAULTS]
+    margin_payload_template: str = ""
+    auto_capture_flag: str = ""
+
+    # [CAPTURE]
+    capture_slots: int = 256
+    capture_level: int = 3
+    capture_store_raw: bool = False
+
+    # [PIPELINE]
+    pipeline_enabled: bool = False
+    pipeline_workers: int = 2
+    pipeline_queue_size: int = 8
+    pipeline_write_files: bool = True
+
+    # [SENDER]
+    sender_gzip: bool = False
+    sender_retries: int = 3
+    sender_timeout: float = 10.0
+    sender_diff: bool = False
+    sender_keyframe_interval: float = 300.0
+    sender_diff_abs_threshold: float = 0.0
+    sender_diff_rel_threshold: float = 0.0
+    sender_spool: bool = False
+    sender_spool_max_mb: int = 256
+    sender_batch_records: int = 500
+    sender_batch_kb: int = 1024
+    sender_max_kbps: float = 0.0
+    sender_spool_compression: str = "zstd"
+
+    # [METRICS]
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 0
+    metrics_dump_interval: float = 0.0
+
+    # [LOGGING]
+    log_level: str = "INFO"
+
+    # [SUPERVISOR], mcx_supervisor.py only
+    supervisor_parser_processes: int = 0
+    supervisor_write_files: bool = True
+    supervisor_restart_delay: float = 1.0
+    supervisor_restart_max_delay: float = 30.0
+
+    # [KEEPALIVE], client/keepalive.py
+    keepalive_url: str = ""
+    keepalive_proxy: str = ""
+    keepalive_verify: object = True   # bool, or the path of a CA bundle
+    keepalive_interval: float = 600.0
+    keepalive_min_interval: float = 60.0
+    keepalive_max_interval: float = 1200.0
+    refresher_period: float = 300.0
+    prewarm_lead: float = 15.0
+    prewarm_fetch: bool = True
+
+    # [REFRESH], client/refresh_scheduler.py
+    refresh_proxy: str = ""
+    refresh_verify: object = True
+    refresh_min_interval: float = 10.0
+    refresh_max_interval: float = 1800.0
+    refresh_session_interval: float = 60.0
+    refresh_off_session_interval: float = 1800.0
+    refresh_target_change: float = 0.005
+    refresh_sessions: str = "09:00-23:55"
+    refresh_days: str = "MON,TUE,WED,THU,FRI"
+
+    @property
+    def sender_options(self) -> tuple:
+        """SERVER_URL and [SENDER]: a MarginPublisher built from different values needs rebuilding"""
+        return (self.server_url, self.sender_gzip, self.sender_retries, self.sender_timeout, self.sender_diff,
+                self.sender_keyframe_interval, self.sender_diff_abs_threshold, self.sender_diff_rel_threshold,
+                self.sender_spool, self.sender_spool_max_mb, self.sender_batch_records, self.sender_batch_kb,
+                self.sender_max_kbps, self.sender_spool_compression)
+
+
+def read_settings(path: str) -> Settings:
+    """
+    Parse config.ini at path into Settings.
+
+    A missing file gives the defaults with mtime_ns = 0. Values are read raw
+    (no % interpolation), the payload template and URLs are taken as they are.
+    """
+    config = configparser.RawConfigParser()
+    try:
+        st = os.stat(path)
+    except OSError:
+        return Settings(path)
+    config.read(path, encoding="utf-8")
+
+    return Settings(
+        path=path,
+        mtime_ns=st.st_mtime_ns,
+        target_hosts=tuple(split_list(config.get("CREDENTIALS", "TARGET_HOST", fallback=""))),
+        monitored_urls=tuple(split_list(config.get("CREDENTIALS", "MONITORED_URL", fallback=""))),
+        margin_url=config.get("CREDENTIALS", "MARGIN_URL", fallback=""),
+        server_url=config.get("CREDENTIALS", "SERVER_URL", fallback=""),
+        margin_payload_template=config.get("DEFAULTS", "DEFAULT_MARGIN_PAYLOAD_TEMPLATE", fallback=""),
+        auto_capture_flag=config.get("DEFAULTS", "AUTO_CAPTURE_FLAG", fallback=""),
+        capture_slots=config.getint("CAPTURE", "SLOTS", fallback=256),
+        capture_level=config.getint("CAPTURE", "COMPRESSION_LEVEL", fallback=3),
+        capture_store_raw=config.getboolean("CAPTURE", "STORE_RAW", fallback=False),
+        pipeline_enabled=config.getboolean("PIPELINE", "ENABLED", fallback=False),
+        pipeline_workers=config.getint("PIPELINE", "WORKERS", fallback=2),
+        pipeline_queue_size=config.getint("PIPELINE", "QUEUE_SIZE", fallback=8),
+        pipeline_write_files=config.getboolean("PIPELINE", "WRITE_FILES", fallback=True),
+        sender_gzip=config.getboolean("SENDER", "GZIP", fallback=False),
+        sender_retries=config.getint("SENDER", "RETRIES", fallback=3),
+        sender_timeout=config.getfloat("SENDER", "TIMEOUT", fallback=10),
+        sender_diff=config.getboolean("SENDER", "DIFF", fallback=False),
+        sender_keyframe_interval=config.getfloat("SENDER", "KEYFRAME_INTERVAL", fallback=300),
+        sender_diff_abs_threshold=config.getfloat("SENDER", "DIFF_ABS_THRESHOLD", fallback=0),
+        sender_diff_rel_threshold=config.getfloat("SENDER", "DIFF_REL_THRESHOLD", fallback=0),
+        sender_spool=config.getboolean("SENDER", "SPOOL", fallback=False),
+        sender_spool_max_mb=config.getint("SENDER", "SPOOL_MAX_MB", fallback=256),
+        sender_batch_records=config.getint("SENDER", "BATCH_RECORDS", fallback=500),
+        sender_batch_kb=config.getint("SENDER", "BATCH_KB", fallback=1024),
+        sender_max_kbps=config.getfloat("SENDER", "MAX_KBPS", fallback=0),
+        sender_spool_compression=config.get("SENDER", "SPOOL_COMPRESSION", fallback="zstd").strip().lower(),
+        metrics_host=config.get("METRICS", "HOST", fallback="127.0.0.1"),
+        metrics_port=config.getint("METRICS", "PORT", fallback=0),
+        metrics_dump_interval=config.getfloat("METRICS", "DUMP_INTERVAL", fallback=0),
+        log_level=config.get("LOGGING", "LEVEL", fallback="INFO"),
+        supervisor_parser_processes=config.getint("SUPERVISOR", "PARSER_PROCESSES", fallback=0),
+        supervisor_write_files=config.getboolean("SUPERVISOR", "WRITE_FILES", fallback=True),
+        supervisor_restart_delay=config.getfloat("SUPERVISOR", "RESTART_DELAY", fallback=1),
+        supervisor_restart_max_delay=config.getfloat("SUPERVISOR", "RESTART_MAX_DELAY", fallback=30),
+        keepalive_url=config.get("KEEPALIVE", "URL", fallback=""),
+        keepalive_proxy=config.get("KEEPALIVE", "PROXY", fallback=""),
+        keepalive_verify=_bool_or_path(config.get("KEEPALIVE", "VERIFY", fallback="true")),
+        keepalive_interval=config.getfloat("KEEPALIVE", "INTERVAL", fallback=600),
+        keepalive_min_interval=config.getfloat("KEEPALIVE", "MIN_INTERVAL", fallback=60),
+        keepalive_max_interval=config.getfloat("KEEPALIVE", "MAX_INTERVAL", fallback=1200),
+        refresher_period=config.getfloat("KEEPALIVE", "REFRESHER_PERIOD", fallback=300),
+        prewarm_lead=config.getfloat("KEEPALIVE", "PREWARM_LEAD", fallback=15),
+        prewarm_fetch=config.getboolean("KEEPALIVE", "PREWARM_FETCH", fallback=True),
+        refresh_proxy=config.get("REFRESH", "PROXY", fallback=""),
+        refresh_verify=_bool_or_path(config.get("REFRESH", "VERIFY", fallback="true")),
+        refresh_min_interval=config.getfloat("REFRESH", "MIN_INTERVAL", fallback=10),
+        refresh_max_interval=config.getfloat("REFRESH", "MAX_INTERVAL", fallback=1800),
+        refresh_session_interval=config.getfloat("REFRESH", "SESSION_INTERVAL", fallback=60),
+        refresh_off_session_interval=config.getfloat("REFRESH", "OFF_SESSION_INTERVAL", fallback=1800),
+        refresh_target_change=config.getfloat("REFRESH", "TARGET_CHANGE", fallback=0.005),
+        refresh_sessions=config.get("REFRESH", "SESSIONS", fallback="09:00-23:55"),
+        refresh_days=config.get("REFRESH", "DAYS", fallback="MON,TUE,WED,THU,FRI"),
+    )
+
+
+def _bool_or_path(value: str):
+    """'true'/'false' (and the other configparser booleans) -> bool, anything else is kept as a path"""
+    lowered = value.strip().lower()
+    if lowered in configparser.RawConfigParser.BOOLEAN_STATES:
+        return configparser.RawConfigParser.BOOLEAN_STATES[lowered]
+    return value.strip()
+
+
+class SettingsFile:
+    """
+    config.ini as a Settings object that follows edits to the file.
+
+    Nothing is read until the first get(). After that get() returns the same
+    object until the file's mtime changes; the mtime is checked at most
+    every `check_interval` seconds, so calling it from a hook costs a clock
+    read. A file that fails to parse is logged and the previous Settings
+    are kept. Callers see a reload as get() returning a different object.
+    """
+
+    def __init__(self, path: str, check_interval: float = CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.reloads = 0
+
+        self._lock = threading.Lock()
+        self._settings = None
+        self._next_check = 0.0
+
+    def get(self) -> Settings:
+        settings = self._settings
+        if settings is not None and time.monotonic() < self._next_check:
+            return settings
+        return self.reload()
+
+    def reload(self) -> Settings:
+        """Stat the file now and parse it again if it changed"""
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            current = self._settings
+            try:
+                mtime_ns = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime_ns = 0
+            if current is not None and current.mtime_ns == mtime_ns:
+                return current
+
+            try:
+                settings = read_settings(self.path)
+            except (configparser.Error, ValueError) as e:
+                if current is None:
+                    raise
+                log.error(f"[Settings] {self.path} not reloaded, keeping the previous settings: {e}")
+                # don't retry until the file changes again
+                self._settings = current._replace(mtime_ns=mtime_ns)
+                return self._settings
+
+            if current is not None:
+                self.reloads += 1
+                log.info(f"[Settings] reloaded {self.path}")
+            self._settings = settings
+            return settings
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def open_settings(path: str, check_interval: float = CHECK_INTERVAL) -> SettingsFile:
+    """The SettingsFile for path, shared by everything in the process that reads it"""
+    path = os.path.normpath(os.path.abspath(path))
+    with _files_lock:
+        settings_file = _files.get(path)
+        if settings_file is None:
+            settings_file = _files[path] = SettingsFile(path, check_interval)
+        return settings_file
@@ -0,0 +1,78 @@
+import re
+from urllib.parse import unquote_plus
+
+COOKIE_NAMES = ("AlteonP", "JSESSIONID", "TS01d67e35", "TS254a1510027")
+
+# Compiled once and run directly on the body bytes, so no text decode (and
+# no multi-megabyte str copy) is needed. re.search stops at the first hit,
+# which on RSK335 pages is near the top of the document.
+REQUEST_TOKEN_RE = {
+    # form fields, e.g. "...&IXHRts=1759482906778&rndaak=5Hg1x...&..."
+    "IXHRts": re.compile(rb"(?<![^&])IXHRts=([^&]+)"),
+    "rndaak": re.compile(rb"(?<![^&])rndaak=([^&]+)"),
+}
+RESPONSE_TOKEN_RE = {
+    # embedded in the html, e.g. "IXHRts#1759482906778" or "rndaak=5Hg1x...<"
+    "IXHRts": re.compile(rb"IXHRts[#*=](\d+)"),
+    "rndaak": re.compile(rb"rndaak[#*=]([^<]+)"),
+}
+# the page carries both tokens in neighbouring hidden inputs, so once IXHRts
+# is found rndaak is looked for within this many bytes of it before the
+# whole body is scanned a second time
+TOKEN_WINDOW = 4096
+
+
+def parse_cookie_header(header: str) -> dict:
+    """Split a Cookie header into {name: value} for the tracked cookies"""
+    cookies = {}
+    if not header:
+        return cookies
+
+    for pair in header.split(";"):
+        name, sep, value = pair.strip().partition("=")
+        if sep and name in COOKIE_NAMES:
+            cookies[name] = value
+    return cookies
+
+
+def parse_set_cookie_headers(headers) -> dict:
+    """Collect the tracked cookies from a list of Set-Cookie headers"""
+    cookies = {}
+    for header in headers:
+        # only the first pair is the cookie, the rest are attributes (Path, Secure, ...)
+        name, sep, value = header.split(";", 1)[0].strip().partition("=")
+        if sep and name in COOKIE_NAMES:
+            cookies[name] = value
+    return cookies
+
+
+def extract_request_tokens(body: bytes) -> dict:
+    """Find IXHRts and rndaak among the form fields of a request body"""
+    tokens = {}
+    if not body:
+        return tokens
+
+    for name, pattern in REQUEST_TOKEN_RE.items():
+        m = pattern.search(body)
+        if m:
+            tokens[name] = unquote_plus(m.group(1).decode("utf-8", "replace"))
+    return tokens
+
+
+def extract_response_tokens(body: bytes) -> dict:
+    """Find IXHRts and rndaak in a response body without decoding it to text"""
+    tokens = {}
+    if not body:
+        return tokens
+
+    m = RESPONSE_TOKEN_RE["IXHRts"].search(body)
+    if m:
+        tokens["IXHRts"] = m.group(1).decode("utf-8", "replace").strip()
+        near = RESPONSE_TOKEN_RE["rndaak"].search(body, max(m.start() - TOKEN_WINDOW, 0), m.end() + TOKEN_WINDOW)
+    else:
+        near = None
+    # on a big page with the tokens at the end this saves a second pass over the whole body
+    m = near or RESPONSE_TOKEN_RE["rndaak"].search(body)
+    if m:
+        tokens["rndaak"] = m.group(1).decode("utf-8", "replace").strip()
+    return tokens
@@ -0,0 +1,16 @@
+@echo off
+echo Activating Virtual Environment...
+
+:: Use 'call' to execute the activate script and return control to the batch file.
+call ".\.venv\Scripts\activate.bat"
+
+if errorlevel 1 (
+    echo ERROR: Could not activate virtual environment. Exiting.
+    pause
+    goto :eof
+)
+
+echo Virtual environment activated successfully.
+
+:: Proxy, parser and sender in one process (instead of the three windows of start-proxy.bat)
+python .\mcx_supervisor.py -p 8080